@@ -0,0 +1,168 @@
+"""
+Per-segment acoustic features, computed from the decoded 16 kHz channel arrays while
+they are still in memory after transcription.
+
+Everything runs on strided frame views of the whole channel instead of per-sample loops:
+frame energy every 10 ms, YIN pitch every 20 ms (FFT autocorrelation over blocks of
+frames), then per-segment aggregates over the frames each segment covers.
+"""
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SAMPLE_RATE = 16000
+# 25 ms energy frames every 10 ms
+FRAME_SAMPLES = 400
+HOP_SAMPLES = 160
+# YIN integration window and pitch hop (20 ms)
+PITCH_WINDOW = 512
+PITCH_HOP = 320
+PITCH_MIN_HZ = 60.0
+PITCH_MAX_HZ = 400.0
+YIN_THRESHOLD = 0.15
+# Frames whose best normalized difference stays above this are unvoiced
+YIN_VOICED_MAX = 0.35
+# Pitch frames per FFT batch; bounds the temporary arrays for hour-long channels
+PITCH_BLOCK_FRAMES = 2048
+# Frames quieter than this (dBFS) count as silence
+SILENCE_DB = float(os.getenv("ACOUSTIC_SILENCE_DB", "-40"))
+
+# Stored with raw and analyzed segments
+ACOUSTIC_FIELDS = ("rms_db", "pitch_mean", "pitch_std", "speaking_rate", "silence_ratio", "overlap_ratio")
+
+TURKISH_VOWELS = frozenset("aeıioöuüâîû")
+
+
+def frame_view(audio, frame: int, hop: int):
+    """(frames, frame) strided view over audio; no samples are copied."""
+    if len(audio) < frame:
+        audio = np.pad(audio, (0, frame - len(audio)))
+    return sliding_window_view(audio, frame)[::hop]
+
+
+def frame_energy_db(audio):
+    """Mean-square energy in dBFS of every 25 ms frame, one per 10 ms."""
+    frames = frame_view(audio, FRAME_SAMPLES, HOP_SAMPLES)
+    energy = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / FRAME_SAMPLES
+    return 10.0 * np.log10(energy + 1e-10)
+
+
+def yin_pitch(audio, sample_rate: int = SAMPLE_RATE, fmin: float = PITCH_MIN_HZ, fmax: float = PITCH_MAX_HZ):
+    """
+    Fundamental frequency (Hz) every PITCH_HOP samples with YIN, NaN where unvoiced or silent.
+    The difference function of a whole block of frames is computed at once from an FFT
+    cross-correlation and prefix sums of the squared samples.
+    """
+    tau_min = int(sample_rate / fmax)
+    tau_max = int(sample_rate / fmin)
+    length = PITCH_WINDOW + tau_max
+    frames = frame_view(audio, length, PITCH_HOP)
+    pitch = np.full(len(frames), np.nan, dtype=np.float32)
+
+    # Silent frames are skipped before the FFTs
+    head_energy = np.einsum("ij,ij->i", frames[:, :PITCH_WINDOW], frames[:, :PITCH_WINDOW], dtype=np.float64)
+    candidates = np.flatnonzero(10.0 * np.log10(head_energy / PITCH_WINDOW + 1e-10) > SILENCE_DB)
+    if not len(candidates):
+        return pitch
+
+    nfft = 1 << (length - 1).bit_length()
+    taus = np.arange(tau_max + 1)
+    for start in range(0, len(candidates), PITCH_BLOCK_FRAMES):
+        rows = candidates[start:start + PITCH_BLOCK_FRAMES]
+        block = frames[rows].astype(np.float64)
+
+        # r(tau) = sum_j x[j] x[j + tau] over the window, for all frames and lags
+        correlation = np.fft.irfft(
+            np.conj(np.fft.rfft(block[:, :PITCH_WINDOW], nfft)) * np.fft.rfft(block, nfft), nfft
+        )[:, :tau_max + 1]
+        squares = np.zeros((len(block), length + 1))
+        np.cumsum(block ** 2, axis=1, out=squares[:, 1:])
+        energy_tau = squares[:, taus + PITCH_WINDOW] - squares[:, taus]
+        difference = squares[:, PITCH_WINDOW][:, None] + energy_tau - 2.0 * correlation
+        difference[:, 0] = 0.0
+
+        # Cumulative mean normalized difference
+        normalized = np.ones_like(difference)
+        cumulative = np.cumsum(difference[:, 1:], axis=1)
+        normalized[:, 1:] = difference[:, 1:] * taus[1:] / np.maximum(cumulative, 1e-12)
+        search = normalized[:, tau_min:tau_max]
+
+        # First dip below the threshold, down to its minimum; frames without one take the global minimum
+        below = search < YIN_THRESHOLD
+        lags = np.arange(search.shape[1])
+        first = np.where(below.any(axis=1), below.argmax(axis=1), search.shape[1])
+        after = lags >= first[:, None]
+        left_dip = np.cumsum(after & ~below, axis=1) > 0
+        dip = np.where(after & below & ~left_dip, search, np.inf)
+        best = np.where(below.any(axis=1), dip.argmin(axis=1), search.argmin(axis=1))
+        index = np.arange(len(block))
+        voiced = search[index, best] < YIN_VOICED_MAX
+
+        # Parabolic interpolation around the chosen lag
+        tau = best + tau_min
+        left = normalized[index, np.maximum(tau - 1, 1)]
+        center = normalized[index, tau]
+        right = normalized[index, np.minimum(tau + 1, tau_max)]
+        curvature = left - 2.0 * center + right
+        shift = np.where(curvature > 0, 0.5 * (left - right) / np.where(curvature > 0, curvature, 1.0), 0.0)
+        frequency = sample_rate / (tau + np.clip(shift, -1.0, 1.0))
+        pitch[rows[voiced]] = frequency[voiced]
+    return pitch
+
+
+def _syllables(text: str):
+    # Every Turkish syllable has exactly one vowel
+    return sum(1 for c in text.lower() if c in TURKISH_VOWELS)
+
+
+def _speaking_rate(segment):
+    """Syllables per second between the first and last word (segment bounds without word timestamps)."""
+    words = segment.get("words") or []
+    if words:
+        text = "".join(w[2] for w in words)
+        seconds = words[-1][1] - words[0][0]
+    else:
+        text = segment.get("text", "")
+        seconds = segment["end"] - segment["start"]
+    if seconds <= 0:
+        return None
+    return round(_syllables(text) / seconds, 2)
+
+
+def add_acoustic_features(segments, channels, offset: float = 0.0):
+    """
+    Sets ACOUSTIC_FIELDS on each segment dict in place. channels are the decoded arrays the
+    segments were transcribed from and offset is the recording time of their first sample.
+    overlap_ratio (share of the segment where another channel is also active) is None for mono.
+    """
+    energy = [frame_energy_db(audio) for audio in channels]
+    active = [e > SILENCE_DB for e in energy]
+    pitch = [yin_pitch(audio) for audio in channels]
+
+    for segment in segments:
+        channel = segment.get("channel") or 0
+        if channel >= len(channels):
+            channel = 0
+        start = max(segment["start"] - offset, 0.0)
+        end = max(segment["end"] - offset, start)
+        a, b = int(start * SAMPLE_RATE / HOP_SAMPLES), int(np.ceil(end * SAMPLE_RATE / HOP_SAMPLES))
+        b = min(b, len(energy[channel]))
+        features = dict.fromkeys(ACOUSTIC_FIELDS)
+        features["speaking_rate"] = _speaking_rate(segment)
+        if b > a:
+            frames = energy[channel][a:b]
+            speaking = active[channel][a:b]
+            features["rms_db"] = round(float(10.0 * np.log10(np.mean(10.0 ** (frames / 10.0)))), 2)
+            features["silence_ratio"] = round(float(1.0 - speaking.mean()), 3)
+            others = [active[i][a:b] for i in range(len(channels)) if i != channel]
+            if others:
+                features["overlap_ratio"] = round(float((speaking & np.logical_or.reduce(others)).mean()), 3)
+
+            voiced = pitch[channel][int(start * SAMPLE_RATE / PITCH_HOP):int(np.ceil(end * SAMPLE_RATE / PITCH_HOP))]
+            voiced = voiced[~np.isnan(voiced)]
+            if len(voiced) >= 3:
+                features["pitch_mean"] = round(float(voiced.mean()), 1)
+                features["pitch_std"] = round(float(voiced.std()), 1)
+        segment.update(features)
+    return segments
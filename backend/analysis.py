@@ -1,241 +1,977 @@
 import os
 import json
-from openai import OpenAI
+import zlib
+import asyncio
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-from faster_whisper import WhisperModel
 import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import av
 import numpy as np
-import wave
 import math
+from types import SimpleNamespace
 
-MODEL_SIZE = "large-v3"
-device = "cuda" if os.getenv("USE_GPU") == "true" else "cpu"
+from model_registry import registry, DEFAULT_MODEL_SIZE, DEFAULT_COMPUTE_TYPE
+from transcript_cache import transcript_cache, chunk_checkpoints, cache_key, file_sha256
+from rate_limit import rate_limiter
+import telemetry
+import local_sentiment
+from acoustics import add_acoustic_features, ACOUSTIC_FIELDS
+import media
+import prepass
 
-print(f"Loading model: {MODEL_SIZE} ({device})...")
-model = WhisperModel(MODEL_SIZE, device=device, compute_type="float16" if device == "cuda" else "int8")
-print("Model loaded successfully.")
+logger = logging.getLogger(__name__)
 
-def split_channels(file_path):
+# faster-whisper expects 16 kHz mono float32 input
+SAMPLE_RATE = 16000
+# Recordings longer than this are decoded and transcribed in chunks to bound memory
+LONG_AUDIO_SECONDS = float(os.getenv("LONG_AUDIO_SECONDS", "1800"))
+CHUNK_SECONDS = float(os.getenv("TRANSCRIBE_CHUNK_SECONDS", "600"))
+# Chunks end at a pause found by VAD in their last CHUNK_SEARCH_SECONDS; without one the cut is
+# hard and the next chunk repeats CHUNK_OVERLAP_SECONDS of audio, de-duplicated by word timestamps
+CHUNK_SEARCH_SECONDS = float(os.getenv("TRANSCRIBE_CHUNK_SEARCH_SECONDS", "30"))
+CHUNK_OVERLAP_SECONDS = float(os.getenv("TRANSCRIBE_CHUNK_OVERLAP_SECONDS", "2"))
+CHUNK_MIN_SILENCE_MS = int(os.getenv("TRANSCRIBE_CHUNK_MIN_SILENCE_MS", "300"))
+# Chunks of a long recording transcribed at the same time (each uses one model worker per channel)
+PARALLEL_CHUNKS = int(os.getenv("TRANSCRIBE_PARALLEL_CHUNKS", "1"))
+# Channels decoded concurrently (CTranslate2 num_workers) and intra-op threads per channel (cpu_threads).
+# The defaults split the machine's cores evenly between the Customer and Agent channels.
+PARALLEL_CHANNELS = int(os.getenv("WHISPER_PARALLEL_CHANNELS", "2"))
+CPU_THREADS_PER_CHANNEL = int(os.getenv(
+    "WHISPER_CPU_THREADS_PER_CHANNEL", str(max(1, (os.cpu_count() or 2) // max(1, PARALLEL_CHANNELS)))
+))
+# Per-segment energy, pitch, speaking rate, silence and talk-over computed from the decoded audio
+ACOUSTIC_FEATURES = os.getenv("ACOUSTIC_FEATURES", "true") == "true"
+# > 0 decodes the VAD speech chunks of a channel in batches with faster-whisper's BatchedInferencePipeline
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "0"))
+
+# Cascade: a fast draft model transcribes everything, the requested model (large-v3 by default)
+# re-decodes only the draft segments below CASCADE_MIN_CONFIDENCE or above CASCADE_MAX_COMPRESSION_RATIO
+CASCADE = os.getenv("WHISPER_CASCADE", "false") == "true"
+CASCADE_DRAFT_MODEL = os.getenv("CASCADE_DRAFT_MODEL", "small")
+CASCADE_DRAFT_COMPUTE_TYPE = os.getenv("CASCADE_DRAFT_COMPUTE_TYPE", "int8")
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.6"))
+# Whisper's own threshold for repetitive (hallucinated) output
+CASCADE_MAX_COMPRESSION_RATIO = float(os.getenv("CASCADE_MAX_COMPRESSION_RATIO", "2.4"))
+# Flagged segments closer than this are re-decoded as one span; spans get CASCADE_PAD_SECONDS of context
+CASCADE_MERGE_GAP_SECONDS = float(os.getenv("CASCADE_MERGE_GAP_SECONDS", "1.0"))
+CASCADE_PAD_SECONDS = float(os.getenv("CASCADE_PAD_SECONDS", "0.5"))
+
+# Whisper decode options; part of the transcription cache key, so every change invalidates cached results
+DECODE_OPTIONS = dict(
+    beam_size=5,
+    language="tr",
+    condition_on_previous_text=False,
+    vad_filter=True,
+    vad_parameters=dict(min_silence_duration_ms=500),
+    word_timestamps=True
+)
+
+def transcription_params(model_size: str = None, compute_type: str = None, batch_size: int = None,
+                         cascade: bool = None, speech_prepass: bool = None):
+    """Everything besides the audio bytes that determines the transcript (used as cache key input)."""
+    params = {
+        "model_size": model_size or DEFAULT_MODEL_SIZE,
+        "compute_type": compute_type or DEFAULT_COMPUTE_TYPE,
+        "decode": DECODE_OPTIONS,
+        "long_audio_seconds": LONG_AUDIO_SECONDS,
+        "chunk_seconds": CHUNK_SECONDS,
+        "chunk_search_seconds": CHUNK_SEARCH_SECONDS,
+        "chunk_overlap_seconds": CHUNK_OVERLAP_SECONDS,
+        "chunk_min_silence_ms": CHUNK_MIN_SILENCE_MS,
+        "acoustic_features": ACOUSTIC_FEATURES,
+        # Bump when the shape of the cached result changes
+        "result_version": 3,
+    }
+    # Batched decoding segments the audio differently; only part of the key when enabled
+    batch_size = WHISPER_BATCH_SIZE if batch_size is None else batch_size
+    if batch_size:
+        params["batch_size"] = batch_size
+    if CASCADE if cascade is None else cascade:
+        params["cascade"] = {
+            "draft_model": CASCADE_DRAFT_MODEL,
+            "draft_compute_type": CASCADE_DRAFT_COMPUTE_TYPE,
+            "min_confidence": CASCADE_MIN_CONFIDENCE,
+            "max_compression_ratio": CASCADE_MAX_COMPRESSION_RATIO,
+            "merge_gap_seconds": CASCADE_MERGE_GAP_SECONDS,
+            "pad_seconds": CASCADE_PAD_SECONDS,
+        }
+    if prepass.PREPASS if speech_prepass is None else speech_prepass:
+        params["prepass"] = {
+            "silence_db": prepass.PREPASS_SILENCE_DB,
+            "max_flatness": prepass.PREPASS_MAX_FLATNESS,
+            "min_modulation_db": prepass.PREPASS_MIN_MODULATION_DB,
+            "min_gap_seconds": prepass.PREPASS_MIN_GAP_SECONDS,
+            "pad_seconds": prepass.PREPASS_PAD_SECONDS,
+        }
+    return params
+
+def transcription_cache_key(file_path: str, model_size: str = None, compute_type: str = None, batch_size: int = None,
+                            cascade: bool = None, speech_prepass: bool = None, file_hash: str = None):
+    # file_hash: the stored SHA-256 of the upload (Recording.file_hash), saves reading the file
+    return cache_key(file_hash or file_sha256(file_path),
+                     transcription_params(model_size, compute_type, batch_size, cascade, speech_prepass))
+
+def _timed(iterable, total):
+    """Iterates, adding the time spent inside the iterator itself to total[0]."""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            total[0] += time.perf_counter() - started
+        yield item
+
+def _iter_decoded_blocks(container, stream):
     """
-    Decodes audio using PyAV, checks for stereo, and splits into mono WAV files if needed.
-    Returns a list of temporary filenames (or just the original if mono).
+    Decodes the audio stream once, resampling straight to 16 kHz planar float32.
+    Yields arrays of shape (channels, samples). Decode and resample time are recorded as spans.
     """
+    # fltp keeps channels planar so to_ndarray returns (channels, samples) instead of packed data
+    resampler = av.AudioResampler(format='fltp', layout=stream.layout, rate=SAMPLE_RATE)
+    decode_time, resample_time = [0.0], [0.0]
     try:
-        container = av.open(file_path)
-        stream = container.streams.audio[0]
-        channels = stream.channels
-        
-        if channels == 1:
-            container.close()
-            return [file_path]
-            
-        print(f"Detected {channels} channels. Splitting...")
-        
-        # Use AudioResampler to force conversion to planar format (s16p)
-        # This ensures to_ndarray returns shape (channels, samples) instead of (1, samples*channels) (packed)
-        # We preserve the rate and layout (implied)
-        resampler = av.AudioResampler(format='s16p')
-        
-        audio_data = []
-        
-        # Helper to process frames
-        def process_frame(frame):
-            # Resample returns a list of frames (usually 1, potentially 0 or more)
-            resampled_frames = resampler.resample(frame)
-            for rf in resampled_frames:
-                arr = rf.to_ndarray()
-                audio_data.append(arr)
-
-        for frame in container.decode(audio=0):
-            process_frame(frame)
-            
+        for frame in _timed(container.decode(stream), decode_time):
+            started = time.perf_counter()
+            blocks = [rf.to_ndarray() for rf in resampler.resample(frame)]
+            resample_time[0] += time.perf_counter() - started
+            yield from blocks
         # Flush resampler
-        process_frame(None)
+        for rf in resampler.resample(None):
+            yield rf.to_ndarray()
+    finally:
+        telemetry.observe("decode", decode_time[0])
+        telemetry.observe("resample", resample_time[0])
 
-        container.close()
-        
-        if not audio_data:
-            print("No audio data decoded.")
-            return [file_path]
-            
-        # Concatenate all frames: shape (channels, total_samples)
-        full_audio = np.concatenate(audio_data, axis=1)
-        print(f"Full audio shape: {full_audio.shape}")
-        
-        output_files = []
-        sample_rate = stream.rate
-        
-        # Save each channel as a separate WAV
-        for i in range(channels):
-            if i >= full_audio.shape[0]:
-                print(f"Warning: Channel {i} out of bounds for audio shape {full_audio.shape}")
-                break
-                
-            channel_data = full_audio[i, :]
-            
-            out_name = f"{file_path}_ch{i}.wav"
-            with wave.open(out_name, 'wb') as wav_file:
-                wav_file.setnchannels(1)
-                wav_file.setsampwidth(2) # 16 bit
-                wav_file.setframerate(sample_rate)
-                # Data is already s16p (int16), just ensure correct type for safety
-                if channel_data.dtype != np.int16:
-                   channel_data = channel_data.astype(np.int16)
-                         
-                wav_file.writeframes(channel_data.tobytes())
-            
-            output_files.append(out_name)
-            
-        return output_files
-        
+def probe_duration(file_path):
+    """Returns the container duration in seconds without decoding, or None if unknown."""
+    try:
+        with av.open(file_path) as container:
+            stream = container.streams.audio[0]
+            if stream.duration is not None and stream.time_base is not None:
+                return float(stream.duration * stream.time_base)
+            if container.duration is not None:
+                return container.duration / av.time_base
     except Exception as e:
-        print(f"Error splitting channels: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.warning("Error probing duration of %s: %s", file_path, e)
+    return None
+
+def split_channels(file_path):
+    """
+    Decodes audio once using PyAV and resamples each channel to 16 kHz float32 mono.
+    Returns a list of NumPy arrays (one per channel) that can be passed directly to
+    faster-whisper, or [file_path] if the file could not be decoded here.
+    """
+    try:
+        with av.open(file_path) as container:
+            stream = container.streams.audio[0]
+            channels = stream.channels
+            if channels > 1:
+                logger.debug("Detected %d channels, splitting", channels)
+
+            audio_data = [[] for _ in range(channels)]
+            for block in _iter_decoded_blocks(container, stream):
+                for i in range(min(channels, block.shape[0])):
+                    audio_data[i].append(block[i])
+
+        if not audio_data or not audio_data[0]:
+            logger.warning("No audio data decoded from %s", file_path)
+            return [file_path]
+
+        # Concatenate per channel so only one channel-sized copy exists at a time
+        output = [np.concatenate(blocks) for blocks in audio_data]
+        logger.debug("Decoded %d channel(s), %.1fs each", len(output), output[0].shape[0] / SAMPLE_RATE)
+        return output
+
+    except Exception:
+        logger.exception("Error splitting channels of %s", file_path)
         # Fallback to original
         return [file_path]
 
-def transcribe_audio(file_path: str):
+def find_silence_cut(channels, start: int, end: int, min_silence_ms: int = CHUNK_MIN_SILENCE_MS):
     """
-    Transcribes audio using local Faster Whisper model.
-    Handles stereo/multi-channel audio by splitting using PyAV.
-    Returns duration, full text, and segments.
+    Sample index in the middle of the latest pause between start and end that VAD finds
+    in every channel, or None if someone is speaking throughout.
     """
-    try:
-        print(f"Starting transcription for: {file_path}")
-        channel_files = split_channels(file_path)
-        is_stereo = len(channel_files) > 1
-        print(f"Split result: {len(channel_files)} files. Is Stereo: {is_stereo}")
-        
-        all_segments = []
-        full_text_parts = []
-        detected_language = "unknown"
-        duration = 0.0
-        
-        for i, source_file in enumerate(channel_files):
-            print(f"Processing channel {i}: {source_file}")
-            try:
-                print(f"Transcribing channel {i}...")
-                segments, info = model.transcribe(
-                    source_file, 
-                    beam_size=5, 
-                    language="tr",
-                    condition_on_previous_text=False,
-                    vad_filter=True,
-                    vad_parameters=dict(min_silence_duration_ms=500),
-                    word_timestamps=True
-                )
-                print(f"Transcription finished for channel {i}")
-                
-                if i == 0:
-                    detected_language = info.language
-                    duration = info.duration # Approx duration
-                    print(f"Detected language: {detected_language}, Duration: {duration}")
-                
-                segment_count = 0
-                for segment in segments:
-                    segment_count += 1
-                    confidence = math.exp(segment.avg_logprob) if segment.avg_logprob is not None else 0.0
-                    
-                    speaker_label = "Unknown"
-                    if is_stereo:
-                        if i == 0: speaker_label = "Customer"
-                        elif i == 1: speaker_label = "Agent"
-                        else: speaker_label = f"Channel {i}"
-                    
-                    all_segments.append({
-                        "start": round(segment.start, 2),
-                        "end": round(segment.end, 2),
-                        "text": segment.text.strip(),
-                        "speaker": speaker_label,
-                        "confidence": round(confidence, 2),
-                        "no_speech_prob": round(segment.no_speech_prob, 4) if hasattr(segment, 'no_speech_prob') else 0.0
-                    })
-                print(f"Channel {i} segments processed: {segment_count}")
-
-            finally:
-                # Cleanup temp files if they are distinct from original
-                if source_file != file_path and os.path.exists(source_file):
-                    print(f"Removing temp file: {source_file}")
-                    os.remove(source_file)
-        
-        # Sort and merge
-        all_segments.sort(key=lambda x: x["start"])
-        full_text_parts = [s["text"] for s in all_segments]
-        
-        print(f"Total segments collected: {len(all_segments)}")
-        return {
-            "duration": round(duration, 2),
-            "text": " ".join(full_text_parts),
-            "segments": all_segments,
-            "language": detected_language
-        }
-        
-    except Exception as e:
-        print(f"Error in transcription loop: {e}")
-        import traceback
-        traceback.print_exc()
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+    options = VadOptions(min_silence_duration_ms=min_silence_ms, speech_pad_ms=100)
+    speech = sorted(
+        (start + ts["start"], start + ts["end"])
+        for audio in channels
+        for ts in get_speech_timestamps(audio[start:end], options)
+    )
+    gaps, cursor = [], start
+    for speech_start, speech_end in speech:
+        if speech_start > cursor:
+            gaps.append((cursor, speech_start))
+        cursor = max(cursor, speech_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    min_samples = min_silence_ms * SAMPLE_RATE // 1000
+    gaps = [(a, b) for a, b in gaps if b - a >= min_samples]
+    if not gaps:
         return None
+    gap_start, gap_end = gaps[-1]
+    return (gap_start + gap_end) // 2
 
-def analyze_transcript(whisper_segments):
+def iter_channel_chunks(file_path, chunk_seconds: float = CHUNK_SECONDS, search_seconds: float = 0.0,
+                        overlap_seconds: float = 0.0):
     """
-    Analyzes transcript segments using GPT-5-Nano for sentiment and diarization.
+    Bounded-memory variant of split_channels for hour-long recordings.
+    Yields (offset_seconds, [channel arrays]) for consecutive windows of at most chunk_seconds,
+    holding at most one chunk of decoded audio in memory.
+    With search_seconds each window ends at a pause within its last search_seconds (see
+    find_silence_cut); where there is none, the next window starts overlap_seconds early.
+    """
+    chunk_samples = int(chunk_seconds * SAMPLE_RATE)
+    search_samples = min(int(search_seconds * SAMPLE_RATE), chunk_samples // 2)
+    overlap_samples = min(int(overlap_seconds * SAMPLE_RATE), chunk_samples // 2)
+    with av.open(file_path) as container:
+        stream = container.streams.audio[0]
+        channels = stream.channels
+        buffered = [[] for _ in range(channels)]
+        buffered_samples = 0
+        offset_samples = 0
+
+        for block in _iter_decoded_blocks(container, stream):
+            for i in range(channels):
+                buffered[i].append(block[i])
+            buffered_samples += block.shape[1]
+
+            while buffered_samples >= chunk_samples:
+                joined = [np.concatenate(parts) for parts in buffered]
+                cut = find_silence_cut(joined, chunk_samples - search_samples, chunk_samples) if search_samples else None
+                if cut is None:
+                    cut, next_start = chunk_samples, chunk_samples - overlap_samples
+                else:
+                    next_start = cut
+                yield offset_samples / SAMPLE_RATE, [ch[:cut] for ch in joined]
+                buffered = [[ch[next_start:]] for ch in joined]
+                buffered_samples -= next_start
+                offset_samples += next_start
+
+        if buffered_samples > 0:
+            yield offset_samples / SAMPLE_RATE, [np.concatenate(parts) for parts in buffered]
+
+def _speaker_label(channel_index, is_stereo):
+    if not is_stereo:
+        return "Unknown"
+    if channel_index == 0:
+        return "Customer"
+    if channel_index == 1:
+        return "Agent"
+    return f"Channel {channel_index}"
+
+class TranscriptionCancelled(Exception):
+    """Raised inside transcribe_audio when its cancel_event is set."""
+
+def _transcribe_channel(model, audio, channel_index, is_stereo, offset=0.0, progress_callback=None,
+                        segment_callback=None, cancel_event=None, batch_size=0, escalation=None, skipped=None):
+    """
+    Runs Whisper on one channel (array or file path) and returns (segment dicts, info).
+    Segment times are shifted by offset seconds (used for chunked transcription).
+    segment_callback is called with each segment dict as soon as Whisper yields it.
+    With batch_size the speech chunks found by VAD are decoded batch_size at a time.
+    escalation (cascade mode, arrays only) is (get_model, escalated): model is the draft,
+    the spans escalation_spans() finds are re-decoded with get_model() and their
+    (start, end) appended to escalated; segments reach segment_callback once spliced.
+    With skipped (a list; arrays only) the speech pre-pass runs first: only the channel's
+    speech regions are decoded and the seconds cut are appended to skipped.
+    """
+    if skipped is not None and isinstance(audio, np.ndarray):
+        with telemetry.span("prepass", channel=channel_index):
+            regions = prepass.speech_regions(audio)
+        kept = sum(end - start for start, end in regions)
+        skipped.append((len(audio) - kept) / SAMPLE_RATE)
+        info = SimpleNamespace(language=None, duration=len(audio) / SAMPLE_RATE)
+        if not regions:
+            logger.debug("Channel %d has no speech, not decoded", channel_index)
+            if progress_callback:
+                progress_callback(1.0)
+            return [], info
+        if kept < len(audio):
+            joined, offsets = prepass.join_regions(audio, regions)
+
+            def restore(segment):
+                # Called once per final segment, so times are moved exactly once
+                offsets.restore(segment, offset)
+                if segment_callback:
+                    segment_callback(segment)
+            segments, joined_info = _transcribe_channel(model, joined, channel_index, is_stereo, 0.0, progress_callback,
+                                                        restore, cancel_event, batch_size, escalation)
+            return segments, SimpleNamespace(language=joined_info.language, duration=info.duration)
+
+    if escalation is not None and isinstance(audio, np.ndarray):
+        segments, info = _transcribe_channel(model, audio, channel_index, is_stereo, offset, progress_callback,
+                                             None, cancel_event, batch_size)
+        segments = _escalate_channel(escalation[0], audio, segments, channel_index, is_stereo, offset,
+                                     cancel_event, escalation[1])
+        if segment_callback:
+            for segment in segments:
+                segment_callback(segment)
+        return segments, info
+
+    # faster-whisper runs VAD and feature extraction up front, before it returns the lazy segment generator
+    with telemetry.span("vad", channel=channel_index):
+        if batch_size:
+            from faster_whisper import BatchedInferencePipeline
+            segments, info = BatchedInferencePipeline(model=model).transcribe(audio, batch_size=batch_size, **DECODE_OPTIONS)
+        else:
+            segments, info = model.transcribe(audio, **DECODE_OPTIONS)
+
+    results = []
+    inference_time = [0.0]
+    try:
+        results = _collect_segments(
+            _timed(segments, inference_time), info, channel_index, is_stereo, offset,
+            progress_callback, segment_callback, cancel_event
+        )
+    finally:
+        telemetry.observe("inference", inference_time[0], channel=channel_index)
+    logger.debug("Channel %d segments processed: %d", channel_index, len(results))
+    return results, info
+
+def _collect_segments(segments, info, channel_index, is_stereo, offset, progress_callback, segment_callback, cancel_event):
+    results = []
+    for segment in segments:
+        # faster-whisper decodes lazily: leaving the loop stops the decode
+        if cancel_event is not None and cancel_event.is_set():
+            raise TranscriptionCancelled()
+        confidence = math.exp(segment.avg_logprob) if segment.avg_logprob is not None else 0.0
+        if progress_callback and info.duration:
+            progress_callback(min(segment.end / info.duration, 1.0))
+
+        results.append({
+            "start": round(segment.start + offset, 2),
+            "end": round(segment.end + offset, 2),
+            "text": segment.text.strip(),
+            "speaker": _speaker_label(channel_index, is_stereo),
+            "channel": channel_index,
+            "confidence": round(confidence, 2),
+            "no_speech_prob": round(segment.no_speech_prob, 4) if hasattr(segment, 'no_speech_prob') else 0.0,
+            "words": [
+                [round(w.start + offset, 2), round(w.end + offset, 2), w.word, round(w.probability, 3)]
+                for w in (getattr(segment, "words", None) or [])
+            ]
+        })
+        if segment_callback:
+            segment_callback(results[-1])
+    return results
+
+def compression_ratio(text: str):
+    """gzip compression ratio of a segment's text, as Whisper computes it; high for repetitive output."""
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+def escalation_spans(segments, min_confidence: float = None, max_compression_ratio: float = None,
+                     merge_gap: float = None):
+    """
+    (start, end) time ranges of one channel's draft segments that need the larger model:
+    confidence below min_confidence or compression ratio above max_compression_ratio.
+    Flagged segments less than merge_gap seconds apart form one range.
+    """
+    min_confidence = CASCADE_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    max_compression_ratio = CASCADE_MAX_COMPRESSION_RATIO if max_compression_ratio is None else max_compression_ratio
+    merge_gap = CASCADE_MERGE_GAP_SECONDS if merge_gap is None else merge_gap
+    spans = []
+    for segment in sorted(segments, key=lambda s: s["start"]):
+        if segment["confidence"] >= min_confidence and compression_ratio(segment["text"]) <= max_compression_ratio:
+            continue
+        if spans and segment["start"] - spans[-1][1] <= merge_gap:
+            spans[-1][1] = max(spans[-1][1], segment["end"])
+        else:
+            spans.append([segment["start"], segment["end"]])
+    return [tuple(span) for span in spans]
+
+def _escalate_channel(get_model, audio, segments, channel_index, is_stereo, offset, cancel_event, escalated):
+    """
+    Re-decodes the escalation spans of one channel's draft segments with get_model() and
+    splices the result in. Each span is decoded with CASCADE_PAD_SECONDS of context on both
+    sides; its words are kept up to the neighbouring draft segments, like chunk stitching.
+    """
+    spans = escalation_spans(segments)
+    if not spans:
+        return segments
+    model = get_model()
+    pad = CASCADE_PAD_SECONDS
+    audio_end = offset + len(audio) / SAMPLE_RATE
+    result = list(segments)
+    middle = lambda s: (s["start"] + s["end"]) / 2
+    with telemetry.span("escalate", channel=channel_index, spans=len(spans)):
+        for start, end in spans:
+            if cancel_event is not None and cancel_event.is_set():
+                raise TranscriptionCancelled()
+            kept = [s for s in result if not start <= middle(s) <= end]
+            keep_from = max([start - pad] + [s["end"] for s in kept if middle(s) < start])
+            keep_until = min([end + pad] + [s["start"] for s in kept if middle(s) > end])
+            window_start, window_end = max(offset, start - pad), min(audio_end, end + pad)
+            window = audio[int((window_start - offset) * SAMPLE_RATE):int((window_end - offset) * SAMPLE_RATE)]
+            decoded, info = model.transcribe(window, **DECODE_OPTIONS)
+            redecoded = _collect_segments(decoded, info, channel_index, is_stereo, window_start, None, None, cancel_event)
+            result = merge_channel_segments(kept + stitch_chunk_segments(redecoded, keep_from, keep_until))
+            escalated.append((window_start, window_end))
+    return result
+
+def stitch_chunk_segments(segments, keep_from: float, keep_until: float):
+    """
+    Keeps the part of a chunk's segments between keep_from and keep_until (seconds).
+    Audio shared by overlapping chunks is transcribed twice; each word belongs to the chunk
+    holding its midpoint, and segments cut by the boundary are rebuilt from their kept words.
+    """
+    kept = []
+    for segment in segments:
+        words = segment.get("words") or []
+        if not words:
+            if keep_from <= (segment["start"] + segment["end"]) / 2 < keep_until:
+                kept.append(segment)
+            continue
+        inside = [w for w in words if keep_from <= (w[0] + w[1]) / 2 < keep_until]
+        if len(inside) == len(words):
+            kept.append(segment)
+        elif inside:
+            kept.append(dict(
+                segment, start=inside[0][0], end=inside[-1][1],
+                text="".join(w[2] for w in inside).strip(), words=inside
+            ))
+    return kept
+
+def merge_channel_segments(segments):
+    """Orders the segments of all channels into one timeline; channel breaks ties so equal start times always order the same way."""
+    return sorted(segments, key=lambda x: (x["start"], x["channel"], x["end"]))
+
+def transcribe_audio(file_path: str, progress_callback=None, model_size: str = None, compute_type: str = None,
+                     parallel_channels: int = None, cpu_threads: int = None, use_cache: bool = True,
+                     segment_callback=None, cancel_event=None, batch_size: int = None, cascade: bool = None,
+                     speech_prepass: bool = None, file_hash: str = None):
+    """
+    Transcribes audio using local Faster Whisper model.
+    Results are cached by audio hash and decode parameters, so repeated requests for the
+    same audio return without running Whisper again.
+    Audio is decoded once into per-channel 16 kHz arrays which are passed to Whisper
+    directly (no temporary WAV files). Recordings longer than LONG_AUDIO_SECONDS are cut
+    at pauses into chunks that are transcribed TRANSCRIBE_PARALLEL_CHUNKS at a time and
+    checkpointed, so a failed or interrupted run resumes after the last finished chunk.
+    Stereo channels are transcribed concurrently, each with its own CPU thread budget.
+    model_size / compute_type select the Whisper model (defaults from model_registry).
+    progress_callback, if given, is called with the overall progress (0.0 - 1.0).
+    segment_callback, if given, receives each segment as it is decoded (from the channel threads;
+    for chunked recordings once its chunk is finished).
+    Setting cancel_event stops the decode and raises TranscriptionCancelled.
+    batch_size > 0 uses batched decoding (default WHISPER_BATCH_SIZE).
+    cascade (default WHISPER_CASCADE) transcribes with CASCADE_DRAFT_MODEL first and re-decodes
+    only its low-confidence spans with the requested model; the result then also has a
+    "cascade" entry with the escalated share of the audio.
+    speech_prepass (default SPEECH_PREPASS) cuts silence, noise and hold music before Whisper
+    and skips channels without speech (see prepass.py); skipped_seconds in the result sums
+    the audio cut over all channels.
+    file_hash, the SHA-256 of the file when already known, keys the cache without rehashing.
+    Returns duration, full text, and segments.
     """
-    system_prompt = """
+    parallel_channels = max(1, parallel_channels or PARALLEL_CHANNELS)
+    cpu_threads = cpu_threads or CPU_THREADS_PER_CHANNEL
+    batch_size = WHISPER_BATCH_SIZE if batch_size is None else batch_size
+    cascade = CASCADE if cascade is None else cascade
+    speech_prepass = prepass.PREPASS if speech_prepass is None else speech_prepass
+    model_name = model_size or DEFAULT_MODEL_SIZE
+    if cascade:
+        model_name = f"{CASCADE_DRAFT_MODEL}+{model_name}"
+    with telemetry.span_context(model=model_name):
+        try:
+            logger.info("Starting transcription for: %s", file_path)
+            started = time.perf_counter()
+            key = None
+            if use_cache and transcript_cache.enabled:
+                key = transcription_cache_key(file_path, model_size, compute_type, batch_size, cascade, speech_prepass, file_hash)
+                cached = transcript_cache.get(key)
+                telemetry.CACHE_LOOKUPS.labels(result="miss" if cached is None else "hit").inc()
+                if cached is not None:
+                    logger.info("Transcription cache hit for: %s", file_path)
+                    if progress_callback:
+                        progress_callback(1.0)
+                    if segment_callback:
+                        for segment in cached["segments"]:
+                            segment_callback(segment)
+                    return cached
+
+            parallel_chunks = max(1, PARALLEL_CHUNKS)
+            get_model = lambda: registry.get(model_size, compute_type, cpu_threads=cpu_threads,
+                                             num_workers=parallel_channels * parallel_chunks)
+            if cascade:
+                # The requested model is only loaded once a span needs it
+                model = registry.get(CASCADE_DRAFT_MODEL, CASCADE_DRAFT_COMPUTE_TYPE, cpu_threads=cpu_threads,
+                                     num_workers=parallel_channels * parallel_chunks)
+            else:
+                model = get_model()
+
+            total = probe_duration(file_path)
+            telemetry.bind(audio_duration=round(total, 2) if total else None)
+            chunked = bool(total and total > LONG_AUDIO_SECONDS)
+            if chunked:
+                logger.info("Long recording (%.0fs), transcribing in chunks of up to %.0fs", total, CHUNK_SECONDS)
+                chunks = iter_channel_chunks(file_path, CHUNK_SECONDS, CHUNK_SEARCH_SECONDS, CHUNK_OVERLAP_SECONDS)
+                # Finished chunks are checkpointed under the cache key, so a retried job resumes after them
+                run_key = key or transcription_cache_key(file_path, model_size, compute_type, batch_size, cascade, speech_prepass,
+                                                         file_hash)
+            else:
+                chunks = [(0.0, split_channels(file_path))]
+
+            # Waveform peaks for the report view, built from the same decoded audio (once per audio file)
+            peaks = None if os.path.exists(media.peaks_path(file_path)) else media.PeakBuilder()
+            chunk_results = []
+            # Seconds transcribed per chunk, for the overall progress
+            seconds_done = {}
+            progress_lock = threading.Lock()
+
+            def report_done(index, seconds):
+                with progress_lock:
+                    seconds_done[index] = seconds
+                    done = sum(seconds_done.values())
+                progress_callback(min(done / total, 1.0))
+
+            def finish(chunk):
+                result = chunk["result"]
+                if result is None:
+                    segments, infos = [], []
+                    # Collect in channel order so the result does not depend on which thread finishes first
+                    for future in chunk["futures"]:
+                        channel_segments, info = future.result()
+                        segments.extend(channel_segments)
+                        infos.append(info)
+                    result = {
+                        "offset": chunk["offset"],
+                        "duration": chunk["offset"] + infos[0].duration,
+                        # Channels skipped by the pre-pass have no language
+                        "language": next((info.language for info in infos if info.language), "unknown"),
+                        "segments": segments,
+                    }
+                    if chunked:
+                        result["segments"] = stitch_chunk_segments(segments, chunk["keep_from"], chunk["keep_until"])
+                    if speech_prepass:
+                        result["skipped_seconds"] = round(sum(chunk["skipped"]), 2)
+                    if cascade:
+                        result["escalated_seconds"] = round(sum(end - start for start, end in chunk["escalated"]), 2)
+                    channels = chunk.pop("channels")
+                    # The decoded audio is still in memory here; it is dropped with the chunk afterwards
+                    if ACOUSTIC_FEATURES and isinstance(channels[0], np.ndarray):
+                        with telemetry.span("acoustics", segments=len(result["segments"])):
+                            add_acoustic_features(result["segments"], channels, chunk["offset"])
+                    if chunked:
+                        chunk_checkpoints.put(run_key, chunk["index"], result)
+                if chunked and segment_callback:
+                    for segment in result["segments"]:
+                        segment_callback(segment)
+                chunk_results.append(result)
+
+            pending = deque()
+            channel_count = 1
+            with ThreadPoolExecutor(max_workers=parallel_channels * parallel_chunks) as pool:
+                for index, (offset, channels) in enumerate(chunks):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise TranscriptionCancelled()
+                    if peaks is not None and isinstance(channels[0], np.ndarray):
+                        peaks.add(channels, int(round(offset * SAMPLE_RATE)))
+                    is_stereo = len(channels) > 1
+                    channel_count = len(channels)
+                    # Seconds covered by this chunk, for mapping per-channel progress onto the whole file
+                    span = len(channels[0]) / SAMPLE_RATE if isinstance(channels[0], np.ndarray) else None
+                    chunk = {"index": index, "offset": offset, "end": offset + (span or 0.0),
+                             "keep_from": 0.0, "keep_until": math.inf, "result": None, "futures": [],
+                             "channels": channels, "escalated": [], "skipped": []}
+                    if pending:
+                        # Words in the audio shared with the previous chunk go to the one holding their midpoint
+                        boundary = round((offset + pending[-1]["end"]) / 2, 3)
+                        pending[-1]["keep_until"] = chunk["keep_from"] = boundary
+                    # At most parallel_chunks chunks are decoding (and held in memory) at once
+                    while len(pending) >= parallel_chunks:
+                        finish(pending.popleft())
+
+                    checkpoint = chunk_checkpoints.get(run_key, index) if chunked else None
+                    if checkpoint is not None and checkpoint["offset"] == offset:
+                        logger.info("Chunk %d at %.0fs restored from checkpoint", index, offset)
+                        chunk["result"] = checkpoint
+                        if progress_callback and total and span:
+                            report_done(index, span)
+                        pending.append(chunk)
+                        continue
+
+                    channel_progress = [0.0] * len(channels)
+
+                    def report(p, i, index=index, span=span, channel_progress=channel_progress):
+                        channel_progress[i] = p
+                        done = sum(channel_progress) / len(channel_progress)
+                        if total and span:
+                            report_done(index, span * done)
+                        else:
+                            progress_callback(done)
+
+                    logger.debug("Transcribing %d channel(s) at %.0fs", len(channels), offset)
+                    # Pool threads do not inherit context variables; copy them so spans keep their attributes
+                    chunk["futures"] = [
+                        pool.submit(
+                            contextvars.copy_context().run, _transcribe_channel, model, audio, i, is_stereo, offset,
+                            (lambda p, i=i: report(p, i)) if progress_callback else None,
+                            # Chunked segments are passed on once stitched, in finish()
+                            None if chunked else segment_callback, cancel_event, batch_size,
+                            (get_model, chunk["escalated"]) if cascade else None,
+                            chunk["skipped"] if speech_prepass else None
+                        )
+                        for i, audio in enumerate(channels)
+                    ]
+                    pending.append(chunk)
+                while pending:
+                    finish(pending.popleft())
+
+            if chunked:
+                chunk_checkpoints.clear(run_key)
+            if peaks is not None:
+                with telemetry.span("peaks"):
+                    media.save_peaks(file_path, peaks.finish())
+            detected_language = chunk_results[0]["language"] if chunk_results else "unknown"
+            logger.debug("Detected language: %s", detected_language)
+            duration = max((r["duration"] for r in chunk_results), default=0.0)
+            all_segments = merge_channel_segments([s for r in chunk_results for s in r["segments"]])
+            full_text_parts = [s["text"] for s in all_segments]
+
+            elapsed = time.perf_counter() - started
+            telemetry.observe("transcribe", elapsed)
+            if duration > 0:
+                telemetry.REALTIME_FACTOR.labels(model=model_name).observe(elapsed / duration)
+            logger.info("Transcribed %s: %d segment(s), %.1fs of audio in %.1fs",
+                        file_path, len(all_segments), duration, elapsed)
+            result = {
+                "duration": round(duration, 2),
+                "text": " ".join(full_text_parts),
+                "segments": all_segments,
+                "language": detected_language
+            }
+            if speech_prepass:
+                result["skipped_seconds"] = round(sum(r.get("skipped_seconds", 0.0) for r in chunk_results), 2)
+                logger.info("Speech pre-pass skipped %.1fs of %.1fs audio", result["skipped_seconds"],
+                            duration * channel_count)
+            if cascade:
+                # Share of the audio (all channels) the requested model decoded again
+                escalated = sum(r.get("escalated_seconds", 0.0) for r in chunk_results)
+                fraction = escalated / (duration * channel_count) if duration else 0.0
+                telemetry.CASCADE_ESCALATED_FRACTION.observe(fraction)
+                logger.info("Cascade escalated %.1fs of %.1fs audio (%.1f%%) to %s",
+                            escalated, duration * channel_count, fraction * 100, model_size or DEFAULT_MODEL_SIZE)
+                result["cascade"] = {
+                    "draft_model": CASCADE_DRAFT_MODEL,
+                    "model": model_size or DEFAULT_MODEL_SIZE,
+                    "escalated_seconds": round(escalated, 2),
+                    "escalated_fraction": round(fraction, 4),
+                }
+            if key:
+                transcript_cache.put(key, result)
+            return result
+
+        except TranscriptionCancelled:
+            logger.info("Transcription cancelled: %s", file_path)
+            raise
+        except Exception:
+            logger.exception("Error in transcription loop for %s", file_path)
+            return None
+
+LLM_MODEL = os.getenv("OPENAI_MODEL", "gpt-5-nano")
+# Approximate prompt tokens of transcript per request; longer calls are split into windows
+LLM_WINDOW_TOKENS = int(os.getenv("LLM_WINDOW_TOKENS", "3000"))
+# Segments repeated at the start of the next window so speaker/sentiment keep their context
+LLM_WINDOW_OVERLAP = int(os.getenv("LLM_WINDOW_OVERLAP", "3"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Budget shared by every process calling the LLM (0 = unlimited), e.g. the provider's account limits
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+# llm, local (ONNX classifier + channel speakers) or hybrid (local first, LLM for unsure segments and mono calls)
+ANALYZER_BACKEND = os.getenv("ANALYZER_BACKEND", "llm")
+LOCAL_SENTIMENT_MIN_CONFIDENCE = float(os.getenv("LOCAL_SENTIMENT_MIN_CONFIDENCE", "0.6"))
+
+ANALYSIS_SYSTEM_PROMPT = """
     You are an expert conversation analyst. 
-    I will provide you with a transcript of a call between an Agent and a Customer.
-    The transcript is a list of segments with start and end times.
+    I will provide you with part of a transcript of a call between an Agent and a Customer.
+    The transcript is a list of segments, each with an id, start and end times and text.
     
     Your task is to:
     1. Infer who is speaking (Agent or Customer) for each segment based on context.
     2. Analyze the sentiment score of each segment (0.0 to 1.0, where 0 is negative, 1 is positive).
-    3. Calculate the overall average sentiment of the call.
     
-    Return the output strictly as a JSON object with the following structure:
+    Return the output strictly as a JSON object with one entry per input segment:
     {
-        "average_sentiment": float,
         "segments": [
             {
+                "id": int,
                 "speaker": "Agent" or "Customer",
-                "text": "segment text",
-                "start_time": float,
-                "end_time": float,
                 "sentiment_score": float
             }
         ]
     }
     """
-    
-    # Prepare segments for GPT context
+
+def _segment_field(s, name):
+    return s[name] if isinstance(s, dict) else getattr(s, name)
+
+def estimate_tokens(text: str):
+    """Cheap token estimate (~3 characters per token for Turkish text, plus JSON overhead per segment)."""
+    return len(text) // 3 + 12
+
+def chunk_segments(segments, max_tokens: int = None, overlap: int = None):
+    """
+    Splits segments into windows of roughly max_tokens each.
+    Consecutive windows share `overlap` segments. Returns lists of segment indices.
+    """
+    max_tokens = max_tokens or LLM_WINDOW_TOKENS
+    overlap = LLM_WINDOW_OVERLAP if overlap is None else overlap
+    costs = [estimate_tokens(_segment_field(s, "text")) for s in segments]
+
+    windows = []
+    start = 0
+    while start < len(segments):
+        end = start
+        used = 0
+        # Always take at least one segment, even if it alone exceeds the budget
+        while end < len(segments) and (end == start or used + costs[end] <= max_tokens):
+            used += costs[end]
+            end += 1
+        windows.append(list(range(start, end)))
+        if end >= len(segments):
+            break
+        # Step back for overlap, but always make progress
+        start = max(end - overlap, start + 1)
+    return windows
+
+def _merge_windows(segments, windows, window_results):
+    """
+    Combines per-window results into one entry per segment, keyed by the original segment
+    times. A segment covered by several windows takes the result from the window where it
+    sits furthest from an edge, i.e. where the model saw the most context around it.
+    """
+    merged = []
+    for index, segment in enumerate(segments):
+        best, best_margin = None, -1
+        for window, results in zip(windows, window_results):
+            if results is None or index not in results:
+                continue
+            position = window.index(index)
+            margin = min(position, len(window) - 1 - position)
+            if margin > best_margin:
+                best, best_margin = results[index], margin
+        merged.append(best)
+    return merged
+
+def duration_weighted_average(segments):
+    """Average sentiment weighted by segment duration (plain mean if durations are all zero)."""
+    scored = [s for s in segments if s.get("sentiment_score") is not None]
+    if not scored:
+        return 0.0
+    weights = [max(s["end_time"] - s["start_time"], 0.0) for s in scored]
+    total = sum(weights)
+    if total <= 0:
+        return sum(s["sentiment_score"] for s in scored) / len(scored)
+    return sum(s["sentiment_score"] * w for s, w in zip(scored, weights)) / total
+
+def _reserve_llm_capacity(tokens: int):
+    """Books one request and `tokens` tokens with the shared rate limiter; returns the delay in seconds."""
+    return max(
+        rate_limiter.reserve("llm_requests", 1, LLM_REQUESTS_PER_MINUTE),
+        rate_limiter.reserve("llm_tokens", tokens, LLM_TOKENS_PER_MINUTE),
+    )
+
+async def _analyze_window(client, semaphore, segments, window):
+    """Sends one window to the LLM. Returns {segment index: result} or None if every attempt failed."""
     segments_context = json.dumps([{
-        "text": s['text'] if isinstance(s, dict) else s.text,
-        "start": s['start'] if isinstance(s, dict) else s.start,
-        "end": s['end'] if isinstance(s, dict) else s.end
-    } for s in whisper_segments], ensure_ascii=False)
+        "id": i,
+        "text": _segment_field(segments[i], "text"),
+        "start": _segment_field(segments[i], "start"),
+        "end": _segment_field(segments[i], "end")
+    } for i in window], ensure_ascii=False)
+    # Prompt plus roughly 15 output tokens per segment
+    window_tokens = estimate_tokens(ANALYSIS_SYSTEM_PROMPT + segments_context) + 15 * len(window)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            if LLM_REQUESTS_PER_MINUTE > 0 or LLM_TOKENS_PER_MINUTE > 0:
+                delay = await asyncio.to_thread(_reserve_llm_capacity, window_tokens)
+                if delay:
+                    await asyncio.sleep(delay)
+            async with semaphore:
+                with telemetry.span("llm_call", model=LLM_MODEL, segments=len(window)):
+                    response = await client.chat.completions.create(
+                        model=LLM_MODEL,
+                        response_format={"type": "json_object"},
+                        messages=[
+                            {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                            {"role": "user", "content": f"Here are the transcript segments:\n{segments_context}"}
+                        ]
+                    )
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                telemetry.LLM_TOKENS.labels(type="prompt").observe(usage.prompt_tokens or 0)
+                telemetry.LLM_TOKENS.labels(type="completion").observe(usage.completion_tokens or 0)
+            result_json = response.choices[0].message.content
+            logger.debug("LLM response sample: %.100s", result_json)
+            results = {}
+            with telemetry.span("json_parse", model=LLM_MODEL, segments=len(window)):
+                for item in json.loads(result_json)["segments"]:
+                    if item.get("id") in window:
+                        results[item["id"]] = {
+                            "speaker": item.get("speaker", "Unknown"),
+                            "sentiment_score": float(item.get("sentiment_score", 0.5))
+                        }
+            return results
+        except Exception as e:
+            logger.warning("Error in LLM analysis (window %d-%d, attempt %d): %s", window[0], window[-1], attempt + 1, e)
+            if attempt < LLM_MAX_RETRIES:
+                await asyncio.sleep(2 ** attempt)
+    return None
 
+async def _llm_segment_results(segments, client=None):
+    """
+    LLM results ({speaker, sentiment_score}) per segment, None for segments whose window failed,
+    or None if every window failed.
+    """
+    owns_client = client is None
+    if owns_client:
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     try:
-        response = client.chat.completions.create(
-            model="gpt-5-nano",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Here are the transcript segments:\n{segments_context}"}
-            ]
+        windows = chunk_segments(segments)
+        semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        logger.info("Analyzing %d segments in %d window(s)", len(segments), len(windows))
+        window_results = await asyncio.gather(*[
+            _analyze_window(client, semaphore, segments, window) for window in windows
+        ])
+    finally:
+        if owns_client:
+            await client.close()
+
+    if all(results is None for results in window_results):
+        return None
+    return _merge_windows(segments, windows, window_results)
+
+def _channel_speaker(segment):
+    """Speaker label Whisper derived from the channel ("Unknown" for mono recordings)."""
+    return segment.get("speaker", "Unknown") if isinstance(segment, dict) else "Unknown"
+
+def _analyzed_segment(segment, speaker, sentiment_score):
+    analyzed = {
+        "speaker": speaker,
+        "text": _segment_field(segment, "text"),
+        "start_time": _segment_field(segment, "start"),
+        "end_time": _segment_field(segment, "end"),
+        "sentiment_score": sentiment_score
+    }
+    # Whisper metadata is carried through so it is stored with the analyzed segment
+    if isinstance(segment, dict):
+        for key in ("channel", "confidence", "no_speech_prob", "words") + ACOUSTIC_FIELDS:
+            if key in segment:
+                analyzed[key] = segment[key]
+    return analyzed
+
+def _analysis_result(analyzed):
+    # Segments without a score (failed LLM window) do not count towards the average
+    average = duration_weighted_average(analyzed)
+    for item in analyzed:
+        if item["sentiment_score"] is None:
+            item["sentiment_score"] = 0.5
+    analyzed.sort(key=lambda x: (x["start_time"], x["end_time"]))
+    return {"average_sentiment": round(average, 4), "segments": analyzed}
+
+async def analyze_transcript_async(whisper_segments, client=None):
+    """
+    Analyzes transcript segments using GPT-5-Nano for sentiment and diarization.
+    Long transcripts are split into overlapping token-budgeted windows that are sent
+    concurrently (at most LLM_MAX_CONCURRENCY in flight). A failed window only loses
+    its own segments, which fall back to the Whisper speaker label and a neutral score.
+    """
+    segments = list(whisper_segments)
+    if not segments:
+        return {"average_sentiment": 0.0, "segments": []}
+
+    results = await _llm_segment_results(segments, client)
+    if results is None:
+        return None
+    return _analysis_result([
+        _analyzed_segment(
+            segment,
+            result["speaker"] if result else _channel_speaker(segment),
+            result["sentiment_score"] if result else None
         )
-        
-        result_json = response.choices[0].message.content
-        print(f"DEBUG: GPT Response Sample: {result_json[:100]}")
-        analysis_data = json.loads(result_json)
-        
-        return analysis_data
-        
-    except Exception as e:
-        print(f"Error in GPT analysis: {e}")
+        for segment, result in zip(segments, results)
+    ])
+
+async def analyze_transcript_local_async(whisper_segments, client=None):
+    """
+    Local backend: speakers come from the channels and sentiment from the ONNX classifier
+    in local_sentiment, without any network call. Mono recordings keep "Unknown" speakers.
+    """
+    segments = list(whisper_segments)
+    if not segments:
+        return {"average_sentiment": 0.0, "segments": []}
+    scores = await asyncio.to_thread(local_sentiment.classify, [_segment_field(s, "text") for s in segments])
+    return _analysis_result([
+        _analyzed_segment(segment, _channel_speaker(segment), score)
+        for segment, (score, confidence) in zip(segments, scores)
+    ])
+
+async def analyze_transcript_hybrid_async(whisper_segments, client=None):
+    """
+    Hybrid backend: stereo recordings are scored locally with the channel speakers, and only
+    segments the classifier is unsure about (LOCAL_SENTIMENT_MIN_CONFIDENCE) go to the LLM.
+    Mono recordings have no channel speakers, so the LLM analyzes them in full.
+    """
+    segments = list(whisper_segments)
+    if not segments:
+        return {"average_sentiment": 0.0, "segments": []}
+    if any(_channel_speaker(s) == "Unknown" for s in segments):
+        return await analyze_transcript_async(segments, client=client)
+
+    scores = await asyncio.to_thread(local_sentiment.classify, [_segment_field(s, "text") for s in segments])
+    unsure = [i for i, (score, confidence) in enumerate(scores) if confidence < LOCAL_SENTIMENT_MIN_CONFIDENCE]
+    logger.info("Hybrid analysis: %d of %d segment(s) sent to the LLM", len(unsure), len(segments))
+    llm_scores = {}
+    if unsure:
+        results = await _llm_segment_results([segments[i] for i in unsure], client)
+        # A failed LLM call keeps the local scores; the channel speaker is kept either way
+        for i, result in zip(unsure, results or []):
+            if result:
+                llm_scores[i] = result["sentiment_score"]
+    return _analysis_result([
+        _analyzed_segment(segment, _channel_speaker(segment), llm_scores.get(i, score))
+        for i, (segment, (score, confidence)) in enumerate(zip(segments, scores))
+    ])
+
+# Analyzer backends selectable per job or with ANALYZER_BACKEND
+ANALYZERS = {
+    "llm": analyze_transcript_async,
+    "local": analyze_transcript_local_async,
+    "hybrid": analyze_transcript_hybrid_async,
+}
+
+def check_analyzer(backend: str = None):
+    """Raises ValueError when the backend needs the local classifier and SENTIMENT_MODEL is not set."""
+    backend = backend or ANALYZER_BACKEND
+    if backend in ("local", "hybrid") and not local_sentiment.SENTIMENT_MODEL:
+        raise ValueError(f"The {backend} analyzer needs SENTIMENT_MODEL")
+
+def analyze_transcript(whisper_segments, client=None, backend: str = None):
+    """
+    Synchronous entry point for the analyzer backends (used by the job workers).
+    A missing SENTIMENT_MODEL raises ValueError, which fails the job instead of retrying it.
+    """
+    check_analyzer(backend)
+    analyzer = ANALYZERS[backend or ANALYZER_BACKEND]
+    try:
+        return asyncio.run(analyzer(whisper_segments, client=client))
+    except Exception:
+        logger.exception("Error in transcript analysis")
         return None
@@ -0,0 +1,132 @@
+"""
+Accuracy / throughput tradeoff of the two-pass cascade (WHISPER_CASCADE).
+
+Transcribes a set of recordings with the draft model alone, with the final model alone and
+with the cascade at several confidence thresholds, and reports for each configuration the
+wall time, real-time factor (RTF), word error rate (WER) and the share of audio the cascade
+escalated to the final model. The reference transcript of a recording is <name>.txt next
+to it when present; otherwise the final model's own transcript is the reference, so WER
+then measures how far a configuration is from always running the final model.
+
+Real calls are needed: synthetic audio has no words to compare.
+
+Usage (from backend/):
+    python benchmarks/bench_cascade.py calls/*.wav
+    python benchmarks/bench_cascade.py calls/*.wav --draft small --model large-v3 --thresholds 0.5,0.6,0.7,0.8
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis
+from model_registry import registry
+
+
+def words(text: str):
+    return re.findall(r"\w+", text.lower())
+
+
+def word_errors(reference, hypothesis):
+    """Word-level edit distance (substitutions + deletions + insertions)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def transcribe(path, model_size, compute_type, cascade):
+    started = time.perf_counter()
+    result = analysis.transcribe_audio(path, model_size=model_size, compute_type=compute_type,
+                                       use_cache=False, cascade=cascade)
+    if result is None:
+        sys.exit(f"Transcription of {path} failed, see the log above")
+    return result, time.perf_counter() - started
+
+
+def run_config(files, references, model_size, compute_type, cascade, threshold=None):
+    if threshold is not None:
+        analysis.CASCADE_MIN_CONFIDENCE = threshold
+    totals = {"seconds": 0.0, "audio_seconds": 0.0, "errors": 0, "reference_words": 0, "escalated": 0.0}
+    for path in files:
+        result, seconds = transcribe(path, model_size, compute_type, cascade)
+        reference = references[path]
+        totals["seconds"] += seconds
+        totals["audio_seconds"] += result["duration"]
+        totals["errors"] += word_errors(reference, words(result["text"]))
+        totals["reference_words"] += len(reference)
+        if "cascade" in result:
+            totals["escalated"] += result["cascade"]["escalated_fraction"] * result["duration"]
+    audio_seconds = totals["audio_seconds"]
+    return {
+        "seconds": round(totals["seconds"], 2),
+        "rtf": round(totals["seconds"] / audio_seconds, 4) if audio_seconds else None,
+        "wer": round(totals["errors"] / totals["reference_words"], 4) if totals["reference_words"] else None,
+        # Duration-weighted share of the audio re-decoded by the final model
+        "escalated_fraction": round(totals["escalated"] / audio_seconds, 4) if cascade and audio_seconds else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="Recordings to transcribe")
+    parser.add_argument("--draft", default=analysis.CASCADE_DRAFT_MODEL, help="Draft model size")
+    parser.add_argument("--draft-compute-type", default=analysis.CASCADE_DRAFT_COMPUTE_TYPE)
+    parser.add_argument("--model", default="large-v3", help="Final model size")
+    parser.add_argument("--compute-type")
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7", help="CASCADE_MIN_CONFIDENCE values to try")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    analysis.CASCADE_DRAFT_MODEL = args.draft
+    analysis.CASCADE_DRAFT_COMPUTE_TYPE = args.draft_compute_type
+    # Load both models before timing anything
+    registry.get(args.draft, args.draft_compute_type, cpu_threads=analysis.CPU_THREADS_PER_CHANNEL,
+                 num_workers=max(1, analysis.PARALLEL_CHANNELS))
+    registry.get(args.model, args.compute_type, cpu_threads=analysis.CPU_THREADS_PER_CHANNEL,
+                 num_workers=max(1, analysis.PARALLEL_CHANNELS))
+
+    references, final_runs = {}, {}
+    for path in args.files:
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                references[path] = words(f.read())
+        else:
+            result, _ = transcribe(path, args.model, args.compute_type, False)
+            references[path] = words(result["text"])
+            final_runs[path] = result
+    if final_runs:
+        print(f"No reference transcript for {len(final_runs)} file(s): using the {args.model} transcript")
+
+    results = {
+        "files": len(args.files),
+        "draft": f"{args.draft}/{args.draft_compute_type}",
+        "model": args.model,
+        "configs": {
+            f"draft ({args.draft})": run_config(args.files, references, args.draft, args.draft_compute_type, False),
+            f"final ({args.model})": run_config(args.files, references, args.model, args.compute_type, False),
+        },
+    }
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        results["configs"][f"cascade @ {threshold:.2f}"] = run_config(
+            args.files, references, args.model, args.compute_type, True, threshold)
+
+    print(f"{len(args.files)} file(s), draft {results['draft']}, final {args.model}:")
+    for name, r in results["configs"].items():
+        escalated = "" if r["escalated_fraction"] is None else f" | escalated {r['escalated_fraction'] * 100:5.1f}%"
+        print(f"  {name:>18}: {r['seconds']:8.1f}s | RTF {r['rtf']:.3f} | WER {r['wer']:.3f}{escalated}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
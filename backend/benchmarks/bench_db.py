@@ -0,0 +1,244 @@
+"""
+Load benchmark for the SQLite layer: listing, detail lookups and mixed read/write traffic.
+
+Builds a throwaway database with --recordings recordings and --segments transcript
+segments (100k / 10M by default, matching a large call-center archive), then measures:
+  - newest-first listing with OFFSET vs keyset cursor at increasing depths
+  - GET /recordings/{id}-style lookups (recording + segments by recording_id)
+  - concurrent readers while a writer bulk-inserts analyzed segments
+
+Usage (from backend/):
+    python benchmarks/bench_db.py                      # full size, takes a few minutes to build
+    python benchmarks/bench_db.py --scale 0.01         # quick run
+    python benchmarks/bench_db.py --no-pragmas         # compare against default SQLite settings
+"""
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import datetime
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker, joinedload
+
+import database
+import models
+import crud
+from migrations import run_migrations
+
+BATCH = 50000
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"p50_ms": round(pick(0.50) * 1000, 3), "p95_ms": round(pick(0.95) * 1000, 3),
+            "p99_ms": round(pick(0.99) * 1000, 3), "n": len(samples)}
+
+
+def build(engine, recordings, segments):
+    """Fills the database using raw executemany batches (the fastest path SQLite offers)."""
+    base = datetime.datetime(2024, 1, 1)
+    statuses = ["COMPLETED"] * 8 + ["TRANSCRIBED", "UPLOADED"]
+    per_recording = max(1, segments // recordings)
+    started = time.perf_counter()
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        for offset in range(0, recordings, BATCH):
+            rows = [(i + 1, f"call_{i}.wav", base + datetime.timedelta(seconds=30 * i), random.choice(statuses),
+                     None, 180.0, random.random()) for i in range(offset, min(offset + BATCH, recordings))]
+            cur.executemany(
+                "INSERT INTO recordings (id, filename, upload_date, status, transcript_text, duration, average_sentiment) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        raw.commit()
+
+        text = "Merhaba, faturamla ilgili bir sorun yaşıyorum ve yardım almak istiyorum."
+        batch = []
+        for i in range(segments):
+            recording_id = i // per_recording % recordings + 1
+            start = (i % per_recording) * 3.0
+            batch.append((recording_id, "Agent" if i % 2 else "Customer", text, start, start + 3.0, random.random()))
+            if len(batch) >= BATCH:
+                cur.executemany(
+                    "INSERT INTO transcript_segments (recording_id, speaker, text, start_time, end_time, sentiment_score) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            cur.executemany(
+                "INSERT INTO transcript_segments (recording_id, speaker, text, start_time, end_time, sentiment_score) "
+                "VALUES (?, ?, ?, ?, ?, ?)", batch)
+        raw.commit()
+        cur.execute("ANALYZE")
+        raw.commit()
+    finally:
+        raw.close()
+    return time.perf_counter() - started
+
+
+def bench_listing(Session, recordings, page=50, samples=50):
+    results = {}
+    for depth in (0, recordings // 10, recordings // 2, max(0, recordings - page * 2)):
+        db = Session()
+        try:
+            offset_times, keyset_times = [], []
+            # The cursor a client would hold after paging down to this depth
+            anchor = db.query(models.Recording).order_by(
+                models.Recording.upload_date.desc(), models.Recording.id.desc()
+            ).offset(max(depth - 1, 0)).first()
+            cursor = crud.encode_cursor(anchor) if depth else None
+            for _ in range(samples):
+                t = time.perf_counter()
+                crud.list_recordings(db, page, skip=depth)
+                offset_times.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                crud.list_recordings(db, page, cursor=cursor)
+                keyset_times.append(time.perf_counter() - t)
+            results[f"depth_{depth}"] = {"offset": percentiles(offset_times), "keyset": percentiles(keyset_times)}
+        finally:
+            db.close()
+    return results
+
+
+def read_detail(db, recording_id):
+    recording = db.query(models.Recording).options(
+        joinedload(models.Recording.segments)
+    ).filter(models.Recording.id == recording_id).first()
+    return len(recording.segments) if recording else 0
+
+
+def bench_detail(Session, recordings, samples=500):
+    db = Session()
+    try:
+        times = []
+        for _ in range(samples):
+            t = time.perf_counter()
+            read_detail(db, random.randint(1, recordings))
+            times.append(time.perf_counter() - t)
+        return percentiles(times)
+    finally:
+        db.close()
+
+
+def bench_mixed(Session, recordings, readers=8, seconds=10.0, segments_per_write=200):
+    """Readers hammer detail lookups while one writer replaces segment sets like /analyze does."""
+    stop = time.perf_counter() + seconds
+    read_times, write_times, errors = [], [], []
+    lock = threading.Lock()
+
+    def reader():
+        db = Session()
+        local = []
+        try:
+            while time.perf_counter() < stop:
+                t = time.perf_counter()
+                read_detail(db, random.randint(1, recordings))
+                db.rollback()  # End the read transaction so WAL checkpoints can progress
+                local.append(time.perf_counter() - t)
+        except Exception as e:
+            errors.append(str(e))
+        finally:
+            db.close()
+            with lock:
+                read_times.extend(local)
+
+    def writer():
+        db = Session()
+        try:
+            while time.perf_counter() < stop:
+                recording_id = random.randint(1, recordings)
+                segments = [{"speaker": "Agent", "text": "test", "start_time": i * 2.0, "end_time": i * 2.0 + 2,
+                             "sentiment_score": 0.5} for i in range(segments_per_write)]
+                t = time.perf_counter()
+                crud.save_analyzed_segments(db, recording_id, segments)
+                db.commit()
+                write_times.append(time.perf_counter() - t)
+        except Exception as e:
+            errors.append(str(e))
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + [threading.Thread(target=writer)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "readers": readers,
+        "reads_per_second": round(len(read_times) / seconds, 1),
+        "writes_per_second": round(len(write_times) / seconds, 1),
+        "read": percentiles(read_times) if read_times else None,
+        "write": percentiles(write_times) if write_times else None,
+        "errors": errors[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recordings", type=int, default=100_000)
+    parser.add_argument("--segments", type=int, default=10_000_000)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for both sizes")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of the mixed read/write phase")
+    parser.add_argument("--no-pragmas", action="store_true", help="Use default SQLite settings (no WAL, mmap, ...)")
+    parser.add_argument("--db", help="Database file to build (a temporary file by default)")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    recordings = max(1, int(args.recordings * args.scale))
+    segments = max(1, int(args.segments * args.scale))
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    if os.path.exists(path):
+        sys.exit(f"{path} already exists")
+
+    if args.no_pragmas:
+        database.SQLITE_PRAGMAS = {}
+    engine = database.make_engine(f"sqlite:///{path}", pool_size=args.readers + 2)
+    database.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    random.seed(42)
+    print(f"Building {recordings:,} recordings / {segments:,} segments in {path} ...")
+    build_seconds = build(engine, recordings, segments)
+    print(f"  built in {build_seconds:.1f}s ({segments / build_seconds:,.0f} segments/s)")
+
+    results = {
+        "recordings": recordings,
+        "segments": segments,
+        "pragmas": not args.no_pragmas,
+        "build_seconds": round(build_seconds, 1),
+        "listing": bench_listing(Session, recordings),
+        "detail": bench_detail(Session, recordings),
+        "mixed": bench_mixed(Session, recordings, readers=args.readers, seconds=args.seconds),
+    }
+
+    print("Listing (50 per page):")
+    for depth, r in results["listing"].items():
+        print(f"  {depth:>14}: OFFSET p50 {r['offset']['p50_ms']:8.2f} ms | keyset p50 {r['keyset']['p50_ms']:8.2f} ms")
+    d = results["detail"]
+    print(f"Detail lookup: p50 {d['p50_ms']:.2f} ms, p95 {d['p95_ms']:.2f} ms")
+    m = results["mixed"]
+    print(f"Mixed ({m['readers']} readers + 1 writer): {m['reads_per_second']} reads/s, {m['writes_per_second']} writes/s")
+    if m["read"]:
+        print(f"  read p95 {m['read']['p95_ms']:.2f} ms", end="")
+    if m["write"]:
+        print(f", write p95 {m['write']['p95_ms']:.2f} ms", end="")
+    print()
+    if m["errors"]:
+        print(f"  errors: {m['errors']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Throughput and memory of the bulk export (GET /export, export.py) against pulling the same
+data with GET /recordings/{id}, one request per recording.
+
+Builds a throwaway database with --recordings recordings and --segments analyzed segments
+(the synthetic archive of bench_search.py, 20k / 1M by default) and, through the FastAPI
+app in process (no network), measures:
+
+    per_recording   GET /recordings/{id} for --api-recordings recordings, extrapolated rows/s
+    ndjson, arrow, parquet
+                    GET /export of every segment: rows/s, MB/s and output size
+
+then the peak memory of each export format while it streams: Python allocations
+(tracemalloc) plus the pyarrow memory pool. Run it at two --scale values to see that the
+peak does not grow with the result.
+
+Usage (from backend/):
+    python benchmarks/bench_export.py --scale 0.1
+    python benchmarks/bench_export.py --batch-rows 20000 --json export.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+import database
+import export
+from migrations import run_migrations
+from bench_search import build
+
+
+def bench_per_recording(client, recording_ids):
+    started = time.perf_counter()
+    rows = 0
+    for recording_id in recording_ids:
+        response = client.get(f"/recordings/{recording_id}")
+        response.raise_for_status()
+        rows += len(response.json()["segments"])
+    elapsed = time.perf_counter() - started
+    return {"recordings": len(recording_ids), "rows": rows, "seconds": round(elapsed, 2),
+            "rows_per_second": round(rows / elapsed)}
+
+
+def bench_export(client, format, segments):
+    started = time.perf_counter()
+    size = 0
+    with client.stream("GET", "/export", params={"format": format}) as response:
+        response.raise_for_status()
+        for chunk in response.iter_bytes():
+            size += len(chunk)
+    elapsed = time.perf_counter() - started
+    return {"rows": segments, "seconds": round(elapsed, 2), "rows_per_second": round(segments / elapsed),
+            "mb": round(size / 1e6, 1), "mb_per_second": round(size / 1e6 / elapsed, 1)}
+
+
+def peak_memory_mb(Session, format, batch_rows):
+    """Peak Python + pyarrow memory while the export streams into nothing."""
+    pool = None
+    if format != "ndjson":
+        import pyarrow as pa
+        pool = pa.default_memory_pool()
+        pool.release_unused()
+    arrow_before = pool.bytes_allocated() if pool else 0
+    tracemalloc.start()
+    try:
+        for _ in export.export(Session, format, batch_rows=batch_rows):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    arrow_peak = pool.max_memory() - arrow_before if pool else 0
+    return round((peak + arrow_peak) / 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recordings", type=int, default=20_000)
+    parser.add_argument("--segments", type=int, default=1_000_000)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for both sizes")
+    parser.add_argument("--api-recordings", type=int, default=500, help="Recordings fetched one by one")
+    parser.add_argument("--batch-rows", type=int, default=export.EXPORT_BATCH_ROWS)
+    parser.add_argument("--formats", default="ndjson,arrow,parquet")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    recordings = max(1, int(args.recordings * args.scale))
+    segments = max(1, int(args.segments * args.scale))
+    path = os.path.join(tempfile.mkdtemp(), "bench_export.db")
+    engine = database.make_engine(f"sqlite:///{path}")
+    database.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    random.seed(42)
+
+    print(f"Building {recordings:,} recordings / {segments:,} segments in {path} ...")
+    build(engine, recordings, segments)
+    export.EXPORT_BATCH_ROWS = args.batch_rows
+
+    from fastapi.testclient import TestClient
+    import main as app_main
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # Both endpoints read the benchmark database
+    app_main.app.dependency_overrides[app_main.get_db] = get_db
+    app_main.SessionLocal = Session
+    client = TestClient(app_main.app)
+    formats = args.formats.split(",")
+    sample = random.sample(range(1, recordings + 1), min(args.api_recordings, recordings))
+    results = {"recordings": recordings, "segments": segments, "batch_rows": args.batch_rows,
+               "per_recording": bench_per_recording(client, sample)}
+    for format in formats:
+        results[format] = bench_export(client, format, segments)
+    app_main.app.dependency_overrides.pop(app_main.get_db, None)
+
+    baseline = results["per_recording"]["rows_per_second"]
+    r = results["per_recording"]
+    print(f"  {'per_recording':>14}: {r['rows_per_second']:>10,} rows/s ({r['recordings']} requests, {r['rows']:,} rows)")
+    for format in formats:
+        r = results[format]
+        r["speedup"] = round(r["rows_per_second"] / baseline, 1)
+        r["peak_memory_mb"] = peak_memory_mb(Session, format, args.batch_rows)
+        print(f"  {format:>14}: {r['rows_per_second']:>10,} rows/s | {r['mb_per_second']:6.1f} MB/s | "
+              f"{r['mb']:7.1f} MB | {r['speedup']:5.1f}x | peak {r['peak_memory_mb']:.1f} MB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Latency benchmark for live transcription (WS /live).
+
+A replay client sends a recording in --frame-ms frames at real-time pace (or --speed times
+faster), as PCM or Opus packets, one stream per channel, and times every server message
+against the moment the audio it covers was sent:
+
+    final latency    receipt of a final segment - send time of the segment's last audio
+    interim latency  receipt of an interim result - send time of its last word's audio
+    finalize         "stop" until the recording is stored ("done")
+
+Without --url the app runs in-process (TestClient), so the numbers include no network.
+A real recording gives meaningful numbers; the synthetic audio is mostly dropped by the VAD.
+
+Usage (from backend/):
+    python benchmarks/bench_live.py --file call_stereo.wav --model small
+    python benchmarks/bench_live.py --file call.wav --format opus --url ws://localhost:8080/live
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import av
+import numpy as np
+
+from analysis import split_channels, SAMPLE_RATE
+from bench_parallel_channels import make_synthetic_stereo
+
+OPUS_RATE = 48000
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"p50_ms": round(pick(0.50) * 1000, 1), "p95_ms": round(pick(0.95) * 1000, 1),
+            "max_ms": round(samples[-1] * 1000, 1), "n": len(samples)}
+
+
+def pcm_frames(audio, frame_seconds):
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    step = int(frame_seconds * SAMPLE_RATE)
+    return [pcm[i:i + step].tobytes() for i in range(0, len(pcm), step)]
+
+
+def opus_frames(audio, frame_seconds):
+    """Opus packets of the channel, frame_seconds each (20 ms is the usual VoIP size)."""
+    encoder = av.CodecContext.create("libopus", "w")
+    encoder.sample_rate, encoder.layout, encoder.format, encoder.bit_rate = OPUS_RATE, "mono", "s16", 24000
+    encoder.options = {"frame_duration": str(int(frame_seconds * 1000))}
+    upsampled = np.interp(np.arange(len(audio) * 3) / 3, np.arange(len(audio)), audio)
+    pcm = (np.clip(upsampled, -1.0, 1.0) * 32767).astype("<i2")
+    step = int(frame_seconds * OPUS_RATE)
+    packets = []
+    for i in range(0, len(pcm), step):
+        frame = av.AudioFrame.from_ndarray(pcm[i:i + step].reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate, frame.pts = OPUS_RATE, i
+        packets += [bytes(p) for p in encoder.encode(frame)]
+    return packets + [bytes(p) for p in encoder.encode(None)]
+
+
+class InProcessConnection:
+    def __init__(self, query):
+        from fastapi.testclient import TestClient
+        from main import app
+        self.client = TestClient(app)
+        self.context = self.client.websocket_connect(f"/live?{query}")
+        self.ws = self.context.__enter__()
+
+    def send_bytes(self, data):
+        self.ws.send_bytes(data)
+
+    def send_text(self, data):
+        self.ws.send_text(data)
+
+    def receive(self):
+        return self.ws.receive_json()
+
+    def close(self):
+        self.context.__exit__(None, None, None)
+
+
+class RemoteConnection:
+    def __init__(self, url, query):
+        from websockets.sync.client import connect
+        self.ws = connect(f"{url}?{query}", max_size=None)
+
+    def send_bytes(self, data):
+        self.ws.send(data)
+
+    def send_text(self, data):
+        self.ws.send(data)
+
+    def receive(self):
+        return json.loads(self.ws.recv())
+
+    def close(self):
+        self.ws.close()
+
+
+def replay(connection, channels, audio_format, frame_seconds, speed):
+    """Sends the channels at real-time pace while a thread collects the messages with their receipt time."""
+    frames = [(opus_frames if audio_format == "opus" else pcm_frames)(audio, frame_seconds) for audio in channels]
+    received = []
+
+    def receive():
+        while True:
+            message = connection.receive()
+            received.append((time.perf_counter(), message))
+            if message["type"] in ("done", "error"):
+                return
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+    started = time.perf_counter()
+    for i in range(max(len(f) for f in frames)):
+        if not receiver.is_alive():
+            break # The server gave up, e.g. the model could not be loaded
+        # Frame i covers the audio up to (i + 1) * frame_seconds; it is sent once that much time passed
+        delay = started + (i + 1) * frame_seconds / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        for channel, channel_frames in enumerate(frames):
+            if i < len(channel_frames):
+                connection.send_bytes(bytes([channel]) + channel_frames[i])
+    stopped = time.perf_counter()
+    connection.send_text(json.dumps({"type": "stop"}))
+    receiver.join()
+    try:
+        connection.close()
+    except Exception:
+        pass
+    return started, stopped, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="Recording to replay, 1 or 2 channels (synthetic stereo audio if omitted)")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of the synthetic recording")
+    parser.add_argument("--format", choices=("pcm16", "opus"), default="pcm16")
+    parser.add_argument("--frame-ms", type=int, default=20)
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 1.0 is real time")
+    parser.add_argument("--model", help="Model size (LIVE_MODEL_SIZE if omitted)")
+    parser.add_argument("--url", help="Server WebSocket URL, e.g. ws://localhost:8080/live (in-process if omitted)")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    file_path = args.file
+    if file_path is None:
+        file_path = os.path.join(tempfile.mkdtemp(), "synthetic_stereo.wav")
+        make_synthetic_stereo(file_path, args.seconds)
+    channels = split_channels(file_path)
+    audio_seconds = max(len(c) for c in channels) / SAMPLE_RATE
+
+    query = f"channels={len(channels)}&format={args.format}&analyze=false"
+    if args.model:
+        query += f"&model_size={args.model}"
+    connection = RemoteConnection(args.url, query) if args.url else InProcessConnection(query)
+    print(f"Replaying {audio_seconds:.1f}s x {len(channels)} channel(s) as {args.format} "
+          f"{args.frame_ms} ms frames at {args.speed}x ...")
+    started, stopped, received = replay(connection, channels, args.format, args.frame_ms / 1000, args.speed)
+
+    sent_at = lambda audio_time: started + audio_time / args.speed
+    finals = [t - sent_at(m["segment"]["end"]) for t, m in received if m["type"] == "final" and t < stopped]
+    interims = [t - sent_at(m["end"]) for t, m in received if m["type"] == "interim"]
+    done_at, done = received[-1]
+    if done["type"] != "done":
+        sys.exit(done.get("detail", "Live session failed"))
+    results = {
+        "audio_seconds": round(audio_seconds, 1),
+        "channels": len(channels),
+        "format": args.format,
+        "frame_ms": args.frame_ms,
+        "speed": args.speed,
+        "final_latency": percentiles(finals),
+        "interim_latency": percentiles(interims),
+        "finalize_ms": round((done_at - stopped) * 1000, 1),
+        "segments": done["segments"],
+        "recording_id": done["recording_id"],
+    }
+    for name in ("final_latency", "interim_latency"):
+        r = results[name]
+        print(f"  {name:>16}: " + (f"p50 {r['p50_ms']:8.1f} ms | p95 {r['p95_ms']:8.1f} ms | max {r['max_ms']:8.1f} ms ({r['n']})"
+                                    if r else "no messages"))
+    print(f"  {'finalize':>16}: {results['finalize_ms']:8.1f} ms, {done['segments']} segments, recording {done['recording_id']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
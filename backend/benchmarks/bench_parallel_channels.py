@@ -0,0 +1,105 @@
+"""
+Wall-clock benchmark for stereo transcription: channels one after the other vs concurrently.
+
+Both runs get the same total CPU budget (--cores): the sequential run gives all cores to a
+single channel, the parallel run splits them between the channels.
+
+Usage (from backend/):
+    python benchmarks/bench_parallel_channels.py --file call_stereo.wav --model small --repeat 3
+"""
+import os
+import sys
+import time
+import wave
+import json
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from analysis import transcribe_audio, split_channels
+from model_registry import registry
+
+
+def make_synthetic_stereo(path, seconds):
+    """
+    Writes a two channel WAV with alternating voiced bursts on each channel.
+    Real call recordings give more meaningful numbers: the VAD may drop synthetic tones.
+    """
+    sample_rate = 16000
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    envelope = (np.sin(2 * np.pi * 0.25 * t) > 0).astype(np.float32)
+    voice = np.sin(2 * np.pi * 180 * t) * (1 + 0.5 * np.sin(2 * np.pi * 4 * t))
+    data = np.stack([voice * envelope, voice * (1 - envelope)], axis=1) * 0.3
+    with wave.open(path, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes((data * 32767).astype("<i2").tobytes())
+
+
+def run(file_path, model, parallel_channels, cpu_threads, repeat):
+    # Warm-up loads the model outside the timed runs
+    if transcribe_audio(file_path, model_size=model, parallel_channels=parallel_channels, cpu_threads=cpu_threads) is None:
+        sys.exit("Transcription failed, see the log above")
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = transcribe_audio(file_path, model_size=model, parallel_channels=parallel_channels,
+                                  cpu_threads=cpu_threads)
+        timings.append(time.perf_counter() - started)
+    return timings, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="2-channel recording to transcribe (synthetic audio if omitted)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Length of the synthetic recording")
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    file_path = args.file
+    if file_path is None:
+        file_path = os.path.join(tempfile.mkdtemp(), "synthetic_stereo.wav")
+        make_synthetic_stereo(file_path, args.seconds)
+
+    channels = split_channels(file_path)
+    if len(channels) != 2:
+        sys.exit(f"Expected a 2-channel recording, got {len(channels)} channel(s)")
+    audio_seconds = len(channels[0]) / 16000
+
+    sequential, seq_result = run(file_path, args.model, 1, args.cores, args.repeat)
+    registry.evict()
+    parallel, par_result = run(file_path, args.model, 2, max(1, args.cores // 2), args.repeat)
+
+    if seq_result["segments"] != par_result["segments"]:
+        print("WARNING: sequential and parallel runs produced different segments")
+
+    results = {
+        "file": args.file or "synthetic",
+        "audio_seconds": round(audio_seconds, 2),
+        "model": args.model,
+        "cores": args.cores,
+        "sequential_seconds": round(statistics.median(sequential), 3),
+        "parallel_seconds": round(statistics.median(parallel), 3),
+    }
+    results["speedup"] = round(results["sequential_seconds"] / results["parallel_seconds"], 2)
+
+    print(f"Audio: {audio_seconds:.1f}s x 2 channels, model {args.model}, {args.cores} cores")
+    print(f"  sequential (1 x {args.cores} threads): {results['sequential_seconds']:.2f}s")
+    print(f"  parallel   (2 x {max(1, args.cores // 2)} threads): {results['parallel_seconds']:.2f}s")
+    print(f"  speedup: {results['speedup']:.2f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
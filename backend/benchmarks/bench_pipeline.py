@@ -0,0 +1,382 @@
+"""
+End-to-end pipeline benchmark: decode, transcription, segment merge, DB persistence,
+LLM analysis (against a stubbed LLM) and API request throughput.
+
+Runs every stage on synthetic mono and stereo recordings of several lengths (or on the
+given fixture files) and reports per-stage latency percentiles, real-time factor (RTF,
+processing seconds per audio second) and peak RSS. Results are written as JSON with a
+flat "metrics" map, so two runs (e.g. two commits) can be compared; with --baseline the
+run fails if a metric regressed by more than --threshold.
+
+Usage (from backend/):
+    python benchmarks/bench_pipeline.py --model tiny --json before.json
+    python benchmarks/bench_pipeline.py --model tiny --json after.json --baseline before.json --threshold 0.15
+    python benchmarks/bench_pipeline.py --fake-whisper --lengths 30,600   # without downloading a model
+    python benchmarks/bench_pipeline.py --fixtures call1.wav call2.mp3
+"""
+import os
+import sys
+import json
+import time
+import wave
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import analysis
+import crud
+import database
+from migrations import run_migrations
+
+# Latency metrics below this are dominated by timer noise and never count as regressions
+NOISE_FLOOR_MS = 1.0
+
+
+def make_synthetic_audio(path, seconds, channels, sample_rate=16000):
+    """
+    Writes a WAV with voiced bursts that alternate between the channels (or pause, for mono).
+    Real call recordings give more meaningful Whisper numbers: the VAD may drop synthetic tones.
+    """
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    envelope = (np.sin(2 * np.pi * 0.25 * t) > 0).astype(np.float32)
+    voice = np.sin(2 * np.pi * 180 * t) * (1 + 0.5 * np.sin(2 * np.pi * 4 * t))
+    if channels == 1:
+        data = (voice * envelope)[:, None]
+    else:
+        data = np.stack([voice * envelope, voice * (1 - envelope)], axis=1)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes((data * 0.3 * 32767).astype("<i2").tobytes())
+
+
+class SyntheticWhisper:
+    """
+    Stand-in for a Whisper model (--fake-whisper): one segment per voiced stretch of up to
+    10 s, found from 1 s RMS frames. Keeps the rest of the pipeline measurable without a model.
+    """
+
+    def transcribe(self, audio, **kwargs):
+        rate = analysis.SAMPLE_RATE
+        frames = len(audio) // rate
+        energy = np.sqrt(np.mean(audio[:frames * rate].reshape(frames, rate) ** 2, axis=1)) if frames else np.zeros(0)
+        voiced = energy > 0.01
+
+        def segments():
+            start = None
+            for second in range(frames + 1):
+                active = second < frames and voiced[second]
+                if active and start is None:
+                    start = second
+                if start is not None and (not active or second - start >= 10):
+                    words = [SimpleNamespace(start=w + 0.1, end=w + 0.9, word=f" kelime{w}", probability=0.9)
+                             for w in range(start, second)]
+                    yield SimpleNamespace(start=float(start), end=float(second), text="".join(w.word for w in words),
+                                          avg_logprob=-0.2, no_speech_prob=0.01, words=words)
+                    start = second if active else None
+        return segments(), SimpleNamespace(language="tr", duration=len(audio) / rate)
+
+
+class StubLLM:
+    """AsyncOpenAI stand-in that answers every window after a fixed latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=self)
+
+    async def create(self, model, messages, **kwargs):
+        await asyncio.sleep(self.latency)
+        window = json.loads(messages[-1]["content"].split("\n", 1)[1])
+        content = json.dumps({"segments": [
+            {"id": s["id"], "speaker": "Agent" if s["id"] % 2 else "Customer", "sentiment_score": 0.6} for s in window
+        ]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    async def close(self):
+        pass
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds (nearest rank)."""
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {
+        "p50_ms": round(pick(0.50) * 1000, 3),
+        "p90_ms": round(pick(0.90) * 1000, 3),
+        "p99_ms": round(pick(0.99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "n": len(ordered),
+    }
+
+
+def timed(timings, stage, fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    timings.setdefault(stage, []).append(time.perf_counter() - started)
+    return result
+
+
+def bench_fixture(path, Session, model_size, compute_type, repeat, llm_latency):
+    """Runs every stage repeat times on one recording; returns (stage timings, audio seconds, recording id)."""
+    timings = {}
+    audio_seconds = analysis.probe_duration(path) or 0.0
+    recording_id = None
+    for _ in range(repeat):
+        channels = timed(timings, "decode", analysis.split_channels, path)
+        if not isinstance(channels[0], np.ndarray):
+            raise RuntimeError(f"Could not decode {path}")
+        audio_seconds = len(channels[0]) / analysis.SAMPLE_RATE
+
+        result = timed(timings, "transcribe", analysis.transcribe_audio, path, model_size=model_size,
+                       compute_type=compute_type, use_cache=False)
+        if result is None:
+            raise RuntimeError("Transcription failed, see the log above")
+        segments = timed(timings, "merge", analysis.merge_channel_segments, result["segments"])
+
+        db = Session()
+        try:
+            recording = crud.create_recording(db, os.path.basename(path), os.path.basename(path), None, 0)
+            db.commit()
+            recording_id = recording.id
+
+            def persist_raw():
+                crud.save_raw_segments(db, recording.id, segments)
+                recording.duration = result["duration"]
+                recording.transcript_text = result["text"]
+                recording.status = "TRANSCRIBED"
+                db.commit()
+            timed(timings, "persist_raw", persist_raw)
+
+            analyzed = timed(timings, "analyze", analysis.analyze_transcript, segments, client=StubLLM(llm_latency),
+                             backend="llm")
+
+            def persist_analysis():
+                recording.average_sentiment = analyzed["average_sentiment"]
+                recording.status = "COMPLETED"
+                crud.save_analyzed_segments(db, recording.id, analyzed["segments"])
+                db.commit()
+            timed(timings, "persist_analysis", persist_analysis)
+        finally:
+            db.close()
+    return timings, audio_seconds, recording_id
+
+
+async def _api_load(app, paths, requests, concurrency):
+    import httpx
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(paths[i % len(paths)])
+
+    async def worker(client):
+        nonlocal errors
+        while not queue.empty():
+            path = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+    return latencies, elapsed, errors
+
+
+def bench_api(Session, recording_ids, requests, concurrency):
+    """Requests per second through the full FastAPI stack (in process, no network), against the benchmark DB."""
+    import main
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[main.get_db] = get_db
+    try:
+        results = {}
+        endpoints = {
+            "list": ["/recordings?limit=50"],
+            "detail": [f"/recordings/{i}" for i in recording_ids],
+        }
+        for name, paths in endpoints.items():
+            latencies, elapsed, errors = asyncio.run(_api_load(main.app, paths, requests, concurrency))
+            results[name] = dict(summarize(latencies), rps=round(len(latencies) / elapsed, 1), errors=errors)
+        return results
+    finally:
+        main.app.dependency_overrides.pop(main.get_db, None)
+
+
+def flatten(results):
+    """Comparable scalar metrics, e.g. 'stereo_60s.transcribe.p50_ms' or 'api.detail.rps'."""
+    metrics = {"peak_rss_mb": results["peak_rss_mb"]}
+    for name, fixture in results["fixtures"].items():
+        metrics[f"{name}.rtf"] = fixture["rtf"]
+        metrics[f"{name}.pipeline_rtf"] = fixture["pipeline_rtf"]
+        for stage, stats in fixture["stages"].items():
+            for key in ("p50_ms", "p90_ms", "p99_ms"):
+                metrics[f"{name}.{stage}.{key}"] = stats[key]
+    for name, stats in results.get("api", {}).items():
+        metrics[f"api.{name}.rps"] = stats["rps"]
+        metrics[f"api.{name}.p99_ms"] = stats["p99_ms"]
+    return metrics
+
+
+def compare(metrics, baseline, threshold):
+    """
+    Returns [(metric, old, new, relative change)] for metrics that got worse by more than
+    threshold. Throughput (*rps) must not drop; everything else must not grow.
+    """
+    regressions = []
+    for name, new in sorted(metrics.items()):
+        old = baseline.get(name)
+        if old is None or old <= 0:
+            continue
+        if name.endswith("_ms") and max(old, new) < NOISE_FLOOR_MS:
+            continue
+        change = (new - old) / old
+        worse = -change if name.endswith("rps") else change
+        if worse > threshold:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(fixtures, model_size="tiny", compute_type=None, repeat=3, llm_latency=0.05,
+              api_requests=500, api_concurrency=16, fake_whisper=False, db_path=None):
+    """fixtures: {name: audio path}. Returns the results dict (see flatten for the metrics)."""
+    if fake_whisper:
+        analysis.registry.get = lambda *args, **kwargs: SyntheticWhisper()
+
+    db_path = db_path or os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = database.make_engine(f"sqlite:///{db_path}")
+    database.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    Session = database.sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model_size": "synthetic" if fake_whisper else model_size,
+            "compute_type": compute_type,
+            "repeat": repeat,
+            "llm_latency": llm_latency,
+        },
+        "fixtures": {},
+    }
+    recording_ids = []
+    for name, path in fixtures.items():
+        print(f"Benchmarking {name} ...")
+        timings, audio_seconds, recording_id = bench_fixture(path, Session, model_size, compute_type, repeat, llm_latency)
+        recording_ids.append(recording_id)
+        stages = {stage: summarize(samples) for stage, samples in timings.items()}
+        # Transcription includes its own decode; the pipeline RTF covers everything after upload
+        pipeline = sum(stats["p50_ms"] for stage, stats in stages.items() if stage != "decode") / 1000
+        results["fixtures"][name] = {
+            "audio_seconds": round(audio_seconds, 2),
+            "rtf": round(stages["transcribe"]["p50_ms"] / 1000 / audio_seconds, 4) if audio_seconds else None,
+            "pipeline_rtf": round(pipeline / audio_seconds, 4) if audio_seconds else None,
+            "stages": stages,
+        }
+
+    if api_requests > 0 and recording_ids:
+        print("Benchmarking API ...")
+        results["api"] = bench_api(Session, recording_ids, api_requests, api_concurrency)
+    results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    results["metrics"] = flatten(results)
+    engine.dispose()
+    return results
+
+
+def print_results(results):
+    for name, fixture in results["fixtures"].items():
+        print(f"{name}: {fixture['audio_seconds']:.0f}s audio, RTF {fixture['rtf']}, pipeline RTF {fixture['pipeline_rtf']}")
+        for stage, stats in fixture["stages"].items():
+            print(f"  {stage:>16}: p50 {stats['p50_ms']:10.2f} ms  p90 {stats['p90_ms']:10.2f} ms  p99 {stats['p99_ms']:10.2f} ms")
+    for name, stats in results.get("api", {}).items():
+        print(f"API {name}: {stats['rps']} req/s, p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms, "
+              f"{stats['errors']} error(s)")
+    print(f"Peak RSS: {results['peak_rss_mb']:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", nargs="*", help="Recordings to use instead of synthetic audio")
+    parser.add_argument("--lengths", default="30,120,600", help="Synthetic recording lengths in seconds")
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--compute-type")
+    parser.add_argument("--fake-whisper", action="store_true", help="Use a synthetic model instead of Whisper")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per stubbed LLM request")
+    parser.add_argument("--api-requests", type=int, default=500, help="Requests per endpoint (0 skips the API stage)")
+    parser.add_argument("--api-concurrency", type=int, default=16)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative regression (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        fixtures = {os.path.splitext(os.path.basename(p))[0]: p for p in args.fixtures}
+    else:
+        directory = tempfile.mkdtemp()
+        fixtures = {}
+        for seconds in (float(s) for s in args.lengths.split(",")):
+            for channels, kind in ((1, "mono"), (2, "stereo")):
+                name = f"{kind}_{seconds:g}s"
+                fixtures[name] = os.path.join(directory, f"{name}.wav")
+                make_synthetic_audio(fixtures[name], seconds, channels)
+
+    results = run_suite(fixtures, model_size=args.model, compute_type=args.compute_type, repeat=args.repeat,
+                        llm_latency=args.llm_latency, api_requests=args.api_requests,
+                        api_concurrency=args.api_concurrency, fake_whisper=args.fake_whisper)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("model_size") != results["meta"]["model_size"]:
+            print("WARNING: baseline was measured with a different model")
+        regressions = compare(results["metrics"], baseline["metrics"], args.threshold)
+        print(f"Compared with {args.baseline} (commit {baseline['meta'].get('commit')}), threshold {args.threshold:.0%}")
+        for name, old, new, change in regressions:
+            print(f"  REGRESSION {name}: {old} -> {new} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print("  no regressions")
+
+
+if __name__ == "__main__":
+    main()
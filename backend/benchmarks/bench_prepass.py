@@ -0,0 +1,109 @@
+"""
+CPU-time saving of the speech pre-pass (SPEECH_PREPASS, prepass.py).
+
+Transcribes every recording twice, without and with the pre-pass, and reports the process
+CPU time (user + system, which includes the CTranslate2 threads), wall time, the seconds
+the pre-pass cut and how much the transcript changed (word error rate of the pre-pass
+transcript against the full one). Run it on real call-center recordings with hold music
+and one-sided stretches; the synthetic default has a silent channel and a steady tone only.
+
+Usage (from backend/):
+    python benchmarks/bench_prepass.py calls/*.wav --model small
+    python benchmarks/bench_prepass.py --seconds 120 --model tiny      # synthetic stereo call
+"""
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import analysis
+from model_registry import registry
+from bench_cascade import words, word_errors
+
+
+def make_synthetic_call(path, seconds, sample_rate=16000):
+    """Stereo WAV: a silent customer channel, and an agent talking in bursts around a stretch of hold music."""
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    voice = np.sin(2 * np.pi * 180 * t) * (1 + 0.5 * np.sin(2 * np.pi * 4 * t)) * (np.sin(2 * np.pi * 0.25 * t) > 0)
+    music = 0.6 * np.sin(2 * np.pi * 440 * t) + 0.3 * np.sin(2 * np.pi * 660 * t)
+    hold = (t > seconds / 4) & (t < seconds * 3 / 4)
+    data = np.stack([np.zeros_like(t), np.where(hold, music, voice)], axis=1)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes((data * 0.3 * 32767).astype("<i2").tobytes())
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def transcribe(path, model_size, speech_prepass):
+    cpu, wall = cpu_seconds(), time.perf_counter()
+    result = analysis.transcribe_audio(path, model_size=model_size, use_cache=False, speech_prepass=speech_prepass)
+    if result is None:
+        sys.exit(f"Transcription of {path} failed, see the log above")
+    return result, cpu_seconds() - cpu, time.perf_counter() - wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="Recordings to transcribe (a synthetic call if omitted)")
+    parser.add_argument("--seconds", type=float, default=120.0, help="Length of the synthetic call")
+    parser.add_argument("--model", default="small")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    files = args.files
+    if not files:
+        files = [os.path.join(tempfile.mkdtemp(), "synthetic_call.wav")]
+        make_synthetic_call(files[0], args.seconds)
+    # Load the model before timing anything
+    registry.get(args.model, cpu_threads=analysis.CPU_THREADS_PER_CHANNEL, num_workers=max(1, analysis.PARALLEL_CHANNELS))
+
+    results = {"model": args.model, "files": {}}
+    totals = {"cpu_full": 0.0, "cpu_prepass": 0.0, "audio_seconds": 0.0, "skipped_seconds": 0.0}
+    for path in files:
+        full, cpu_full, wall_full = transcribe(path, args.model, False)
+        cut, cpu_cut, wall_cut = transcribe(path, args.model, True)
+        reference = words(full["text"])
+        channels = len(analysis.split_channels(path))
+        results["files"][os.path.basename(path)] = {
+            "audio_seconds": round(full["duration"] * channels, 1),
+            "skipped_seconds": cut["skipped_seconds"],
+            "cpu_seconds": {"full": round(cpu_full, 2), "prepass": round(cpu_cut, 2)},
+            "wall_seconds": {"full": round(wall_full, 2), "prepass": round(wall_cut, 2)},
+            "cpu_saving": round(1 - cpu_cut / cpu_full, 4) if cpu_full else None,
+            # How far the pre-pass transcript is from the full one
+            "wer_vs_full": round(word_errors(reference, words(cut["text"])) / len(reference), 4) if reference else None,
+        }
+        totals["cpu_full"] += cpu_full
+        totals["cpu_prepass"] += cpu_cut
+        totals["audio_seconds"] += full["duration"] * channels
+        totals["skipped_seconds"] += cut["skipped_seconds"]
+
+    for name, r in results["files"].items():
+        print(f"  {name}: skipped {r['skipped_seconds']:.1f}s of {r['audio_seconds']:.1f}s | "
+              f"CPU {r['cpu_seconds']['full']:.1f}s -> {r['cpu_seconds']['prepass']:.1f}s | "
+              f"wall {r['wall_seconds']['full']:.1f}s -> {r['wall_seconds']['prepass']:.1f}s | WER vs full {r['wer_vs_full']}")
+    results["skipped_fraction"] = round(totals["skipped_seconds"] / totals["audio_seconds"], 4) if totals["audio_seconds"] else None
+    results["cpu_saving"] = round(1 - totals["cpu_prepass"] / totals["cpu_full"], 4) if totals["cpu_full"] else None
+    print(f"Total: {results['skipped_fraction'] * 100:.1f}% of the audio skipped, "
+          f"{results['cpu_saving'] * 100:.1f}% less CPU time")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
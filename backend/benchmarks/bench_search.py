@@ -0,0 +1,154 @@
+"""
+Benchmark for full-text search (search.py) over a large synthetic segment archive.
+
+Builds a throwaway database with --recordings recordings and --segments analyzed segments
+of random call-center sentences (20k / 2M by default), rebuilds the FTS5 index and
+measures GET /search-style queries: rare and common words, phrases, prefixes and filters.
+The vocabulary is small, so even the rare words match a large share of the segments:
+a worst case for ranking.
+
+Usage (from backend/):
+    python benchmarks/bench_search.py                  # full size, takes a few minutes to build
+    python benchmarks/bench_search.py --scale 0.05     # quick run
+"""
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+import database
+import search
+from migrations import run_migrations
+
+BATCH = 50000
+
+# Word pool with a skewed (Zipf-like) distribution, so common and rare words both occur
+VOCABULARY = (
+    "merhaba efendim evet hayır tamam teşekkür ederim fatura kargo iade sipariş numara hesap kart şifre "
+    "internet hat paket tarife ödeme borç indirim kampanya müşteri temsilci bekleyin kontrol ediyorum "
+    "sorun arıza teknik servis randevu adres değişikliği iptal şikayet memnun değilim yardımcı olabilir "
+    "miyim lütfen hemen bugün yarın gün hafta ay para ücret taahhüt cihaz modem sinyal kesinti geri arama"
+).split()
+QUERIES = {
+    "common_word": {"query": "fatura"},
+    "rare_word": {"query": "taahhüt"},
+    "two_words": {"query": "kargo iade"},
+    "phrase": {"query": '"teşekkür ederim"'},
+    "prefix": {"query": "şikay*"},
+    "speaker_filter": {"query": "iptal", "speaker": "Customer"},
+    "sentiment_filter": {"query": "arıza", "max_sentiment": 0.3},
+    "date_filter": {"query": "modem", "date_from": datetime.date(2024, 1, 3)},
+}
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"p50_ms": round(pick(0.50) * 1000, 3), "p95_ms": round(pick(0.95) * 1000, 3), "n": len(samples)}
+
+
+def build(engine, recordings, segments):
+    """Fills recordings and transcript_segments with raw executemany batches and indexes them."""
+    base = datetime.datetime(2024, 1, 1)
+    weights = [1.0 / (rank + 1) for rank in range(len(VOCABULARY))]
+    per_recording = max(1, segments // recordings)
+    started = time.perf_counter()
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.executemany(
+            "INSERT INTO recordings (id, filename, upload_date, status, duration, average_sentiment) "
+            "VALUES (?, ?, ?, 'COMPLETED', 180.0, 0.5)",
+            [(i + 1, f"call_{i}.wav", (base + datetime.timedelta(seconds=30 * i)).isoformat(" "))
+             for i in range(recordings)])
+        batch = []
+        for i in range(segments):
+            start = (i % per_recording) * 3.0
+            text = " ".join(random.choices(VOCABULARY, weights, k=random.randint(4, 14)))
+            batch.append((i // per_recording % recordings + 1, "Agent" if i % 2 else "Customer", text,
+                          start, start + 3.0, random.random()))
+            if len(batch) >= BATCH or i == segments - 1:
+                cur.executemany(
+                    "INSERT INTO transcript_segments (recording_id, speaker, text, start_time, end_time, sentiment_score) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+        raw.commit()
+    finally:
+        raw.close()
+    build_seconds = time.perf_counter() - started
+
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    try:
+        started = time.perf_counter()
+        search.rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+    return build_seconds, time.perf_counter() - started
+
+
+def bench_queries(Session, samples=30):
+    results = {}
+    db = Session()
+    try:
+        for name, params in QUERIES.items():
+            times = []
+            for _ in range(samples):
+                t = time.perf_counter()
+                found = search.search(db, **params)
+                times.append(time.perf_counter() - t)
+            results[name] = {**percentiles(times), "recordings": len(found)}
+    finally:
+        db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recordings", type=int, default=20_000)
+    parser.add_argument("--segments", type=int, default=2_000_000)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for both sizes")
+    parser.add_argument("--samples", type=int, default=30, help="Runs per query")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    recordings = max(1, int(args.recordings * args.scale))
+    segments = max(1, int(args.segments * args.scale))
+    path = os.path.join(tempfile.mkdtemp(), "bench_search.db")
+    engine = database.make_engine(f"sqlite:///{path}")
+    database.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    random.seed(42)
+
+    print(f"Building {recordings:,} recordings / {segments:,} segments in {path} ...")
+    build_seconds, index_seconds = build(engine, recordings, segments)
+    print(f"  built in {build_seconds:.1f}s, indexed in {index_seconds:.1f}s ({segments / index_seconds:,.0f} segments/s)")
+
+    results = {
+        "recordings": recordings,
+        "segments": segments,
+        "index_seconds": round(index_seconds, 1),
+        "index_mb": round(os.path.getsize(path) / 1e6, 1),
+        "queries": bench_queries(Session, args.samples),
+    }
+    print("Queries (top 20 recordings, 5 hits each):")
+    for name, r in results["queries"].items():
+        print(f"  {name:>16}: p50 {r['p50_ms']:8.2f} ms | p95 {r['p95_ms']:8.2f} ms ({r['recordings']} recordings)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import json
+import base64
+import datetime
+from sqlalchemy import insert, tuple_
+from sqlalchemy.orm import defer
+
+import models
+import search
+import stats
+from acoustics import ACOUSTIC_FIELDS
+
+
+def encode_words(words):
+    """Word timestamps as compact JSON ([[start, end, word, probability], ...]), or None."""
+    if not words:
+        return None
+    return json.dumps(words, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_words(value):
+    return json.loads(value) if value else []
+
+
+def create_recording(db, filename: str, stored_filename: str, file_hash: str, file_size: int):
+    """Adds a recording in UPLOADED state and counts it in the dashboard rollups. The caller commits."""
+    recording = models.Recording(
+        filename=filename,
+        upload_date=datetime.datetime.utcnow(),
+        stored_filename=stored_filename,
+        file_hash=file_hash,
+        file_size=file_size,
+        status="UPLOADED",
+        duration=0.0, # Will be updated after transcription
+        average_sentiment=0.0
+    )
+    db.add(recording)
+    stats.record_change(db, recording)
+    return recording
+
+
+def find_recording_by_hash(db, file_hash: str):
+    """Oldest recording with these exact audio bytes, or None."""
+    return db.query(models.Recording).filter(
+        models.Recording.file_hash == file_hash
+    ).order_by(models.Recording.id).first()
+
+
+def save_raw_segments(db, recording_id: int, segments):
+    """
+    Replaces the raw Whisper segments of a recording.
+    All rows go out in a single executemany INSERT instead of one ORM object per segment.
+    The caller commits.
+    """
+    delete_raw_segments(db, recording_id)
+    return append_raw_segments(db, recording_id, segments)
+
+
+def delete_raw_segments(db, recording_id: int):
+    db.query(models.RawSegment).filter(models.RawSegment.recording_id == recording_id).delete(synchronize_session=False)
+    search.index_raw_segments(db, recording_id, [], replace=True)
+
+
+def append_raw_segments(db, recording_id: int, segments):
+    """Adds raw segments without touching existing ones (streamed transcription). The caller commits."""
+    rows = [{
+        "recording_id": recording_id,
+        "channel": s.get("channel"),
+        "speaker": s.get("speaker", "Unknown"),
+        "text": s["text"],
+        "start_time": s["start"],
+        "end_time": s["end"],
+        "confidence": s.get("confidence"),
+        "no_speech_prob": s.get("no_speech_prob"),
+        "words": encode_words(s.get("words")),
+        **{field: s.get(field) for field in ACOUSTIC_FIELDS},
+    } for s in segments]
+    if rows:
+        db.execute(insert(models.RawSegment), rows)
+        search.index_raw_segments(db, recording_id, rows)
+    return len(rows)
+
+
+def load_raw_segments(db, recording_id: int):
+    """Raw segments in the transcribe_audio() format, ordered by start time."""
+    rows = db.query(models.RawSegment).filter(
+        models.RawSegment.recording_id == recording_id
+    ).order_by(models.RawSegment.start_time, models.RawSegment.id).all()
+    return [{
+        "start": r.start_time,
+        "end": r.end_time,
+        "text": r.text,
+        "speaker": r.speaker,
+        "channel": r.channel,
+        "confidence": r.confidence,
+        "no_speech_prob": r.no_speech_prob,
+        "words": decode_words(r.words),
+        **{field: getattr(r, field) for field in ACOUSTIC_FIELDS},
+    } for r in rows]
+
+
+def has_raw_segments(db, recording_id: int):
+    return db.query(models.RawSegment.id).filter(models.RawSegment.recording_id == recording_id).first() is not None
+
+
+def save_analyzed_segments(db, recording_id: int, segments):
+    """
+    Replaces the analyzed segments of a recording with one executemany INSERT; the search
+    index switches from the raw to these segments. The caller commits.
+    """
+    db.query(models.TranscriptSegment).filter(
+        models.TranscriptSegment.recording_id == recording_id
+    ).delete(synchronize_session=False)
+    rows = [{
+        "recording_id": recording_id,
+        "speaker": s["speaker"],
+        "text": s["text"],
+        "start_time": s["start_time"],
+        "end_time": s["end_time"],
+        "sentiment_score": s["sentiment_score"],
+        "channel": s.get("channel"),
+        "confidence": s.get("confidence"),
+        "no_speech_prob": s.get("no_speech_prob"),
+        "words": encode_words(s.get("words")),
+        **{field: s.get(field) for field in ACOUSTIC_FIELDS},
+    } for s in segments]
+    if rows:
+        db.execute(insert(models.TranscriptSegment), rows)
+    search.index_analyzed_segments(db, recording_id, rows)
+    return len(rows)
+
+
+def encode_cursor(recording):
+    """Opaque keyset cursor pointing just after the given recording in newest-first order."""
+    raw = f"{recording.upload_date.isoformat()}|{recording.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Returns (upload_date, id). Raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        upload_date, recording_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(upload_date), int(recording_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def list_recordings(db, limit: int, cursor: str = None, status: str = None, skip: int = 0):
+    """
+    Newest-first page of recordings. With a cursor the page starts right after the
+    (upload_date, id) it encodes, which is an index seek instead of an OFFSET scan.
+    Returns (recordings, next_cursor); next_cursor is None on the last page.
+    """
+    # The list view never shows the transcript, which is most of a row's size
+    query = db.query(models.Recording).options(defer(models.Recording.transcript_text))
+    if status:
+        query = query.filter(models.Recording.status == status)
+    query = query.order_by(models.Recording.upload_date.desc(), models.Recording.id.desc())
+    if cursor:
+        upload_date, recording_id = decode_cursor(cursor)
+        query = query.filter(tuple_(models.Recording.upload_date, models.Recording.id) < (upload_date, recording_id))
+    elif skip:
+        query = query.offset(skip)
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
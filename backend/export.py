@@ -0,0 +1,234 @@
+"""
+Bulk export of recordings and their segments as NDJSON, Arrow or Parquet.
+
+One query is read through a streaming cursor (yield_per: server-side on PostgreSQL, the
+lazily stepped statement on SQLite) in batches of EXPORT_BATCH_ROWS rows; every batch is
+encoded and handed on before the next is fetched, so memory stays flat however many rows
+match. Rows come in (upload_date, recording id, start_time) order, which the
+(upload_date, id) / (status, upload_date, id) and (recording_id, start_time) indexes
+already give: there is no sort to hold in memory.
+
+    segments       one row per analyzed segment, with its recording's fields
+    raw_segments   the same for the raw Whisper segments (recordings not analyzed yet)
+    recordings     one row per recording, with the full transcript
+
+    ndjson   one JSON object per line (application/x-ndjson)
+    arrow    Arrow IPC stream, one record batch per batch of rows
+    parquet  Parquet file, one row group per batch of rows
+
+Arrow and Parquet need pyarrow.
+
+Usage (from backend/):
+    python export.py --format parquet -o segments.parquet --date-from 2024-01-01 --status COMPLETED
+    python export.py --level recordings > recordings.ndjson
+"""
+import os
+import sys
+import json
+import logging
+import datetime
+import argparse
+
+from sqlalchemy import select, type_coerce, DateTime, Float, Integer, String
+
+import models
+from acoustics import ACOUSTIC_FIELDS
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+LEVELS = ("segments", "raw_segments", "recordings")
+
+# Recording fields repeated on every segment row
+RECORDING_FIELDS = ("filename", "upload_date", "status", "duration", "average_sentiment")
+SEGMENT_FIELDS = ("speaker", "channel", "start_time", "end_time", "text", "sentiment_score",
+                  "confidence", "no_speech_prob", "words", *ACOUSTIC_FIELDS)
+
+
+def columns(level: str):
+    """The selected columns of a level, labelled with their export names."""
+    recording = models.Recording
+    if level == "recordings":
+        return [column for column in recording.__table__.columns]
+    segment = models.TranscriptSegment if level == "segments" else models.RawSegment
+    fields = [recording.id.label("recording_id"), *(getattr(recording, f) for f in RECORDING_FIELDS),
+              segment.id.label("segment_id")]
+    # Raw segments have no sentiment yet
+    return fields + [getattr(segment, f) for f in SEGMENT_FIELDS if hasattr(segment, f)]
+
+
+def query(level: str, date_from: datetime.date = None, date_to: datetime.date = None, status: str = None):
+    """The export query: upload date range (date_to inclusive) and status filters, in index order."""
+    recording = models.Recording
+    # Timestamps are converted a batch at a time by the writers, not a value at a time here
+    statement = select(*(type_coerce(column, String).label(column.name) if isinstance(column.type, DateTime) else column
+                         for column in columns(level)))
+    if level != "recordings":
+        segment = models.TranscriptSegment if level == "segments" else models.RawSegment
+        statement = statement.join(segment, segment.recording_id == recording.id)
+    if date_from is not None:
+        statement = statement.where(recording.upload_date >= datetime.datetime.combine(date_from, datetime.time()))
+    if date_to is not None:
+        statement = statement.where(recording.upload_date < datetime.datetime.combine(
+            date_to + datetime.timedelta(days=1), datetime.time()))
+    if status:
+        statement = statement.where(recording.status == status)
+    statement = statement.order_by(recording.upload_date, recording.id)
+    if level != "recordings":
+        statement = statement.order_by(segment.start_time, segment.id)
+    return statement
+
+
+def batches(db, level: str, batch_rows: int = None, **filters):
+    """Lists of at most batch_rows (EXPORT_BATCH_ROWS) row tuples, fetched one batch at a time."""
+    # Core rows from the session's connection, without the ORM's per-row loading
+    result = db.connection().execute(query(level, **filters).execution_options(yield_per=batch_rows or EXPORT_BATCH_ROWS))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def _arrow_schema(level: str):
+    import pyarrow as pa
+    types = ((Integer, pa.int64()), (Float, pa.float64()), (DateTime, pa.timestamp("us")))
+    return pa.schema([(column.name, next((t for kind, t in types if isinstance(column.type, kind)), pa.string()))
+                      for column in columns(level)])
+
+
+class _Chunks:
+    """Write-only file object collecting what pyarrow writes, drained after every batch."""
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def _iso(value):
+    # SQLite hands back the stored "YYYY-MM-DD HH:MM:SS.ffffff" text, other databases datetimes
+    if isinstance(value, str):
+        return value.replace(" ", "T", 1)
+    return value.isoformat() if value is not None else None
+
+
+def _ndjson(level, row_batches):
+    names = [column.name for column in columns(level)]
+    timestamps = [i for i, column in enumerate(columns(level)) if isinstance(column.type, DateTime)]
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for rows in row_batches:
+        lines = []
+        for row in rows:
+            record = dict(zip(names, row))
+            for i in timestamps:
+                record[names[i]] = _iso(row[i])
+            lines.append(encode(record))
+        lines.append("")
+        yield "\n".join(lines).encode()
+
+
+def _arrow(level, row_batches, parquet=False):
+    import pyarrow as pa
+    schema = _arrow_schema(level)
+    sink = _Chunks()
+    if parquet:
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    for rows in row_batches:
+        # Row tuples to columns; the batch is the only copy in memory
+        arrays = [pa.array(values).cast(field.type) if pa.types.is_timestamp(field.type) else pa.array(values, type=field.type)
+                  for values, field in zip(zip(*rows), schema)]
+        if parquet:
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        else:
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export(db_factory, format: str = "ndjson", level: str = "segments", batch_rows: int = None, **filters):
+    """
+    Byte chunks of the export, one per batch of rows. The session comes from db_factory and is
+    held only while the chunks are consumed. Raises ValueError for an unknown format or level
+    and RuntimeError when Arrow / Parquet is asked for without pyarrow, before any row is read.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format {format!r}, expected one of {', '.join(FORMATS)}")
+    if level not in LEVELS:
+        raise ValueError(f"Unknown export level {level!r}, expected one of {', '.join(LEVELS)}")
+    if format != "ndjson":
+        try:
+            import pyarrow # noqa: F401
+        except ImportError:
+            raise RuntimeError(f"{format} export needs pyarrow (pip install pyarrow)")
+
+    def chunks():
+        db = db_factory()
+        try:
+            row_batches = batches(db, level, batch_rows, **filters)
+            if format == "ndjson":
+                yield from _ndjson(level, row_batches)
+            else:
+                yield from _arrow(level, row_batches, parquet=format == "parquet")
+        finally:
+            db.close()
+    return chunks()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--level", choices=LEVELS, default="segments")
+    parser.add_argument("--date-from", type=datetime.date.fromisoformat)
+    parser.add_argument("--date-to", type=datetime.date.fromisoformat, help="Inclusive")
+    parser.add_argument("--status", help="UPLOADED, TRANSCRIBED or COMPLETED")
+    parser.add_argument("--batch-rows", type=int, help=f"Rows per batch (default {EXPORT_BATCH_ROWS})")
+    parser.add_argument("-o", "--output", help="Output file (standard output if omitted)")
+    args = parser.parse_args()
+
+    import telemetry
+    from database import SessionLocal, engine, Base
+    from migrations import run_migrations
+    telemetry.configure_logging()
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    try:
+        chunks = export(SessionLocal, args.format, args.level, args.batch_rows,
+                        date_from=args.date_from, date_to=args.date_to, status=args.status)
+    except (ValueError, RuntimeError) as e:
+        sys.exit(str(e))
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    size = 0
+    try:
+        with telemetry.span("export", format=args.format, level=args.level):
+            for chunk in chunks:
+                out.write(chunk)
+                size += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+    logger.info("Exported %.1f MB of %s as %s", size / 1e6, args.level, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Bulk ingestion of call recordings from a directory or a manifest file.
+
+Every source file becomes a batch item. Items are hashed, deduplicated against existing
+recordings by content, placed into uploads/ and queued for transcription (and analysis);
+each item is committed as it is processed, so an interrupted batch resumes where it stopped.
+
+Usage (from backend/):
+    python ingest.py /data/calls/2024-05-01           # every audio file below the directory
+    python ingest.py manifest.txt --workers 2         # one path per line, relative to the manifest
+    python ingest.py --resume 7                       # continue batch 7
+    python ingest.py --report 7                       # throughput report of batch 7
+"""
+import os
+import sys
+import json
+import time
+import logging
+import datetime
+import argparse
+
+from sqlalchemy import func, select
+
+import crud
+import models
+import jobs
+from uploads import probe_audio, import_file, safe_filename
+from transcript_cache import file_sha256
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+# POST /recordings/batch only reads sources below this directory
+BATCH_IMPORT_ROOT = os.getenv("BATCH_IMPORT_ROOT", "imports")
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".aac", ".wma", ".webm", ".mp4"}
+# Options forwarded from the batch to its transcription jobs
+TRANSCRIBE_OPTIONS = ("model_size", "compute_type", "batch_size", "cascade")
+
+
+def resolve_source(source: str, root: str = None):
+    """
+    Absolute path of a batch source that must lie inside root (default BATCH_IMPORT_ROOT).
+    Relative paths are taken relative to root. Raises ValueError otherwise.
+    """
+    root = os.path.realpath(root or BATCH_IMPORT_ROOT)
+    path = os.path.realpath(os.path.join(root, source))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"Source must be inside {root}")
+    if not os.path.exists(path):
+        raise ValueError(f"Source not found: {source}")
+    return path
+
+
+def list_source_files(source: str):
+    """Audio files of a directory (recursively, sorted) or the paths listed in a manifest file."""
+    if os.path.isdir(source):
+        files = []
+        for directory, subdirectories, names in os.walk(source):
+            subdirectories[:] = sorted(d for d in subdirectories if not d.startswith("."))
+            files += [
+                os.path.join(directory, name) for name in sorted(names)
+                if not name.startswith(".") and os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+            ]
+        return files
+
+    # Manifest: one path per line, relative to the manifest's directory; blank lines and # comments are skipped
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, "r") as f:
+        lines = [line.strip() for line in f]
+    return [os.path.normpath(os.path.join(base, line)) for line in lines if line and not line.startswith("#")]
+
+
+def create_batch(db, source: str, analyze: bool = True, options: dict = None):
+    batch = models.Batch(
+        source=source,
+        analyze=analyze,
+        options=json.dumps(options) if options else None,
+        status="PENDING"
+    )
+    db.add(batch)
+    db.commit()
+    db.refresh(batch)
+    return batch
+
+
+def _schedule(db, batch, recording, options):
+    """Queues the next step of a recording; enqueue_job ignores work that is already queued."""
+    if recording.status == "UPLOADED":
+        payload = dict(options, analyze=True) if batch.analyze else options
+        jobs.enqueue_job(db, "transcribe", recording.id, payload=payload or None)
+    elif recording.status == "TRANSCRIBED" and batch.analyze:
+        jobs.enqueue_job(db, "analyze", recording.id)
+
+
+def ingest_item(db, batch, item, options):
+    try:
+        if not os.path.isfile(item.path):
+            raise FileNotFoundError(f"File not found: {item.path}")
+        if not probe_audio(item.path):
+            raise ValueError("File is not a supported audio format")
+        file_hash = file_sha256(item.path)
+        recording = crud.find_recording_by_hash(db, file_hash)
+        if recording is not None:
+            item.status = "DUPLICATE"
+        else:
+            stored_filename = import_file(item.path, file_hash)
+            recording = crud.create_recording(
+                db, safe_filename(item.path), stored_filename, file_hash, os.path.getsize(item.path)
+            )
+            db.flush()
+            item.status = "INGESTED"
+        item.recording_id = recording.id
+        item.error = None
+        db.commit()
+        _schedule(db, batch, recording, options)
+    except (OSError, ValueError) as e:
+        db.rollback()
+        item.status = "FAILED"
+        item.error = str(e)
+        db.commit()
+
+
+def run_batch(db, batch_id: int, progress_callback=None):
+    """
+    Ingests the pending items of a batch and queues their work. Safe to call again on the
+    same batch: finished items are skipped, and recordings whose work is neither done nor
+    queued (e.g. a failed transcription) are queued again.
+    """
+    batch = db.query(models.Batch).filter(models.Batch.id == batch_id).first()
+    if batch is None:
+        raise ValueError("Batch not found")
+    options = {k: v for k, v in json.loads(batch.options or "{}").items() if k in TRANSCRIBE_OPTIONS and v is not None}
+
+    if batch.status == "PENDING":
+        # All items are inserted in one transaction, so a crash here leaves the batch PENDING
+        paths = list_source_files(batch.source)
+        db.bulk_insert_mappings(models.BatchItem, [{"batch_id": batch.id, "path": p, "status": "PENDING"} for p in paths])
+        batch.total_files = len(paths)
+        batch.status = "INGESTING"
+        db.commit()
+        logger.info("Batch %d: %d file(s) in %s", batch.id, len(paths), batch.source)
+
+    pending = db.query(models.BatchItem).filter(
+        models.BatchItem.batch_id == batch.id,
+        models.BatchItem.status == "PENDING"
+    ).order_by(models.BatchItem.id).all()
+    for done, item in enumerate(pending, 1):
+        ingest_item(db, batch, item, options)
+        if progress_callback:
+            progress_callback(done / len(pending))
+
+    # Resume: requeue recordings left behind by an earlier run
+    recordings = db.query(models.Recording).join(
+        models.BatchItem, models.BatchItem.recording_id == models.Recording.id
+    ).filter(models.BatchItem.batch_id == batch.id).distinct().all()
+    for recording in recordings:
+        _schedule(db, batch, recording, options)
+
+    batch.status = "INGESTED"
+    batch.ingested_at = datetime.datetime.utcnow()
+    db.commit()
+    return batch
+
+
+def batch_report(db, batch_id: int):
+    """
+    Progress and throughput of a batch. Throughput counts the audio transcribed by this
+    batch's jobs (duplicates of earlier recordings are free) per wall-clock hour since the
+    batch was created.
+    """
+    batch = db.query(models.Batch).filter(models.Batch.id == batch_id).first()
+    if batch is None:
+        return None
+
+    files = dict.fromkeys(("PENDING", "INGESTED", "DUPLICATE", "FAILED"), 0)
+    for status, count in db.query(models.BatchItem.status, func.count()).filter(
+        models.BatchItem.batch_id == batch.id
+    ).group_by(models.BatchItem.status):
+        files[status] = count
+
+    recording_ids = select(models.BatchItem.recording_id).where(
+        models.BatchItem.batch_id == batch.id,
+        models.BatchItem.recording_id != None  # noqa: E711
+    ).distinct()
+    recordings = dict(db.query(models.Recording.status, func.count()).filter(
+        models.Recording.id.in_(recording_ids)
+    ).group_by(models.Recording.status).all())
+
+    batch_jobs = db.query(models.Job).filter(
+        models.Job.recording_id.in_(recording_ids),
+        models.Job.created_at >= batch.created_at
+    ).all()
+    job_counts = {}
+    for job in batch_jobs:
+        job_counts[job.status] = job_counts.get(job.status, 0) + 1
+    active = job_counts.get("QUEUED", 0) + job_counts.get("RUNNING", 0)
+
+    transcribed = {job.recording_id for job in batch_jobs if job.kind == "transcribe" and job.status == "SUCCEEDED"}
+    audio_seconds = sum(
+        duration or 0.0 for (duration,) in
+        db.query(models.Recording.duration).filter(models.Recording.id.in_(transcribed))
+    ) if transcribed else 0.0
+    worker_seconds = sum(
+        (job.finished_at - job.started_at).total_seconds()
+        for job in batch_jobs if job.finished_at and job.started_at and job.status == "SUCCEEDED"
+    )
+
+    done = batch.status == "INGESTED" and active == 0
+    finished = [job.finished_at for job in batch_jobs if job.finished_at]
+    end = max(finished + [batch.ingested_at or batch.created_at]) if done else datetime.datetime.utcnow()
+    wall_seconds = max((end - batch.created_at).total_seconds(), 1e-6)
+
+    return {
+        "batch_id": batch.id,
+        "source": batch.source,
+        "status": batch.status,
+        "done": done,
+        "files": dict(files, total=batch.total_files),
+        "recordings": recordings,
+        "jobs": job_counts,
+        "audio_hours": round(audio_seconds / 3600, 4),
+        "wall_hours": round(wall_seconds / 3600, 4),
+        "worker_hours": round(worker_seconds / 3600, 4),
+        "audio_hours_per_wall_hour": round(audio_seconds / wall_seconds, 2),
+    }
+
+
+def print_report(report):
+    files = report["files"]
+    print(f"Batch {report['batch_id']} ({report['status']}{', done' if report['done'] else ''}): "
+          f"{files['total']} file(s), {files['INGESTED']} new, {files['DUPLICATE']} duplicate, "
+          f"{files['FAILED']} failed, {files['PENDING']} pending")
+    print(f"  recordings: {report['recordings']}  jobs: {report['jobs']}")
+    print(f"  {report['audio_hours']:.2f} audio hours in {report['wall_hours']:.2f} wall hours "
+          f"({report['audio_hours_per_wall_hour']:.2f} audio-hours per wall-clock hour, "
+          f"{report['worker_hours']:.2f} worker hours)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", nargs="?", help="Directory of recordings or manifest file")
+    parser.add_argument("--resume", type=int, metavar="BATCH_ID", help="Continue an interrupted batch")
+    parser.add_argument("--report", type=int, metavar="BATCH_ID", help="Print the report of a batch and exit")
+    parser.add_argument("--no-analyze", action="store_true", help="Only transcribe")
+    parser.add_argument("--model-size")
+    parser.add_argument("--compute-type")
+    parser.add_argument("--batch-size", type=int, help="Whisper batched decoding (default WHISPER_BATCH_SIZE)")
+    parser.add_argument("--cascade", action=argparse.BooleanOptionalAction, default=None,
+                        help="Draft model first, the requested model only for low-confidence spans (default WHISPER_CASCADE)")
+    parser.add_argument("--workers", type=int, default=jobs.JOB_WORKERS,
+                        help="Worker processes to run until the batch is done (0: leave the jobs to the API's workers)")
+    parser.add_argument("--interval", type=float, default=30.0, help="Seconds between progress reports")
+    parser.add_argument("--json", help="Write the final report to this JSON file")
+    args = parser.parse_args()
+    telemetry.configure_logging()
+
+    from database import SessionLocal, engine, Base
+    from migrations import run_migrations
+    from model_registry import validate_model_options
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    db = SessionLocal()
+    try:
+        if args.report is not None:
+            report = batch_report(db, args.report)
+            if report is None:
+                sys.exit(f"Batch {args.report} not found")
+            print_report(report)
+            return
+
+        if args.resume is not None:
+            batch_id = args.resume
+        elif args.source:
+            try:
+                validate_model_options(args.model_size, args.compute_type)
+            except ValueError as e:
+                sys.exit(str(e))
+            options = {"model_size": args.model_size, "compute_type": args.compute_type, "batch_size": args.batch_size,
+                       "cascade": args.cascade}
+            source = os.path.abspath(args.source)
+            if not os.path.exists(source):
+                sys.exit(f"Source not found: {args.source}")
+            batch_id = create_batch(db, source, analyze=not args.no_analyze,
+                                    options={k: v for k, v in options.items() if v is not None}).id
+        else:
+            parser.error("a source or --resume is required")
+
+        started = time.monotonic()
+        run_batch(db, batch_id)
+        logger.info("Batch %d ingested in %.1fs", batch_id, time.monotonic() - started)
+
+        report = batch_report(db, batch_id)
+        if args.workers > 0:
+            # Jobs of other processes (e.g. a running API) are left alone; stale ones recover on their own
+            workers = jobs.start_workers(args.workers, recover_running=False)
+            try:
+                while not report["done"]:
+                    print_report(report)
+                    time.sleep(args.interval)
+                    db.expire_all()
+                    report = batch_report(db, batch_id)
+            finally:
+                jobs.stop_workers(*workers)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,543 @@
+import os
+import json
+import time
+import datetime
+import queue
+import threading
+import logging
+import multiprocessing
+import socket
+
+import crud
+import models
+from database import SessionLocal
+from analysis import transcribe_audio, analyze_transcript, TranscriptionCancelled
+from uploads import audio_path
+import media
+import stats
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+# A RUNNING job whose heartbeat is older than this is considered orphaned (worker crashed)
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+# How often the API process checks for worker processes that died and restarts them
+JOB_SUPERVISE_SECONDS = float(os.getenv("JOB_SUPERVISE_SECONDS", "5"))
+
+ACTIVE_STATUSES = ("QUEUED", "RUNNING")
+
+
+class JobError(Exception):
+    """Raised by job handlers for failures that should be retried."""
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
+
+
+def enqueue_job(db, kind: str, recording_id: int = None, payload: dict = None, max_attempts: int = None):
+    """
+    Adds a job to the queue, or returns the already queued/running job of the
+    same kind for this recording so repeated clicks do not pile up work.
+    Jobs without a recording (e.g. "ingest") are never merged.
+    """
+    if recording_id is not None:
+        existing = db.query(models.Job).filter(
+            models.Job.kind == kind,
+            models.Job.recording_id == recording_id,
+            models.Job.status.in_(ACTIVE_STATUSES)
+        ).first()
+        if existing:
+            return existing
+
+    job = models.Job(
+        kind=kind,
+        recording_id=recording_id,
+        payload=json.dumps(payload) if payload else None,
+        status="QUEUED",
+        progress=0.0,
+        attempts=0,
+        max_attempts=max_attempts or JOB_MAX_ATTEMPTS,
+        run_after=_utcnow()
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def claim_job(db, worker_id: str, job_id: int = None):
+    """
+    Atomically moves the oldest runnable QUEUED job (or the given job) to RUNNING.
+    The conditional UPDATE makes sure only one worker wins a given job.
+    Returns the claimed job or None if the queue is empty.
+    """
+    now = _utcnow()
+    if job_id is not None:
+        candidates = [(job_id,)]
+    else:
+        candidates = db.query(models.Job.id).filter(
+            models.Job.status == "QUEUED",
+            models.Job.run_after <= now
+        ).order_by(models.Job.run_after, models.Job.id).limit(5).all()
+
+    for (job_id,) in candidates:
+        claimed = db.query(models.Job).filter(
+            models.Job.id == job_id,
+            models.Job.status == "QUEUED"
+        ).update({
+            models.Job.status: "RUNNING",
+            models.Job.worker_id: worker_id,
+            models.Job.attempts: models.Job.attempts + 1,
+            models.Job.started_at: now,
+            models.Job.heartbeat_at: now,
+            models.Job.error: None
+        }, synchronize_session=False)
+        db.commit()
+        if claimed:
+            return db.query(models.Job).filter(models.Job.id == job_id).first()
+    return None
+
+
+def recover_stale_jobs(db, stale_seconds: float = None):
+    """
+    Requeues RUNNING jobs whose worker stopped sending heartbeats (crash, kill, reboot).
+    Returns the number of recovered jobs.
+    """
+    if stale_seconds is None:
+        stale_seconds = JOB_STALE_SECONDS
+    cutoff = _utcnow() - datetime.timedelta(seconds=stale_seconds)
+    recovered = db.query(models.Job).filter(
+        models.Job.status == "RUNNING",
+        (models.Job.heartbeat_at == None) | (models.Job.heartbeat_at < cutoff)  # noqa: E711
+    ).update({
+        models.Job.status: "QUEUED",
+        models.Job.worker_id: None,
+        models.Job.run_after: _utcnow()
+    }, synchronize_session=False)
+    db.commit()
+    if recovered:
+        logger.warning("Recovered %d stale job(s)", recovered)
+    return recovered
+
+
+def _local_pid(worker_id: str):
+    """PID of a worker id made on this host ("<host>-<pid>-<n>", "stream-<host>-<pid>"), else None."""
+    host = socket.gethostname()
+    for prefix in (f"{host}-", f"stream-{host}-"):
+        if worker_id and worker_id.startswith(prefix):
+            pid = worker_id[len(prefix):].split("-")[0]
+            return int(pid) if pid.isdigit() else None
+    return None
+
+
+def _pid_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # Someone else's process
+    return True
+
+
+def recover_dead_local_jobs(db):
+    """
+    Requeues RUNNING jobs claimed by processes of this host that no longer exist, without
+    waiting for JOB_STALE_SECONDS. Jobs of live processes and other hosts are left to the
+    heartbeat timeout. Returns the number of recovered jobs.
+    """
+    recovered = 0
+    for job_id, worker_id in db.query(models.Job.id, models.Job.worker_id).filter(models.Job.status == "RUNNING").all():
+        pid = _local_pid(worker_id)
+        if pid is None or pid == os.getpid() or _pid_alive(pid):
+            continue
+        # Conditional on the worker_id read above: a job reclaimed in between is left alone
+        recovered += db.query(models.Job).filter(
+            models.Job.id == job_id, models.Job.status == "RUNNING", models.Job.worker_id == worker_id
+        ).update({
+            models.Job.status: "QUEUED",
+            models.Job.worker_id: None,
+            models.Job.run_after: _utcnow()
+        }, synchronize_session=False)
+    db.commit()
+    if recovered:
+        logger.warning("Recovered %d job(s) of exited local processes", recovered)
+    return recovered
+
+
+def set_progress(job_id: int, progress: float):
+    """Stores job progress (0.0 - 1.0) and refreshes its heartbeat in a separate session."""
+    db = SessionLocal()
+    try:
+        db.query(models.Job).filter(models.Job.id == job_id).update({
+            models.Job.progress: max(0.0, min(1.0, progress)),
+            models.Job.heartbeat_at: _utcnow()
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _heartbeat(job_id: int, stop_event: threading.Event):
+    while not stop_event.wait(JOB_HEARTBEAT_SECONDS):
+        db = SessionLocal()
+        try:
+            db.query(models.Job).filter(models.Job.id == job_id).update(
+                {models.Job.heartbeat_at: _utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        except Exception as e:
+            logger.warning("Heartbeat failed for job %d: %s", job_id, e)
+        finally:
+            db.close()
+
+
+class TranscriptionStream:
+    """
+    Relays a transcription job running in this process to another thread,
+    e.g. a server-sent events response. Events on the queue are
+    ("segment", segment dict, progress) and finally ("end", job status).
+    """
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.progress = 0.0
+
+    def on_progress(self, progress: float):
+        self.progress = progress
+
+    def on_segment(self, segment: dict):
+        self.events.put(("segment", segment, self.progress))
+
+    def cancel(self):
+        """Stops the decode at the next segment; the job ends as CANCELLED."""
+        self.cancel_event.set()
+
+
+_append_lock = threading.Lock()
+
+
+def _append_raw_segment(recording_id: int, segment: dict):
+    # Called from the channel threads, so each write gets its own session
+    with _append_lock:
+        db = SessionLocal()
+        try:
+            with telemetry.span("db_commit", table="raw_segments", rows=1):
+                crud.append_raw_segments(db, recording_id, [segment])
+                db.commit()
+        finally:
+            db.close()
+
+
+def _job_recording(job):
+    if job.recording is None:
+        raise ValueError("Recording not found")
+    return job.recording
+
+
+def _run_transcribe(db, job, options, stream=None):
+    recording = _job_recording(job)
+    file_path = audio_path(recording)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError("Audio file not found")
+
+    def on_progress(p):
+        set_progress(job.id, p)
+        if stream:
+            stream.on_progress(p)
+
+    def on_segment(segment):
+        # Persist as decoded so a dropped stream still leaves the transcript so far
+        _append_raw_segment(recording.id, segment)
+        stream.on_segment(segment)
+
+    if stream:
+        crud.delete_raw_segments(db, recording.id)
+        db.commit()
+
+    result = transcribe_audio(
+        file_path,
+        progress_callback=on_progress,
+        model_size=options.get("model_size"),
+        compute_type=options.get("compute_type"),
+        batch_size=options.get("batch_size"),
+        cascade=options.get("cascade"),
+        file_hash=recording.file_hash,
+        segment_callback=on_segment if stream else None,
+        cancel_event=stream.cancel_event if stream else None
+    )
+    if not result:
+        raise JobError("Transcription failed")
+
+    # Raw segments are kept in the database until analysis (rewritten in start order after a stream)
+    with telemetry.span("db_commit", table="raw_segments", rows=len(result["segments"])):
+        crud.save_raw_segments(db, recording.id, result["segments"])
+
+        before = stats.contribution(db, recording)
+        recording.duration = result["duration"]
+        recording.transcript_text = result["text"]
+        recording.skipped_seconds = result.get("skipped_seconds")
+        recording.status = "TRANSCRIBED"
+        stats.record_change(db, recording, before)
+        db.commit()
+
+    if media.OPUS_RENDITION:
+        # The original stays playable if transcoding fails, so this never fails the job
+        try:
+            with telemetry.span("opus"):
+                media.transcode_opus(file_path)
+        except Exception as e:
+            logger.warning("Opus rendition of recording %d failed: %s", recording.id, e)
+
+    # Batch ingestion chains the analysis
+    if options.get("analyze"):
+        enqueue_job(db, "analyze", recording.id)
+
+
+def _run_analyze(db, job, options, stream=None):
+    recording = _job_recording(job)
+    whisper_segments = crud.load_raw_segments(db, recording.id)
+    if not whisper_segments:
+        raise ValueError("Transcript segments not found")
+
+    analysis_result = analyze_transcript(whisper_segments, backend=options.get("analyzer"))
+    if not analysis_result:
+        raise JobError("Analysis failed")
+
+    before = stats.contribution(db, recording)
+    recording.average_sentiment = analysis_result["average_sentiment"]
+    recording.status = "COMPLETED"
+
+    # Replaces existing segments (re-analysis case)
+    with telemetry.span("db_commit", table="transcript_segments", rows=len(analysis_result["segments"])):
+        crud.save_analyzed_segments(db, recording.id, analysis_result["segments"])
+        # Dashboard rollups move from the previous analysis (or transcription) to this one
+        stats.record_change(db, recording, before)
+        db.commit()
+
+
+def _run_ingest(db, job, options, stream=None):
+    import ingest
+    ingest.run_batch(db, options["batch_id"], progress_callback=lambda p: set_progress(job.id, p))
+
+
+JOB_HANDLERS = {
+    "transcribe": _run_transcribe,
+    "analyze": _run_analyze,
+    "ingest": _run_ingest,
+}
+
+# Missing inputs will not appear by retrying, so these fail the job immediately
+PERMANENT_ERRORS = (FileNotFoundError, KeyError, ValueError)
+
+
+def run_job(job_id: int, stream: TranscriptionStream = None):
+    """
+    Executes a claimed (RUNNING) job and records the outcome.
+    Failed jobs are requeued with exponential backoff until max_attempts is reached.
+    stream, if given, receives the job's segments as they are produced.
+    """
+    db = SessionLocal()
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job_id, stop_heartbeat), daemon=True)
+    heartbeat.start()
+    try:
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        if job is None:
+            return None
+        options = json.loads(job.payload) if job.payload else {}
+        logger.info("Running job %d (%s) for recording %s, attempt %d", job.id, job.kind, job.recording_id, job.attempts)
+        if job.started_at and job.run_after and job.attempts == 1:
+            telemetry.QUEUE_WAIT_SECONDS.labels(kind=job.kind).observe(
+                max(0.0, (job.started_at - job.run_after).total_seconds())
+            )
+
+        try:
+            handler = JOB_HANDLERS[job.kind]
+            with telemetry.span_context(job_id=job.id, recording_id=job.recording_id):
+                handler(db, job, options, stream=stream)
+        except Exception as e:
+            db.rollback()
+            job = db.query(models.Job).filter(models.Job.id == job_id).first()
+            job.error = str(e) or e.__class__.__name__
+            job.worker_id = None
+            if isinstance(e, TranscriptionCancelled):
+                job.status = "CANCELLED"
+                job.error = "Cancelled by client"
+                job.finished_at = _utcnow()
+                logger.info("Job %d cancelled", job.id)
+            elif isinstance(e, PERMANENT_ERRORS) or job.attempts >= job.max_attempts:
+                job.status = "FAILED"
+                job.finished_at = _utcnow()
+                logger.error("Job %d failed permanently: %s", job.id, job.error)
+            else:
+                delay = JOB_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1))
+                job.status = "QUEUED"
+                job.run_after = _utcnow() + datetime.timedelta(seconds=delay)
+                logger.warning("Job %d failed (%s), retrying in %.0fs", job.id, job.error, delay)
+            db.commit()
+            return job.status
+
+        job.status = "SUCCEEDED"
+        job.progress = 1.0
+        job.finished_at = _utcnow()
+        db.commit()
+        logger.info("Job %d succeeded", job.id)
+        return job.status
+    finally:
+        stop_heartbeat.set()
+        db.close()
+
+
+def run_pending_jobs(worker_id: str = "inline"):
+    """
+    Drains all currently runnable jobs in the calling process.
+    Useful for tests and single-process deployments (JOB_WORKERS=0).
+    """
+    processed = 0
+    while True:
+        db = SessionLocal()
+        try:
+            job = claim_job(db, worker_id)
+        finally:
+            db.close()
+        if job is None:
+            return processed
+        run_job(job.id)
+        processed += 1
+
+
+def start_streaming_job(job_id: int, stream: TranscriptionStream, worker_id: str = None):
+    """
+    Claims a queued job for this process and runs it in a background thread, relaying
+    its segments to stream. Returns False if another worker already claimed the job.
+    """
+    db = SessionLocal()
+    try:
+        job = claim_job(db, worker_id or f"stream-{socket.gethostname()}-{os.getpid()}", job_id=job_id)
+    finally:
+        db.close()
+    if job is None:
+        return False
+
+    def target():
+        status = None
+        try:
+            status = run_job(job_id, stream=stream)
+        finally:
+            stream.events.put(("end", status))
+
+    threading.Thread(target=target, daemon=True).start()
+    return True
+
+
+def worker_main(index: int, stop_event):
+    """Entry point of a worker process: polls the queue until stop_event is set."""
+    # The worker's own pid, so recover_dead_local_jobs() can tell when this process is gone
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{index}"
+    # Spawned processes start without the parent's logging setup
+    telemetry.configure_logging()
+    logger.info("Worker %s started", worker_id)
+    last_recovery = 0.0
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            if time.monotonic() - last_recovery > JOB_STALE_SECONDS:
+                recover_stale_jobs(db)
+                last_recovery = time.monotonic()
+            job = claim_job(db, worker_id)
+        except Exception as e:
+            logger.warning("Worker %s could not claim a job: %s", worker_id, e)
+            job = None
+        finally:
+            db.close()
+
+        if job is None:
+            stop_event.wait(JOB_POLL_INTERVAL)
+            continue
+        run_job(job.id)
+    logger.info("Worker %s stopped", worker_id)
+
+
+def _start_worker(ctx, index: int, stop_event):
+    process = ctx.Process(target=worker_main, args=(index, stop_event), daemon=True)
+    process.start()
+    return process
+
+
+def restart_dead_workers(ctx, processes, stop_event):
+    """
+    Replaces the worker processes that exited while the pool runs (crash, OOM kill) and
+    requeues the jobs they held. processes is updated in place; returns the number restarted.
+    """
+    restarted = 0
+    for i, process in enumerate(processes):
+        if process.is_alive() or stop_event.is_set():
+            continue
+        logger.error("Worker process %d exited with code %s, restarting it", process.pid, process.exitcode)
+        telemetry.mark_process_dead(process.pid)
+        processes[i] = _start_worker(ctx, i, stop_event)
+        restarted += 1
+    if restarted:
+        db = SessionLocal()
+        try:
+            recover_dead_local_jobs(db)
+        finally:
+            db.close()
+    return restarted
+
+
+def _supervise(ctx, processes, stop_event):
+    while not stop_event.wait(JOB_SUPERVISE_SECONDS):
+        try:
+            restart_dead_workers(ctx, processes, stop_event)
+        except Exception as e:
+            logger.warning("Worker supervision failed: %s", e)
+
+
+def start_workers(count: int = None, recover_running: bool = True):
+    """
+    Starts the worker pool. Jobs left RUNNING by exited processes of this host are requeued
+    first; jobs of other hosts, or of processes that are still running (another API process,
+    an SSE stream), are only reclaimed once their heartbeat is stale. Pass recover_running=False
+    to leave recovery to the workers' periodic stale check. A supervisor thread restarts
+    workers that die and requeues their jobs every JOB_SUPERVISE_SECONDS.
+    Returns (processes, stop_event, supervisor) for stop_workers().
+    """
+    if count is None:
+        count = JOB_WORKERS
+    if recover_running:
+        db = SessionLocal()
+        try:
+            recover_dead_local_jobs(db)
+            recover_stale_jobs(db)
+        finally:
+            db.close()
+
+    # spawn: workers must not inherit the parent's SQLite connections or model state
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    processes = [_start_worker(ctx, i, stop_event) for i in range(count)]
+    supervisor = threading.Thread(target=_supervise, args=(ctx, processes, stop_event), daemon=True)
+    supervisor.start()
+    return processes, stop_event, supervisor
+
+
+def stop_workers(processes, stop_event, supervisor=None, timeout: float = 10.0):
+    stop_event.set()
+    # No restarts once the processes are being joined
+    if supervisor is not None:
+        supervisor.join()
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        telemetry.mark_process_dead(process.pid)
@@ -0,0 +1,455 @@
+"""
+Live transcription of calls in progress over a WebSocket (WS /live).
+
+The client sends binary messages of one channel each: a channel index byte followed by
+16-bit little-endian mono PCM at the session's sample_rate (format=pcm16) or one Opus
+packet (format=opus). A text message {"type": "stop"} or closing the socket ends the call.
+
+Every channel keeps a rolling buffer of the audio that is not final yet. Silero VAD runs
+on each new piece of audio, and whenever LIVE_MIN_CHUNK_SECONDS of it arrived the buffer
+is decoded again with faster-whisper. Words are confirmed with local agreement: a word is
+committed once two consecutive decodes agree on it, so text already sent never changes.
+The server pushes JSON messages:
+
+    {"type": "interim", "channel", "speaker", "start", "end", "text", "stable"}
+        the utterance so far; stable is its committed prefix
+    {"type": "final", "segment": {...}}
+        a finished utterance (after a pause, a sentence end or LIVE_MAX_SEGMENT_SECONDS),
+        in the transcribe_audio() segment format
+    {"type": "done", "recording_id", "segments"}
+        after the call is stored
+
+At the end the audio is saved as a WAV upload and the segments become the raw segments of
+a regular TRANSCRIBED recording; with analyze (default) the analysis job is queued, which
+writes its transcript segments like for any other upload.
+"""
+import os
+import json
+import time
+import wave
+import uuid
+import asyncio
+import logging
+import datetime
+import threading
+
+import av
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+import crud
+import jobs
+import stats
+import telemetry
+from database import SessionLocal
+from model_registry import registry, DEFAULT_COMPUTE_TYPE
+from analysis import SAMPLE_RATE, _speaker_label
+from uploads import PARTIAL_DIR, import_file
+from transcript_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+LIVE_MODEL_SIZE = os.getenv("LIVE_MODEL_SIZE", "small")
+LIVE_COMPUTE_TYPE = os.getenv("LIVE_COMPUTE_TYPE", DEFAULT_COMPUTE_TYPE)
+# New audio per decode; lower is faster to react but decodes the buffer more often
+LIVE_MIN_CHUNK_SECONDS = float(os.getenv("LIVE_MIN_CHUNK_SECONDS", "1.0"))
+# Unconfirmed audio kept for re-decoding; beyond it the hypothesis is committed as is
+LIVE_MAX_BUFFER_SECONDS = float(os.getenv("LIVE_MAX_BUFFER_SECONDS", "15"))
+LIVE_MAX_SEGMENT_SECONDS = float(os.getenv("LIVE_MAX_SEGMENT_SECONDS", "10"))
+# Silence after speech that ends an utterance
+LIVE_PAUSE_MS = int(os.getenv("LIVE_PAUSE_MS", "600"))
+LIVE_MAX_CHANNELS = 2
+
+LIVE_DECODE_OPTIONS = dict(
+    beam_size=int(os.getenv("LIVE_BEAM_SIZE", "1")),
+    language="tr",
+    condition_on_previous_text=False,
+    vad_filter=False, # Speech is gated by the streaming VAD below
+    word_timestamps=True,
+)
+# Audio kept before the first detected speech so word onsets are not cut
+VAD_CONTEXT_SECONDS = 0.5
+SENTENCE_END = (".", "?", "!")
+# Characters of confirmed text passed to Whisper as the prompt of the next decode
+PROMPT_CHARS = 200
+
+
+def speech_timestamps(audio):
+    """Speech regions of a 16 kHz array as (start, end) sample indexes (silero VAD)."""
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+    options = VadOptions(min_silence_duration_ms=LIVE_PAUSE_MS // 2, speech_pad_ms=100)
+    return [(ts["start"], ts["end"]) for ts in get_speech_timestamps(audio, options)]
+
+
+class FrameDecoder:
+    """Turns the payloads of one channel (PCM or Opus packets) into 16 kHz float32 arrays."""
+
+    def __init__(self, audio_format: str, sample_rate: int):
+        self.format = audio_format
+        self.sample_rate = sample_rate
+        self.resampler = None
+        if audio_format == "opus":
+            self.codec = av.CodecContext.create("opus", "r")
+            self.codec.sample_rate = 48000
+            self.codec.layout = "mono"
+        if audio_format == "opus" or sample_rate != SAMPLE_RATE:
+            self.resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+
+    def _resample(self, frames):
+        out = [r.to_ndarray()[0] for frame in frames for r in self.resampler.resample(frame)]
+        return np.concatenate(out).astype(np.float32) if out else np.zeros(0, dtype=np.float32)
+
+    def decode(self, payload: bytes):
+        if self.format == "opus":
+            return self._resample(self.codec.decode(av.Packet(payload)))
+        pcm = np.frombuffer(payload[:len(payload) // 2 * 2], dtype="<i2")
+        if self.resampler is None:
+            return pcm.astype(np.float32) / 32768.0
+        frame = av.AudioFrame.from_ndarray(pcm.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = self.sample_rate
+        return self._resample([frame])
+
+    def flush(self):
+        """Samples the resampler still holds at the end of the stream."""
+        return self._resample([None]) if self.resampler is not None else np.zeros(0, dtype=np.float32)
+
+
+def _normalized(word):
+    return word[2].strip().lower().strip(".,?!;:…\"'")
+
+
+class ChannelStream:
+    """
+    Rolling-buffer decoder of one channel. feed() runs on the event loop, process() in a
+    worker thread; the buffer is shared under a lock. Times are seconds since the call start.
+    """
+
+    def __init__(self, channel: int, channels: int, audio_format: str, sample_rate: int, audio_file: str):
+        self.channel = channel
+        self.speaker = _speaker_label(channel, channels > 1)
+        self.decoder = FrameDecoder(audio_format, sample_rate)
+        self.lock = threading.Lock()
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_start = 0.0
+        self.received = 0 # Samples since the call start
+        self.pending = 0 # Samples not decoded yet
+        self.vad_position = 0 # Samples already seen by the VAD
+        self.last_speech_end = None
+        self.committed = [] # Confirmed words of the current utterance, not sent as final yet
+        self.hypothesis = [] # Unconfirmed words of the last decode
+        self.committed_end = 0.0
+        self.prompt = ""
+        self.segments = []
+        # The call audio, kept on disk as raw int16 for the recording
+        self.audio_file = audio_file
+        self._audio = open(audio_file, "wb")
+
+    def feed(self, payload: bytes):
+        """Adds a payload; returns True when enough new audio arrived for a decode."""
+        return self._append(self.decoder.decode(payload))
+
+    def _append(self, audio):
+        if not len(audio):
+            return False
+        self._audio.write((np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+        with self.lock:
+            self.buffer = np.concatenate([self.buffer, audio])
+            self.received += len(audio)
+            self.pending += len(audio)
+            return self.pending >= LIVE_MIN_CHUNK_SECONDS * SAMPLE_RATE
+
+    def _trim(self, until: float):
+        """Drops buffered audio before until (seconds). Called with the lock held."""
+        cut = int(round((until - self.buffer_start) * SAMPLE_RATE))
+        if cut > 0:
+            self.buffer = self.buffer[cut:]
+            self.buffer_start += cut / SAMPLE_RATE
+
+    def _update_vad(self, audio, buffer_start):
+        # Only the audio the VAD has not seen yet, with a little context before it
+        start = max(self.vad_position - int(VAD_CONTEXT_SECONDS * SAMPLE_RATE), int(round(buffer_start * SAMPLE_RATE)))
+        first = start - int(round(buffer_start * SAMPLE_RATE))
+        with telemetry.span("live_vad", channel=self.channel):
+            regions = speech_timestamps(audio[first:])
+        if regions:
+            self.last_speech_end = (start + regions[-1][1]) / SAMPLE_RATE
+        self.vad_position = int(round(buffer_start * SAMPLE_RATE)) + len(audio)
+
+    def _segment(self, words):
+        return {
+            "start": words[0][0],
+            "end": words[-1][1],
+            "text": "".join(w[2] for w in words).strip(),
+            "speaker": self.speaker,
+            "channel": self.channel,
+            "confidence": round(float(np.mean([w[3] for w in words])), 2),
+            "no_speech_prob": None,
+            "words": words,
+        }
+
+    def _finalize(self, messages):
+        if self.committed:
+            segment = self._segment(self.committed)
+            self.segments.append(segment)
+            self.prompt = (self.prompt + " " + segment["text"])[-PROMPT_CHARS:]
+            messages.append({"type": "final", "segment": segment})
+            self.committed = []
+
+    def _interim(self, messages):
+        words = self.committed + self.hypothesis
+        if words:
+            messages.append({
+                "type": "interim", "channel": self.channel, "speaker": self.speaker,
+                "start": words[0][0], "end": words[-1][1],
+                "text": "".join(w[2] for w in words).strip(),
+                "stable": "".join(w[2] for w in self.committed).strip(),
+            })
+
+    def process(self, model, final: bool = False):
+        """Decodes the buffer and returns the messages to send. final: the call has ended."""
+        with self.lock:
+            audio, buffer_start = self.buffer, self.buffer_start
+            self.pending = 0
+        try:
+            return self._decode(model, audio, buffer_start, final)
+        except Exception:
+            # Skip the audio that failed instead of re-decoding an ever growing backlog; it is still in the WAV
+            with self.lock:
+                self.hypothesis = []
+                self._trim(buffer_start + len(audio) / SAMPLE_RATE)
+            raise
+
+    def _decode(self, model, audio, buffer_start, final):
+        buffer_end = buffer_start + len(audio) / SAMPLE_RATE
+        messages = []
+        if len(audio):
+            self._update_vad(audio, buffer_start)
+
+        # Nothing spoken since the buffer start: no decode, keep only some context
+        if self.last_speech_end is None or self.last_speech_end <= buffer_start:
+            self.hypothesis = []
+            self._finalize(messages)
+            with self.lock:
+                self._trim(max(buffer_start, buffer_end - VAD_CONTEXT_SECONDS))
+            return messages
+
+        with telemetry.span("live_decode", channel=self.channel, audio_duration=round(buffer_end - buffer_start, 2)):
+            segments, _ = model.transcribe(audio, initial_prompt=self.prompt or None, **LIVE_DECODE_OPTIONS)
+            words = [[round(w.start + buffer_start, 2), round(w.end + buffer_start, 2), w.word, round(w.probability, 3)]
+                     for segment in segments for w in (segment.words or [])]
+        # Words at or after the committed text; earlier ones are re-decodes of committed audio
+        words = [w for w in words if w[0] >= self.committed_end - 0.05]
+
+        # Local agreement: commit the prefix the previous decode agrees with
+        agreed = 0
+        while (agreed < min(len(words), len(self.hypothesis))
+               and _normalized(words[agreed]) == _normalized(self.hypothesis[agreed])):
+            agreed += 1
+        paused = buffer_end - self.last_speech_end >= LIVE_PAUSE_MS / 1000
+        # At a pause, the end of the call or a full buffer no more audio will change the words
+        if final or paused or buffer_end - buffer_start >= LIVE_MAX_BUFFER_SECONDS:
+            agreed = len(words)
+        self.committed += words[:agreed]
+        self.hypothesis = words[agreed:]
+        if agreed:
+            self.committed_end = words[agreed - 1][1]
+
+        if self.committed and (paused or final or not self.hypothesis and self.committed[-1][2].rstrip().endswith(SENTENCE_END)
+                               or self.committed_end - self.committed[0][0] >= LIVE_MAX_SEGMENT_SECONDS):
+            self._finalize(messages)
+            with self.lock:
+                self._trim(self.committed_end if not paused else max(self.committed_end, buffer_end - VAD_CONTEXT_SECONDS))
+        self._interim(messages)
+        return messages
+
+    def close_audio(self):
+        if not self._audio.closed:
+            self._append(self.decoder.flush())
+            self._audio.close()
+
+
+class LiveSession:
+    """One live call: its channel streams, and the recording it becomes at the end."""
+
+    def __init__(self, channels: int = 1, audio_format: str = "pcm16", sample_rate: int = SAMPLE_RATE,
+                 filename: str = None, analyze: bool = True, model_size: str = None, compute_type: str = None):
+        os.makedirs(PARTIAL_DIR, exist_ok=True)
+        self.id = uuid.uuid4().hex
+        self.filename = filename or f"live-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.wav"
+        self.analyze = analyze
+        self.model_size = model_size or LIVE_MODEL_SIZE
+        self.compute_type = compute_type or LIVE_COMPUTE_TYPE
+        self.model = None
+        self.streams = [
+            ChannelStream(i, channels, audio_format, sample_rate, os.path.join(PARTIAL_DIR, f"{self.id}.{i}.pcm"))
+            for i in range(channels)
+        ]
+
+    def load_model(self):
+        self.model = registry.get(self.model_size, self.compute_type, num_workers=len(self.streams))
+
+    def discard(self):
+        """Drops the call audio without storing a recording."""
+        for stream in self.streams:
+            stream._audio.close()
+            if os.path.exists(stream.audio_file):
+                os.remove(stream.audio_file)
+
+    def feed(self, message: bytes):
+        """Routes a binary message to its channel; returns the channel index when a decode is due, else None."""
+        if not message or message[0] >= len(self.streams):
+            raise ValueError("Unknown channel")
+        return message[0] if self.streams[message[0]].feed(message[1:]) else None
+
+    def _write_wav(self, path):
+        """Interleaves the channel files into a 16 kHz 16-bit WAV, block by block."""
+        length = max(s.received for s in self.streams)
+        block = SAMPLE_RATE * 10
+        files = [open(s.audio_file, "rb") for s in self.streams]
+        try:
+            with wave.open(path, "wb") as out:
+                out.setnchannels(len(self.streams))
+                out.setsampwidth(2)
+                out.setframerate(SAMPLE_RATE)
+                for start in range(0, length, block):
+                    count = min(block, length - start)
+                    data = np.zeros((count, len(files)), dtype="<i2")
+                    for i, f in enumerate(files):
+                        samples = np.frombuffer(f.read(count * 2), dtype="<i2")
+                        data[:len(samples), i] = samples
+                    out.writeframes(data.tobytes())
+        finally:
+            for f in files:
+                f.close()
+        return length / SAMPLE_RATE
+
+    def finalize(self):
+        """
+        Flushes the channels and stores the call as a TRANSCRIBED recording (queueing its
+        analysis). Returns (recording_id, final messages); recording_id is None without audio.
+        """
+        messages = []
+        for stream in self.streams:
+            stream.close_audio()
+            if stream.received:
+                try:
+                    messages += [m for m in stream.process(self.model, final=True) if m["type"] == "final"]
+                except Exception:
+                    # The audio is stored anyway and can be transcribed again
+                    logger.exception("Live call %s: final decode of channel %d failed", self.id, stream.channel)
+        try:
+            if not any(s.received for s in self.streams):
+                return None, messages
+            wav_path = os.path.join(PARTIAL_DIR, f"{self.id}.wav")
+            try:
+                duration = self._write_wav(wav_path)
+                file_hash = file_sha256(wav_path)
+                stored_filename = import_file(wav_path, file_hash)
+                size = os.path.getsize(wav_path)
+            finally:
+                if os.path.exists(wav_path):
+                    os.remove(wav_path)
+
+            segments = sorted((s for stream in self.streams for s in stream.segments), key=lambda s: (s["start"], s["channel"]))
+            db = SessionLocal()
+            try:
+                recording = crud.create_recording(db, self.filename, stored_filename, file_hash, size)
+                db.flush()
+                crud.save_raw_segments(db, recording.id, segments)
+                before = stats.contribution(db, recording)
+                recording.duration = duration
+                recording.transcript_text = " ".join(s["text"] for s in segments)
+                recording.status = "TRANSCRIBED"
+                stats.record_change(db, recording, before)
+                db.commit()
+                if self.analyze and segments:
+                    jobs.enqueue_job(db, "analyze", recording.id)
+                logger.info("Live call %s stored as recording %d (%.1fs, %d segments)",
+                            self.id, recording.id, duration, len(segments))
+                return recording.id, messages
+            finally:
+                db.close()
+        finally:
+            for stream in self.streams:
+                if os.path.exists(stream.audio_file):
+                    os.remove(stream.audio_file)
+
+
+async def serve(websocket, session: LiveSession):
+    """Runs a live session on an accepted WebSocket until the client stops or disconnects."""
+    send_lock = asyncio.Lock()
+    connected = True
+    closing = False
+    ready = [asyncio.Event() for _ in session.streams]
+
+    async def send(messages):
+        nonlocal connected
+        async with send_lock:
+            for message in messages:
+                if not connected:
+                    return
+                try:
+                    await websocket.send_text(json.dumps(message, ensure_ascii=False))
+                except Exception:
+                    connected = False
+
+    async def decode_loop(stream, event):
+        # One decode at a time per channel; audio arriving meanwhile is picked up by the next one
+        while True:
+            await event.wait()
+            event.clear()
+            if closing:
+                return
+            try:
+                messages = await run_in_threadpool(stream.process, session.model)
+            except Exception as e:
+                # The failed audio is dropped from the live transcript; the call goes on
+                logger.exception("Live call %s: decode of channel %d failed", session.id, stream.channel)
+                messages = [{"type": "error", "channel": stream.channel, "detail": f"Decode failed: {e}"}]
+            await send(messages)
+
+    try:
+        await run_in_threadpool(session.load_model)
+    except Exception as e:
+        logger.exception("Live call %s: model could not be loaded", session.id)
+        session.discard()
+        await send([{"type": "error", "detail": f"Model could not be loaded: {e}"}])
+        await websocket.close(code=1011)
+        return
+    workers = [asyncio.create_task(decode_loop(stream, event)) for stream, event in zip(session.streams, ready)]
+    started = time.monotonic()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                connected = False
+                break
+            if message.get("bytes") is not None:
+                try:
+                    channel = session.feed(message["bytes"])
+                except ValueError as e:
+                    await send([{"type": "error", "detail": str(e)}])
+                    continue
+                if channel is not None:
+                    ready[channel].set()
+            elif message.get("text") is not None:
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    control = {}
+                if control.get("type") == "stop":
+                    break
+    finally:
+        closing = True
+        for event in ready:
+            event.set()
+        await asyncio.gather(*workers, return_exceptions=True)
+        with telemetry.span("live_finalize", call_seconds=round(time.monotonic() - started, 1)):
+            recording_id, messages = await run_in_threadpool(session.finalize)
+        await send(messages + [{"type": "done", "recording_id": recording_id,
+                                "segments": sum(len(s.segments) for s in session.streams)}])
+        if connected:
+            try:
+                await websocket.close()
+            except Exception:
+                pass
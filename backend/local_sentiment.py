@@ -0,0 +1,132 @@
+"""
+CPU-only sentiment classifier used by the "local" and "hybrid" analyzer backends.
+
+Loads a quantized ONNX export of a Turkish sentiment model (e.g. a BERTurk fine-tune) from
+SENTIMENT_MODEL: a local directory or a Hugging Face repository holding model_quantized.onnx
+(or model.onnx, optionally under onnx/), tokenizer.json and config.json with id2label.
+onnxruntime and tokenizers are imported on first use, like faster_whisper in model_registry.
+"""
+import os
+import json
+import logging
+import threading
+
+import numpy as np
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_MODEL = os.getenv("SENTIMENT_MODEL", "")
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "32"))
+SENTIMENT_MAX_TOKENS = int(os.getenv("SENTIMENT_MAX_TOKENS", "128"))
+SENTIMENT_THREADS = int(os.getenv("SENTIMENT_THREADS", "0"))
+
+MODEL_FILES = ("onnx/model_quantized.onnx", "model_quantized.onnx", "onnx/model.onnx", "model.onnx")
+
+
+def _label_weights(labels):
+    """
+    Sentiment score (0 negative - 1 positive) of each output class, read from the label names.
+    Unnamed labels (LABEL_0, ...) are taken as ordered from negative to positive.
+    """
+    weights = []
+    for index, label in enumerate(labels):
+        name = label.lower()
+        if name.startswith("neg"):
+            weights.append(0.0)
+        elif name.startswith("neu"):
+            weights.append(0.5)
+        elif name.startswith("pos"):
+            weights.append(1.0)
+        else:
+            weights.append(index / max(1, len(labels) - 1))
+    return np.array(weights, dtype=np.float32)
+
+
+class LocalSentimentModel:
+    """
+    Scores texts in padded batches. Texts are sorted by length first so each batch pads
+    to similar lengths. Returns (sentiment_score, confidence) per text, where the score is
+    the expected label weight and the confidence the probability of the top class.
+    """
+
+    def __init__(self, session, tokenizer, labels, batch_size: int = SENTIMENT_BATCH_SIZE,
+                 max_tokens: int = SENTIMENT_MAX_TOKENS):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.labels = list(labels)
+        self.weights = _label_weights(self.labels)
+        self.batch_size = batch_size
+        self.input_names = {i.name for i in session.get_inputs()}
+        tokenizer.enable_truncation(max_length=max_tokens)
+        tokenizer.enable_padding()
+
+    @classmethod
+    def load(cls, source: str = None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        source = source or SENTIMENT_MODEL
+        if not source:
+            raise RuntimeError("SENTIMENT_MODEL is not set")
+        directory = source
+        if not os.path.isdir(source):
+            from huggingface_hub import snapshot_download
+            directory = snapshot_download(source, allow_patterns=["*.json", "*.onnx", "onnx/*"])
+        model_path = next((os.path.join(directory, f) for f in MODEL_FILES if os.path.exists(os.path.join(directory, f))), None)
+        if model_path is None:
+            raise RuntimeError(f"No ONNX model found in {source}")
+
+        with open(os.path.join(directory, "config.json"), "r") as f:
+            id2label = json.load(f)["id2label"]
+        labels = [id2label[str(i)] for i in range(len(id2label))]
+
+        options = onnxruntime.SessionOptions()
+        if SENTIMENT_THREADS:
+            options.intra_op_num_threads = SENTIMENT_THREADS
+        session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+        logger.info("Loaded sentiment model %s (%s)", source, ", ".join(labels))
+        return cls(session, tokenizer, labels)
+
+    def predict(self, texts):
+        results = [None] * len(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        with telemetry.span("local_sentiment", segments=len(texts)):
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                encodings = self.tokenizer.encode_batch([texts[i] or "" for i in batch])
+                feed = {
+                    "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                    "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                }
+                if "token_type_ids" in self.input_names:
+                    feed["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+                logits = self.session.run(None, feed)[0]
+                # Softmax over the classes of the whole batch at once
+                logits = logits - logits.max(axis=1, keepdims=True)
+                probs = np.exp(logits)
+                probs /= probs.sum(axis=1, keepdims=True)
+                scores = probs @ self.weights
+                confidences = probs.max(axis=1)
+                for i, score, confidence in zip(batch, scores, confidences):
+                    results[i] = (round(float(score), 4), round(float(confidence), 4))
+        return results
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """The process-wide classifier, loaded on first use."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = LocalSentimentModel.load()
+        return _model
+
+
+def classify(texts):
+    return get_model().predict(list(texts)) if texts else []
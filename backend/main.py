@@ -1,23 +1,57 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Query, WebSocket
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-import shutil
+from fastapi.responses import StreamingResponse, FileResponse
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
 import os
+import re
 import json
-from typing import List
+import queue
+import uuid
+import datetime
+from typing import List, Optional
+import crud
 import models
 import schemas
 from database import SessionLocal, engine, Base
-from analysis import transcribe_audio, analyze_transcript
+import jobs
+import ingest
+import telemetry
+import media
+import search
+import stats
+import live
+import export
+from model_registry import registry, validate_model_options
+from transcript_cache import transcript_cache
+from analysis import ANALYZERS, check_analyzer
+from acoustics import ACOUSTIC_FIELDS
+from uploads import (
+    UploadError, MAX_UPLOAD_BYTES, UPLOAD_RANGE_TIMEOUT_SECONDS, audio_path, safe_filename, receive_multipart_upload,
+    open_resumable, suspend_resumable, reset_resumable, discard_resumable
+)
+from migrations import run_migrations
 from dotenv import load_dotenv
 
 load_dotenv()
+telemetry.configure_logging()
 
-# Create database tables
+# Create database tables and apply schema migrations
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the transcription/analysis worker pool (JOB_WORKERS=0 disables it)
+    workers = jobs.start_workers() if jobs.JOB_WORKERS > 0 else None
+    yield
+    if workers:
+        jobs.stop_workers(*workers)
 
-app = FastAPI(title="Voice Analyzer API")
+app = FastAPI(title="Voice Analyzer API", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -26,6 +60,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Mount static files for uploaded recordings (be careful in production)
@@ -44,78 +79,289 @@ def get_db():
 def read_root():
     return {"message": "Voice Analyzer API is running"}
 
-@app.post("/upload", response_model=schemas.Recording)
-async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    file_location = f"uploads/{file.filename}"
-    with open(file_location, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
+def _create_recording(db: Session, filename: str, stored_filename: str, file_hash: str, file_size: int):
     # Create DB record with UPLOADED status
-    db_recording = models.Recording(
-        filename=file.filename,
-        status="UPLOADED",
-        duration=0.0, # Will be updated after transcription
-        average_sentiment=0.0
-    )
-    db.add(db_recording)
+    db_recording = crud.create_recording(db, filename, stored_filename, file_hash, file_size)
     db.commit()
     db.refresh(db_recording)
-    
     return db_recording
 
-@app.post("/recordings/{recording_id}/transcribe", response_model=schemas.RecordingDetail)
-def transcribe_recording(recording_id: int, db: Session = Depends(get_db)):
+# The body is parsed by hand (see uploads.receive_multipart_upload), so describe it for the docs
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "properties": {"file": {"type": "string", "format": "binary"}},
+        "required": ["file"],
+    }}},
+}
+
+@app.post("/upload", response_model=schemas.RecordingDetail, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload_file(request: Request, db: Session = Depends(get_db)):
+    # Streamed straight into uploads/<sha256>.<ext> while hashing; no temporary spool file
+    try:
+        upload = await receive_multipart_upload(request)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    return _create_recording(db, upload.filename, upload.stored_filename, upload.file_hash, upload.size)
+
+@app.post("/upload/sessions", response_model=schemas.UploadSession, status_code=201)
+def create_upload_session(body: schemas.UploadSessionCreate, db: Session = Depends(get_db)):
+    """Starts a resumable upload. Send the bytes with PUT /upload/sessions/{id} and a Content-Range header."""
+    if body.total_size <= 0:
+        raise HTTPException(status_code=400, detail="total_size must be positive")
+    if body.total_size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit")
+    session = models.UploadSession(
+        id=uuid.uuid4().hex,
+        filename=safe_filename(body.filename),
+        total_size=body.total_size,
+        received_size=0,
+        status="ACTIVE"
+    )
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return session
+
+@app.get("/upload/sessions/{upload_id}", response_model=schemas.UploadSession)
+def read_upload_session(upload_id: str, db: Session = Depends(get_db)):
+    # received_size is the offset to resume from
+    session = db.query(models.UploadSession).filter(models.UploadSession.id == upload_id).first()
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+@app.put("/upload/sessions/{upload_id}")
+async def upload_session_range(upload_id: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Appends one byte range (Content-Range: bytes start-end/total) to a resumable upload.
+    Ranges must arrive in order; a mismatching start returns 409 with the expected offset.
+    When the last byte arrives the upload is verified and the recording is created.
+    """
+    session = db.query(models.UploadSession).filter(models.UploadSession.id == upload_id).first()
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session.status == "COMPLETED":
+        raise HTTPException(status_code=409, detail="Upload already completed")
+
+    match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", request.headers.get("content-range", "").strip())
+    if not match:
+        raise HTTPException(status_code=400, detail="Content-Range header required (bytes start-end/total)")
+    start, end, total = (int(g) for g in match.groups())
+    if total != session.total_size or end < start or end >= total:
+        raise HTTPException(status_code=416, detail="Invalid Content-Range")
+
+    # Claim the range before writing: of two requests for the same offset (a retry racing
+    # the original) only one passes this conditional UPDATE, the other gets 409
+    now = datetime.datetime.utcnow()
+    claimed = db.query(models.UploadSession).filter(
+        models.UploadSession.id == upload_id,
+        models.UploadSession.received_size == start,
+        (models.UploadSession.status == "ACTIVE") | (
+            (models.UploadSession.status == "RECEIVING")
+            & (models.UploadSession.updated_at < now - datetime.timedelta(seconds=UPLOAD_RANGE_TIMEOUT_SECONDS)))
+    ).update({models.UploadSession.status: "RECEIVING", models.UploadSession.updated_at: now},
+             synchronize_session=False)
+    db.commit()
+    db.refresh(session)
+    if not claimed:
+        if session.status == "COMPLETED":
+            raise HTTPException(status_code=409, detail="Upload already completed")
+        message = "Unexpected offset" if start != session.received_size else "Range is being received"
+        raise HTTPException(status_code=409, detail={"message": message, "received_size": session.received_size})
+
+    try:
+        # Cuts the partial file back to start, dropping whatever a failed range left behind
+        upload = await run_in_threadpool(open_resumable, session)
+    except UploadError as e:
+        discard_resumable(session.id)
+        db.delete(session)
+        db.commit()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    def release():
+        # Give the range back for a retry; received_size still is start
+        reset_resumable(session.id, upload, start)
+        session.status = "ACTIVE"
+        session.updated_at = datetime.datetime.utcnow()
+        db.commit()
+
+    try:
+        expected = end - start + 1
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > expected:
+                raise UploadError(400, "Body is longer than the Content-Range")
+            await run_in_threadpool(upload.write, chunk)
+        if received != expected:
+            raise UploadError(400, "Body is shorter than the Content-Range")
+    except UploadError as e:
+        if e.status_code == 415:
+            # Not audio: the session cannot succeed, drop it
+            discard_resumable(session.id)
+            db.delete(session)
+            db.commit()
+        else:
+            release()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except BaseException:
+        # Client went away mid-range
+        release()
+        raise
+
+    session.received_size = upload.size
+    session.updated_at = datetime.datetime.utcnow()
+    if upload.size < session.total_size:
+        suspend_resumable(session.id, upload)
+        session.status = "ACTIVE"
+        db.commit()
+        return {"upload": schemas.UploadSession.model_validate(session), "recording": None}
+
+    try:
+        stored_filename, file_hash, file_size = await run_in_threadpool(upload.finish)
+    except UploadError as e:
+        discard_resumable(session.id)
+        db.delete(session)
+        db.commit()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    discard_resumable(session.id)
+
+    recording = _create_recording(db, session.filename, stored_filename, file_hash, file_size)
+    session.status = "COMPLETED"
+    session.recording_id = recording.id
+    db.commit()
+    return {
+        "upload": schemas.UploadSession.model_validate(session),
+        "recording": schemas.RecordingDetail.model_validate(recording)
+    }
+
+@app.post("/recordings/{recording_id}/transcribe", response_model=schemas.Job, status_code=202)
+def transcribe_recording(recording_id: int, model_size: Optional[str] = None, compute_type: Optional[str] = None,
+                         cascade: Optional[bool] = None, db: Session = Depends(get_db)):
     recording = db.query(models.Recording).filter(models.Recording.id == recording_id).first()
     if not recording:
         raise HTTPException(status_code=404, detail="Recording not found")
         
-    file_path = f"uploads/{recording.filename}"
+    file_path = audio_path(recording)
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Audio file not found")
-        
-    result = transcribe_audio(file_path)
-    if not result:
-        raise HTTPException(status_code=500, detail="Transcription failed")
-        
-    # Update recording
-    recording.duration = result["duration"]
-    recording.transcript_text = result["text"]
-    # Store raw segments temporarily in a way we can retrieve later? 
-    # For now, we might just store them in the DB if we had a JSON column, 
-    # but since we don't, we'll rely on re-transcribing or just passing text to GPT if segments aren't stored.
-    # actually, let's store raw segments as a temporary file or just proceed. 
-    # To keep it simple for this "manual trigger" flow, we will save raw segments to a JSON file.
-    
-    segments_path = f"uploads/{recording.filename}.json"
-    with open(segments_path, "w") as f:
-        json.dump(result["segments"], f, indent=2, ensure_ascii=False)
-
-    recording.status = "TRANSCRIBED"
-    db.commit()
-    db.refresh(recording)
-    
-    # Attach segments for response
-    # Map raw segments (dicts) to TranscriptSegment schema
-    mapped_segments = []
-    for s in result["segments"]:
-        mapped_segments.append(schemas.TranscriptSegment(
-            id=0, # Temporary ID
-            recording_id=recording.id,
-            speaker=s.get("speaker", "Unknown"),
-            text=s["text"],
-            start_time=s["start"],
-            end_time=s["end"],
-            sentiment_score=s.get("sentiment_score", 0.0)
-        ))
-    
-    # Create RecordingDetail from the DB model and attach segments
-    recording_detail = schemas.RecordingDetail.model_validate(recording)
-    recording_detail.segments = mapped_segments
-    
-    return recording_detail
-
-@app.post("/recordings/{recording_id}/analyze", response_model=schemas.RecordingDetail)
-def analyze_recording(recording_id: int, db: Session = Depends(get_db)):
+
+    # e.g. small/int8 for quick triage, large-v3 for the final transcript
+    try:
+        validate_model_options(model_size, compute_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    payload = {k: v for k, v in (("model_size", model_size), ("compute_type", compute_type)) if v}
+    # Draft model first, the requested one only for low-confidence spans (default WHISPER_CASCADE)
+    if cascade is not None:
+        payload["cascade"] = cascade
+
+    # Transcription runs in the worker pool, which answers cache hits without running Whisper;
+    # poll GET /jobs/{id} for progress
+    return jobs.enqueue_job(db, "transcribe", recording.id, payload=payload)
+
+# Server-sent events: how often the stream checks for a closed connection, and keep-alive spacing
+SSE_POLL_SECONDS = 1.0
+SSE_KEEPALIVE_SECONDS = 15.0
+
+def _sse(event: str, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _stream_summary(job_id: int):
+    db = SessionLocal()
+    try:
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        recording = job.recording
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "error": job.error,
+            "recording_status": recording.status,
+            "duration": recording.duration,
+            "segments": len(recording.raw_segments),
+        }
+    finally:
+        db.close()
+
+@app.get("/recordings/{recording_id}/transcribe/stream")
+async def stream_transcription(recording_id: int, request: Request, model_size: Optional[str] = None,
+                               compute_type: Optional[str] = None, cascade: Optional[bool] = None,
+                               db: Session = Depends(get_db)):
+    """
+    Transcribes the recording and sends server-sent events while Whisper decodes:
+    `job` once, `segment` for each decoded segment (with overall `progress`), then `done` or `error`.
+    Segments are stored as they arrive; closing the connection cancels the decode.
+    Recordings that are already transcribed are replayed from the database.
+    """
+    recording = db.query(models.Recording).filter(models.Recording.id == recording_id).first()
+    if not recording:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    if not os.path.exists(audio_path(recording)):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    try:
+        validate_model_options(model_size, compute_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    if recording.status in ("TRANSCRIBED", "COMPLETED") and crud.has_raw_segments(db, recording.id):
+        segments = crud.load_raw_segments(db, recording.id)
+        summary = {"job_id": None, "status": "SUCCEEDED", "error": None, "recording_status": recording.status,
+                   "duration": recording.duration, "segments": len(segments)}
+
+        async def replay():
+            for segment in segments:
+                yield _sse("segment", {**segment, "progress": 1.0})
+            yield _sse("done", summary)
+        return StreamingResponse(replay(), media_type="text/event-stream", headers=headers)
+
+    payload = {k: v for k, v in (("model_size", model_size), ("compute_type", compute_type)) if v}
+    if cascade is not None:
+        payload["cascade"] = cascade
+    job = jobs.enqueue_job(db, "transcribe", recording.id, payload=payload)
+    job_id = job.id
+    stream = jobs.TranscriptionStream()
+    # A job already claimed by a worker cannot be streamed; poll GET /jobs/{id} instead
+    if job.status != "QUEUED" or not await run_in_threadpool(jobs.start_streaming_job, job_id, stream):
+        raise HTTPException(status_code=409, detail={"message": "Transcription already running", "job_id": job_id})
+
+    async def events():
+        finished = False
+        idle = 0.0
+        try:
+            yield _sse("job", {"job_id": job_id})
+            while True:
+                try:
+                    event = await run_in_threadpool(stream.events.get, True, SSE_POLL_SECONDS)
+                except queue.Empty:
+                    if await request.is_disconnected():
+                        break
+                    idle += SSE_POLL_SECONDS
+                    if idle >= SSE_KEEPALIVE_SECONDS:
+                        idle = 0.0
+                        yield ": keep-alive\n\n"
+                    continue
+                idle = 0.0
+                if event[0] == "segment":
+                    _, segment, progress = event
+                    yield _sse("segment", {**segment, "progress": round(progress, 4)})
+                    continue
+                finished = True
+                summary = await run_in_threadpool(_stream_summary, job_id)
+                yield _sse("done" if summary["status"] == "SUCCEEDED" else "error", summary)
+                break
+        finally:
+            # Client went away: stop decoding instead of finishing a transcript nobody reads
+            if not finished:
+                stream.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+@app.post("/recordings/{recording_id}/analyze", response_model=schemas.Job, status_code=202)
+def analyze_recording(recording_id: int, analyzer: Optional[str] = None, db: Session = Depends(get_db)):
     recording = db.query(models.Recording).filter(models.Recording.id == recording_id).first()
     if not recording:
         raise HTTPException(status_code=404, detail="Recording not found")
@@ -123,89 +369,231 @@ def analyze_recording(recording_id: int, db: Session = Depends(get_db)):
     if recording.status != "TRANSCRIBED":
          raise HTTPException(status_code=400, detail="Recording must be transcribed first")
 
-    # Load raw segments
-    segments_path = f"uploads/{recording.filename}.json"
-    if not os.path.exists(segments_path):
+    if not crud.has_raw_segments(db, recording.id):
          raise HTTPException(status_code=500, detail="Transcript segments not found")
-         
-    with open(segments_path, "r") as f:
-        whisper_segments = json.load(f)
-        
-    analysis_result = analyze_transcript(whisper_segments)
-    if not analysis_result:
-        raise HTTPException(status_code=500, detail="Analysis failed")
-        
-    # Update recording
-    recording.average_sentiment = analysis_result["average_sentiment"]
-    recording.status = "COMPLETED"
-    
-    # Save segments to DB
-    # First clear existing segments if any (re-analysis case)
-    db.query(models.TranscriptSegment).filter(models.TranscriptSegment.recording_id == recording.id).delete()
-    
-    for seg in analysis_result["segments"]:
-        db_segment = models.TranscriptSegment(
-            recording_id=recording.id,
-            speaker=seg["speaker"],
-            text=seg["text"],
-            start_time=seg["start_time"],
-            end_time=seg["end_time"],
-            sentiment_score=seg["sentiment_score"]
-        )
-        db.add(db_segment)
-    
-    db.commit()
-    db.refresh(recording)
-    
-    return recording
 
-@app.get("/recordings", response_model=List[schemas.Recording])
-def read_recordings(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    recordings = db.query(models.Recording).order_by(models.Recording.upload_date.desc()).offset(skip).limit(limit).all()
+    # llm, local or hybrid; defaults to ANALYZER_BACKEND
+    if analyzer is not None and analyzer not in ANALYZERS:
+        raise HTTPException(status_code=400, detail=f"Unsupported analyzer: {analyzer}")
+    try:
+        check_analyzer(analyzer)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return jobs.enqueue_job(db, "analyze", recording.id, payload={"analyzer": analyzer} if analyzer else None)
+
+@app.post("/recordings/batch", response_model=schemas.Batch, status_code=202)
+def create_batch(body: schemas.BatchCreate, db: Session = Depends(get_db)):
+    """
+    Bulk ingestion of a server-side directory or manifest below BATCH_IMPORT_ROOT.
+    Files are deduplicated by content and queued for transcription (and analysis) by a
+    background "ingest" job; follow it with GET /recordings/batch/{id}.
+    """
+    if bool(body.directory) == bool(body.manifest):
+        raise HTTPException(status_code=400, detail="Give exactly one of directory or manifest")
+    try:
+        validate_model_options(body.model_size, body.compute_type)
+        source = ingest.resolve_source(body.directory or body.manifest)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if os.path.isdir(source) != bool(body.directory):
+        raise HTTPException(status_code=400, detail="directory must be a directory and manifest a file")
+
+    options = {k: v for k, v in (("model_size", body.model_size), ("compute_type", body.compute_type),
+                                  ("batch_size", body.batch_size)) if v}
+    if body.cascade is not None:
+        options["cascade"] = body.cascade
+    batch = ingest.create_batch(db, source, analyze=body.analyze, options=options)
+    jobs.enqueue_job(db, "ingest", payload={"batch_id": batch.id})
+    return batch
+
+@app.get("/recordings/batch/{batch_id}")
+def read_batch(batch_id: int, db: Session = Depends(get_db)):
+    # Progress counts and throughput (audio hours per wall-clock hour)
+    report = ingest.batch_report(db, batch_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return report
+
+@app.get("/models")
+def read_models():
+    # Models loaded in this (API) process; each worker process keeps its own registry
+    return registry.stats()
+
+@app.get("/cache/stats")
+def read_cache_stats():
+    return transcript_cache.stats()
+
+@app.get("/metrics")
+def read_metrics(db: Session = Depends(get_db)):
+    # Prometheus scrape endpoint: histograms of every process plus the current queue depth
+    queue_depth = {
+        (kind, status): count for kind, status, count in db.query(
+            models.Job.kind, models.Job.status, func.count()
+        ).filter(models.Job.status.in_(jobs.ACTIVE_STATUSES)).group_by(models.Job.kind, models.Job.status)
+    }
+    return Response(telemetry.render_metrics(queue_depth), media_type=telemetry.CONTENT_TYPE_LATEST)
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/recordings", response_model=List[schemas.RecordingSummary])
+def read_recordings(response: Response, skip: int = 0, limit: int = Query(100, ge=1, le=500),
+                    cursor: Optional[str] = None, status: Optional[str] = None, db: Session = Depends(get_db)):
+    # Pass the X-Next-Cursor header back as ?cursor= for the next page; skip is kept for old clients
+    try:
+        recordings, next_cursor = crud.list_recordings(db, limit, cursor=cursor, status=status, skip=skip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return recordings
 
+@app.get("/stats", response_model=schemas.Stats)
+def read_stats(date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+               db: Session = Depends(get_db)):
+    # Served from the recording_stats rollups (stats.py), maintained as recordings change
+    return stats.summary(db, date_from=date_from, date_to=date_to)
+
+@app.get("/search", response_model=List[schemas.SearchResult])
+def search_segments(q: str = Query(..., min_length=1, max_length=500), speaker: Optional[str] = None,
+                    min_sentiment: Optional[float] = Query(None, ge=0.0, le=1.0),
+                    max_sentiment: Optional[float] = Query(None, ge=0.0, le=1.0),
+                    date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                    limit: int = Query(20, ge=1, le=100), hits: int = Query(5, ge=1, le=50),
+                    db: Session = Depends(get_db)):
+    """
+    Recordings whose segments mention q (all words; "phrases" and prefix* supported), ranked by
+    the BM25 of their transcript, each with its first matching segments and snippets
+    highlighted with <mark>.
+    """
+    if not search.available(db):
+        raise HTTPException(status_code=501, detail="Full-text search needs an SQLite database")
+    try:
+        return search.search(db, q, speaker=speaker, min_sentiment=min_sentiment, max_sentiment=max_sentiment,
+                             date_from=date_from, date_to=date_to, limit=limit, hits=hits)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/export")
+def export_data(format: str = "ndjson", level: str = "segments", date_from: Optional[datetime.date] = None,
+                date_to: Optional[datetime.date] = None, status: Optional[str] = None):
+    """
+    Streams every row of level (segments, raw_segments or recordings) uploaded between date_from
+    and date_to (inclusive) with the given status, as ndjson, arrow (IPC stream) or parquet.
+    Rows are read in bounded batches, so the response can be any size.
+    """
+    try:
+        chunks = export.export(SessionLocal, format, level, date_from=date_from, date_to=date_to, status=status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    media_type, extension = export.FORMATS[format]
+    headers = {"Content-Disposition": f'attachment; filename="{level}.{extension}"'}
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
 @app.get("/recordings/{recording_id}", response_model=schemas.RecordingDetail)
 def read_recording(recording_id: int, db: Session = Depends(get_db)):
-    recording = db.query(models.Recording).filter(models.Recording.id == recording_id).first()
+    # Recording and analyzed segments come back in one indexed query
+    recording = db.query(models.Recording).options(
+        joinedload(models.Recording.segments)
+    ).filter(models.Recording.id == recording_id).first()
     if recording is None:
         raise HTTPException(status_code=404, detail="Recording not found")
         
-    # If segments are empty but status is TRANSCRIBED, try to load from JSON
+    # Not analyzed yet: show the raw Whisper segments
     if not recording.segments and recording.status == "TRANSCRIBED":
-        segments_path = f"uploads/{recording.filename}.json"
-        if os.path.exists(segments_path):
-            try:
-                with open(segments_path, "r") as f:
-                    raw_segments = json.load(f)
-                    
-                mapped_segments = []
-                for s in raw_segments:
-                    # Handle both dict keys and object attributes just in case
-                    text = s.get("text", "")
-                    start = s.get("start", 0.0)
-                    end = s.get("end", 0.0)
-                    
-                    mapped_segments.append(schemas.TranscriptSegment(
-                        id=0,
-                        recording_id=recording.id,
-                        speaker=s.get("speaker", "Unknown"),
-                        text=text,
-                        start_time=start,
-                        end_time=end,
-                        sentiment_score=s.get("sentiment_score", 0.0)
-                    ))
-                
-                # We need to return a Pydantic model with these segments attached
-                # We can't modify the SQLAlchemy object's relationship directly without adding to session
-                # So we convert to Pydantic model first
-                recording_detail = schemas.RecordingDetail.model_validate(recording)
-                recording_detail.segments = mapped_segments
-                return recording_detail
-            except Exception as e:
-                print(f"Error loading segments from JSON: {e}")
+        recording_detail = schemas.RecordingDetail.model_validate(recording)
+        recording_detail.segments = [schemas.TranscriptSegment(
+            id=s.id,
+            recording_id=recording.id,
+            speaker=s.speaker,
+            text=s.text,
+            start_time=s.start_time,
+            end_time=s.end_time,
+            sentiment_score=0.0,
+            channel=s.channel,
+            confidence=s.confidence,
+            no_speech_prob=s.no_speech_prob,
+            **{field: getattr(s, field) for field in ACOUSTIC_FIELDS}
+        ) for s in recording.raw_segments]
+        return recording_detail
                 
     return recording
 
+def _recording_audio(db, recording_id: int):
+    recording = db.query(models.Recording).filter(models.Recording.id == recording_id).first()
+    if recording is None:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    file_path = audio_path(recording)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    return recording, file_path
+
+@app.get("/recordings/{recording_id}/peaks")
+async def read_peaks(recording_id: int, request: Request, level: Optional[int] = Query(None, ge=0, lt=len(media.PEAK_LEVELS)),
+                     db: Session = Depends(get_db)):
+    """
+    Min/max waveform peaks as compact int8 binary (layout in media.py), all resolutions or
+    one level. Peaks depend only on the audio content, so the ETag is derived from its hash.
+    """
+    recording, file_path = _recording_audio(db, recording_id)
+    etag = f'"{recording.file_hash or recording.stored_filename}-v{media.PEAKS_VERSION}-{"all" if level is None else level}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    # Built at transcription time; otherwise (e.g. a transcription cache hit) decoded now
+    data = await run_in_threadpool(media.load_peaks, file_path, level)
+    if data is None:
+        raise HTTPException(status_code=422, detail="Audio could not be decoded")
+    return Response(data, media_type="application/octet-stream", headers=headers)
+
+@app.get("/recordings/{recording_id}/audio")
+async def read_audio(recording_id: int, format: str = Query("original", pattern="^(original|opus)$"),
+                     db: Session = Depends(get_db)):
+    """
+    Recording audio with HTTP Range support (206 partial content) for seeking.
+    format=opus serves the low-bitrate Opus rendition, transcoding it on first use.
+    """
+    recording, file_path = _recording_audio(db, recording_id)
+    if format == "opus":
+        try:
+            path = await run_in_threadpool(media.transcode_opus, file_path)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Audio could not be transcoded: {e}")
+        return FileResponse(path, media_type="audio/ogg", headers={"Cache-Control": "public, max-age=86400"})
+    return FileResponse(file_path, filename=recording.filename, content_disposition_type="inline",
+                        headers={"Cache-Control": "public, max-age=86400"})
+
+@app.websocket("/live")
+async def live_transcription(websocket: WebSocket, channels: int = 1, format: str = "pcm16", sample_rate: int = 16000,
+                             filename: Optional[str] = None, analyze: bool = True,
+                             model_size: Optional[str] = None, compute_type: Optional[str] = None):
+    """
+    Live transcription of a call in progress; the protocol is described in live.py.
+    The call becomes a regular recording when the client stops or disconnects.
+    """
+    try:
+        validate_model_options(model_size, compute_type)
+        if not 1 <= channels <= live.LIVE_MAX_CHANNELS:
+            raise ValueError(f"channels must be between 1 and {live.LIVE_MAX_CHANNELS}")
+        if format not in ("pcm16", "opus"):
+            raise ValueError("format must be pcm16 or opus")
+        if format == "pcm16" and not 8000 <= sample_rate <= 48000:
+            raise ValueError("sample_rate must be between 8000 and 48000")
+    except ValueError as e:
+        # 1008: policy violation, the closest close code to a 400
+        await websocket.close(code=1008, reason=str(e))
+        return
+    await websocket.accept()
+    session = live.LiveSession(channels, format, sample_rate, safe_filename(filename) if filename else None,
+                               analyze, model_size, compute_type)
+    await live.serve(websocket, session)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8080, reload=True)
@@ -0,0 +1,179 @@
+"""
+Derived media for the report view: waveform peaks and a low-bitrate Opus rendition.
+
+Both are stored under MEDIA_DIR, named after the content-addressed upload, so duplicate
+uploads share them and they never go stale.
+
+Peaks file layout (little endian):
+    header   "VAPK", version u8, channels u8, sample_rate u32, levels u8
+    levels   samples_per_peak u32, peak count u32         (one per level, finest first)
+    data     int8 [count, channels, (min, max)] per level (samples scaled by 127)
+"""
+import os
+import uuid
+import struct
+import logging
+
+import av
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MEDIA_DIR = os.getenv("MEDIA_DIR", "cache/media")
+SAMPLE_RATE = 16000
+PEAKS_MAGIC = b"VAPK"
+PEAKS_VERSION = 1
+# Samples per peak of each level (16, 64, 256 and 1024 ms at 16 kHz)
+PEAK_LEVELS = (256, 1024, 4096, 16384)
+# Opus rendition streamed instead of the original with /recordings/{id}/audio?format=opus
+OPUS_RENDITION = os.getenv("OPUS_RENDITION", "false") == "true"
+OPUS_BITRATE_KBPS = int(os.getenv("OPUS_BITRATE_KBPS", "24"))
+
+_HEADER = struct.Struct("<4sBBIB")
+_LEVEL = struct.Struct("<II")
+
+
+def peaks_path(audio_file: str):
+    return os.path.join(MEDIA_DIR, os.path.basename(audio_file) + ".peaks")
+
+
+def opus_path(audio_file: str):
+    return os.path.join(MEDIA_DIR, os.path.basename(audio_file) + ".opus")
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+class PeakBuilder:
+    """
+    Accumulates min/max peaks of decoded 16 kHz channel arrays as they are produced, so long
+    recordings never need the whole waveform in memory. Chunks may overlap (chunked
+    transcription); samples already seen are skipped.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.fed = 0
+        self.remainder = None
+        self.blocks = []
+
+    def add(self, channels, offset_samples: int = 0):
+        skip = max(0, self.fed - offset_samples)
+        data = np.stack([np.asarray(ch[skip:], dtype=np.float32) for ch in channels])
+        self.fed = max(self.fed, offset_samples + len(channels[0]))
+        if self.remainder is not None:
+            data = np.concatenate([self.remainder, data], axis=1)
+        base = PEAK_LEVELS[0]
+        usable = data.shape[1] - data.shape[1] % base
+        if usable:
+            frames = data[:, :usable].reshape(data.shape[0], -1, base)
+            self.blocks.append(np.stack([frames.min(axis=2), frames.max(axis=2)], axis=-1).transpose(1, 0, 2))
+        self.remainder = data[:, usable:]
+
+    def finish(self):
+        """The peaks file contents (bytes)."""
+        if self.remainder is not None and self.remainder.shape[1]:
+            tail = self.remainder
+            self.blocks.append(np.stack([tail.min(axis=1), tail.max(axis=1)], axis=-1)[None])
+        if not self.blocks:
+            return None
+        base = np.concatenate(self.blocks)
+        levels = [base]
+        for samples in PEAK_LEVELS[1:]:
+            factor = samples // PEAK_LEVELS[0]
+            padded = -(-len(base) // factor) * factor
+            # Edge padding keeps the last group's min/max unchanged
+            grouped = np.pad(base, ((0, padded - len(base)), (0, 0), (0, 0)), mode="edge")
+            grouped = grouped.reshape(-1, factor, base.shape[1], 2)
+            levels.append(np.stack([grouped[..., 0].min(axis=1), grouped[..., 1].max(axis=1)], axis=-1))
+        return pack_peaks(levels, PEAK_LEVELS, self.sample_rate)
+
+
+def pack_peaks(levels, samples_per_peak, sample_rate: int = SAMPLE_RATE):
+    channels = levels[0].shape[1]
+    parts = [_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, channels, sample_rate, len(levels))]
+    parts += [_LEVEL.pack(samples, len(level)) for samples, level in zip(samples_per_peak, levels)]
+    parts += [np.clip(np.round(level * 127), -128, 127).astype(np.int8).tobytes() for level in levels]
+    return b"".join(parts)
+
+
+def unpack_peaks(data: bytes):
+    """Returns (sample_rate, [(samples_per_peak, int8 array [count, channels, 2]), ...])."""
+    magic, version, channels, sample_rate, count = _HEADER.unpack_from(data)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+        raise ValueError("Unsupported peaks file")
+    position = _HEADER.size
+    headers = []
+    for _ in range(count):
+        headers.append(_LEVEL.unpack_from(data, position))
+        position += _LEVEL.size
+    levels = []
+    for samples, length in headers:
+        size = length * channels * 2
+        levels.append((samples, np.frombuffer(data, np.int8, size, position).reshape(length, channels, 2)))
+        position += size
+    return sample_rate, levels
+
+
+def save_peaks(audio_file: str, data: bytes):
+    if data:
+        _write_atomic(peaks_path(audio_file), data)
+
+
+def compute_peaks(audio_file: str):
+    """Decodes the audio once more to build peaks, e.g. after a transcription cache hit."""
+    from analysis import iter_channel_chunks, CHUNK_SECONDS
+    builder = PeakBuilder()
+    for offset, channels in iter_channel_chunks(audio_file, CHUNK_SECONDS):
+        builder.add(channels, int(round(offset * SAMPLE_RATE)))
+    save_peaks(audio_file, builder.finish())
+
+
+def load_peaks(audio_file: str, level: int = None):
+    """Peaks file contents, built first if missing; with level only that resolution. None if undecodable."""
+    path = peaks_path(audio_file)
+    if not os.path.exists(path):
+        compute_peaks(audio_file)
+        if not os.path.exists(path):
+            return None
+    with open(path, "rb") as f:
+        data = f.read()
+    if level is None:
+        return data
+    sample_rate, levels = unpack_peaks(data)
+    samples, peaks = levels[level]
+    return pack_peaks([peaks.astype(np.float32) / 127], [samples], sample_rate)
+
+
+def transcode_opus(audio_file: str):
+    """Writes the Opus rendition (Ogg, OPUS_BITRATE_KBPS per channel) next to the peaks; returns its path."""
+    path = opus_path(audio_file)
+    if os.path.exists(path):
+        return path
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with av.open(audio_file) as source, av.open(temporary, "w", format="ogg") as target:
+            audio = source.streams.audio[0]
+            layout = "stereo" if audio.channels > 1 else "mono"
+            stream = target.add_stream("libopus", rate=48000, layout=layout)
+            stream.bit_rate = OPUS_BITRATE_KBPS * 1000 * (2 if layout == "stereo" else 1)
+            resampler = av.AudioResampler(format="s16", layout=layout, rate=48000)
+            for frame in source.decode(audio):
+                for resampled in resampler.resample(frame):
+                    target.mux(stream.encode(resampled))
+            for resampled in resampler.resample(None):
+                target.mux(stream.encode(resampled))
+            target.mux(stream.encode(None))
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    logger.info("Opus rendition of %s: %.1f MB -> %.1f MB", audio_file,
+                os.path.getsize(audio_file) / 1e6, os.path.getsize(path) / 1e6)
+    return path
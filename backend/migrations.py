@@ -0,0 +1,161 @@
+"""
+Schema migrations for the SQLite database.
+
+Base.metadata.create_all() creates missing tables but never changes existing ones, so
+columns and indexes added after a table first shipped are applied here, once, in order.
+Each migration must be idempotent: on a fresh database create_all has already built the
+current schema and the migration only records itself as applied.
+"""
+import os
+import json
+import logging
+import datetime
+from sqlalchemy import inspect, text
+
+from uploads import UPLOAD_DIR
+from acoustics import ACOUSTIC_FIELDS
+import search
+import stats
+
+logger = logging.getLogger(__name__)
+
+
+def _add_column(conn, table, column, ddl):
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _001_recording_file_hash(conn):
+    _add_column(conn, "recordings", "stored_filename", "VARCHAR")
+    _add_column(conn, "recordings", "file_hash", "VARCHAR")
+    _add_column(conn, "recordings", "file_size", "INTEGER")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_recordings_file_hash ON recordings (file_hash)"))
+
+
+def _002_segment_metadata(conn):
+    _add_column(conn, "transcript_segments", "channel", "INTEGER")
+    _add_column(conn, "transcript_segments", "confidence", "FLOAT")
+    _add_column(conn, "transcript_segments", "no_speech_prob", "FLOAT")
+    _add_column(conn, "transcript_segments", "words", "VARCHAR")
+
+
+def _003_import_segment_sidecars(conn):
+    """
+    Raw segments used to live in uploads/<file>.json sidecars. Import them into raw_segments
+    so reads no longer touch the filesystem. The sidecar files are left in place.
+    """
+    recordings = conn.execute(text(
+        "SELECT id, COALESCE(stored_filename, filename) FROM recordings "
+        "WHERE id NOT IN (SELECT DISTINCT recording_id FROM raw_segments)"
+    )).fetchall()
+    imported = 0
+    for recording_id, filename in recordings:
+        path = os.path.join(UPLOAD_DIR, f"{filename}.json")
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r") as f:
+                segments = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping unreadable sidecar %s: %s", path, e)
+            continue
+        rows = [{
+            "recording_id": recording_id,
+            "channel": s.get("channel"),
+            "speaker": s.get("speaker", "Unknown"),
+            "text": s.get("text", ""),
+            "start_time": s.get("start", 0.0),
+            "end_time": s.get("end", 0.0),
+            "confidence": s.get("confidence"),
+            "no_speech_prob": s.get("no_speech_prob"),
+        } for s in segments]
+        if rows:
+            conn.execute(text(
+                "INSERT INTO raw_segments (recording_id, channel, speaker, text, start_time, end_time, confidence, no_speech_prob) "
+                "VALUES (:recording_id, :channel, :speaker, :text, :start_time, :end_time, :confidence, :no_speech_prob)"
+            ), rows)
+            imported += 1
+    if imported:
+        logger.info("Imported segment sidecars of %d recording(s)", imported)
+
+
+def _004_query_indexes(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_recordings_upload_date_id ON recordings (upload_date, id)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_recordings_status_upload_date_id ON recordings (status, upload_date, id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transcript_segments_recording_start ON transcript_segments (recording_id, start_time)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_jobs_status_run_after ON jobs (status, run_after, id)"))
+    # Refresh planner statistics so the new indexes are picked up
+    conn.execute(text("ANALYZE"))
+
+
+
+def _005_acoustic_features(conn):
+    for table in ("raw_segments", "transcript_segments"):
+        for column in ACOUSTIC_FIELDS:
+            _add_column(conn, table, column, "FLOAT")
+
+
+def _006_segment_search(conn):
+    """Full-text index of existing segments; later writes keep it in sync (search.py)."""
+    if search.available(conn):
+        count = search.rebuild(conn)
+        if count:
+            logger.info("Indexed %d segments for search", count)
+
+
+def _007_recording_stats(conn):
+    # The table itself is new, so create_all has built it
+    stats.rebuild(conn)
+
+
+def _008_recording_skipped_seconds(conn):
+    _add_column(conn, "recordings", "skipped_seconds", "FLOAT")
+
+
+def _009_recording_search(conn):
+    """One full-text document per recording, built from segment_search (search.py)."""
+    if search.available(conn):
+        count = search.rebuild_recordings(conn)
+        if count:
+            logger.info("Indexed %d recordings for search", count)
+
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS = [
+    (1, "recordings: stored_filename, file_hash, file_size", _001_recording_file_hash),
+    (2, "transcript_segments: channel, confidence, no_speech_prob, words", _002_segment_metadata),
+    (3, "import uploads/*.json segment sidecars into raw_segments", _003_import_segment_sidecars),
+    (4, "indexes for recording listing, segment lookup and job claiming", _004_query_indexes),
+    (5, "raw_segments, transcript_segments: acoustic features", _005_acoustic_features),
+    (6, "segment_search: FTS5 index over segments", _006_segment_search),
+    (7, "recording_stats: dashboard rollups of existing recordings", _007_recording_stats),
+    (8, "recordings: skipped_seconds", _008_recording_skipped_seconds),
+    (9, "recording_search: FTS5 index of whole transcripts", _009_recording_search),
+]
+
+
+def run_migrations(engine):
+    """Applies pending migrations. Returns the list of applied versions."""
+    applied_now = []
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations "
+            "(version INTEGER PRIMARY KEY, description VARCHAR, applied_at DATETIME)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+        for version, description, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info("Applying migration %d: %s", version, description)
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.datetime.utcnow()}
+            )
+            applied_now.append(version)
+    return applied_now
@@ -0,0 +1,175 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEVICE = "cuda" if os.getenv("USE_GPU") == "true" else "cpu"
+DEFAULT_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "large-v3")
+DEFAULT_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "float16" if DEVICE == "cuda" else "int8")
+# Total resident size the registry may keep loaded before evicting least recently used models
+MEMORY_BUDGET_MB = float(os.getenv("WHISPER_MEMORY_BUDGET_MB", "6000"))
+# Models unused for this long are dropped even when the budget is not exceeded (0 disables)
+IDLE_TIMEOUT_SECONDS = float(os.getenv("WHISPER_IDLE_TIMEOUT_SECONDS", "1800"))
+
+ALLOWED_MODEL_SIZES = tuple(os.getenv(
+    "WHISPER_ALLOWED_MODELS", "tiny,base,small,medium,large-v2,large-v3,turbo"
+).split(","))
+ALLOWED_COMPUTE_TYPES = ("int8", "int8_float16", "int8_float32", "float16", "float32", "default")
+
+# Rough int8 footprints, used until a model has been loaded and measured
+ESTIMATED_SIZE_MB = {
+    "tiny": 80,
+    "base": 150,
+    "small": 500,
+    "medium": 1500,
+    "large-v2": 3100,
+    "large-v3": 3100,
+    "turbo": 1700,
+}
+
+
+def _rss_mb():
+    """Current resident set size of this process in MB (Linux), or None if unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class LoadedModel:
+    def __init__(self, key, model, load_seconds, size_mb):
+        self.key = key
+        self.model = model
+        self.load_seconds = load_seconds
+        self.size_mb = size_mb
+        self.loaded_at = time.time()
+        self.last_used = time.time()
+        self.uses = 0
+
+
+class ModelRegistry:
+    """
+    Loads Whisper models on first use and keeps them for reuse within the process.
+    Models are keyed by (size, compute type, cpu_threads, num_workers) and evicted
+    least-recently-used first when the memory budget would be exceeded.
+    """
+
+    def __init__(self, memory_budget_mb: float = MEMORY_BUDGET_MB, idle_timeout: float = IDLE_TIMEOUT_SECONDS,
+                 device: str = DEVICE):
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_timeout = idle_timeout
+        self.device = device
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def get(self, model_size: str = None, compute_type: str = None, cpu_threads: int = 0, num_workers: int = 1):
+        """Returns a loaded WhisperModel, loading (and evicting others) if needed."""
+        model_size = model_size or DEFAULT_MODEL_SIZE
+        compute_type = compute_type or DEFAULT_COMPUTE_TYPE
+        key = (model_size, compute_type, cpu_threads, num_workers)
+
+        with self._lock:
+            self._evict_idle()
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                entry.last_used = time.time()
+                entry.uses += 1
+                return entry.model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Load outside the registry lock so other models stay usable; the per-key lock
+        # makes concurrent first requests for the same model wait for a single load
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    entry.last_used = time.time()
+                    entry.uses += 1
+                    return entry.model
+                self._make_room(ESTIMATED_SIZE_MB.get(model_size, 0))
+
+            entry = self._load(key)
+            with self._lock:
+                self._models[key] = entry
+                entry.uses += 1
+            return entry.model
+
+    def _load(self, key):
+        # Imported lazily: importing faster_whisper pulls in CTranslate2 and is not free either
+        from faster_whisper import WhisperModel
+
+        model_size, compute_type, cpu_threads, num_workers = key
+        logger.info("Loading model: %s (%s, %s)", model_size, self.device, compute_type)
+        rss_before = _rss_mb()
+        started = time.perf_counter()
+        model = WhisperModel(model_size, device=self.device, compute_type=compute_type,
+                             cpu_threads=cpu_threads, num_workers=num_workers)
+        load_seconds = time.perf_counter() - started
+        rss_after = _rss_mb()
+
+        size_mb = ESTIMATED_SIZE_MB.get(model_size, 0)
+        if self.device == "cpu" and rss_before is not None and rss_after is not None and rss_after > rss_before:
+            size_mb = rss_after - rss_before
+        logger.info("Model %s loaded in %.1fs (~%.0f MB)", model_size, load_seconds, size_mb)
+        return LoadedModel(key, model, load_seconds, size_mb)
+
+    def _make_room(self, needed_mb: float):
+        while self._models and self.resident_mb() + needed_mb > self.memory_budget_mb:
+            key, entry = self._models.popitem(last=False)
+            logger.info("Evicting model %s (%s) to stay within memory budget", key[0], key[1])
+
+    def _evict_idle(self):
+        if not self.idle_timeout:
+            return
+        cutoff = time.time() - self.idle_timeout
+        for key in [k for k, e in self._models.items() if e.last_used < cutoff]:
+            logger.info("Evicting idle model %s (%s)", key[0], key[1])
+            del self._models[key]
+
+    def resident_mb(self):
+        return sum(entry.size_mb for entry in self._models.values())
+
+    def evict(self, model_size: str = None, compute_type: str = None):
+        """Drops matching models (all models if no filter is given). Returns the number evicted."""
+        with self._lock:
+            keys = [k for k in self._models
+                    if (model_size is None or k[0] == model_size) and (compute_type is None or k[1] == compute_type)]
+            for key in keys:
+                del self._models[key]
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "device": self.device,
+                "memory_budget_mb": self.memory_budget_mb,
+                "resident_mb": round(self.resident_mb(), 1),
+                "models": [{
+                    "model_size": e.key[0],
+                    "compute_type": e.key[1],
+                    "cpu_threads": e.key[2],
+                    "num_workers": e.key[3],
+                    "load_seconds": round(e.load_seconds, 2),
+                    "resident_mb": round(e.size_mb, 1),
+                    "uses": e.uses,
+                    "idle_seconds": round(time.time() - e.last_used, 1),
+                } for e in reversed(self._models.values())]
+            }
+
+
+def validate_model_options(model_size: str = None, compute_type: str = None):
+    """Raises ValueError for model sizes or compute types this deployment does not serve."""
+    if model_size is not None and model_size not in ALLOWED_MODEL_SIZES:
+        raise ValueError(f"Unsupported model size: {model_size}")
+    if compute_type is not None and compute_type not in ALLOWED_COMPUTE_TYPES:
+        raise ValueError(f"Unsupported compute type: {compute_type}")
+
+
+registry = ModelRegistry()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Date, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -6,19 +6,30 @@ import datetime
 
 class Recording(Base):
     __tablename__ = "recordings"
+    __table_args__ = (
+        # Newest-first listing and keyset pagination, optionally filtered by status
+        Index("ix_recordings_upload_date_id", "upload_date", "id"),
+        Index("ix_recordings_status_upload_date_id", "status", "upload_date", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    filename = Column(String, index=True)
+    filename = Column(String, index=True) # Client filename, for display
+    stored_filename = Column(String, nullable=True) # Content-addressed name under uploads/
+    file_hash = Column(String, nullable=True, index=True) # SHA-256 of the audio bytes
+    file_size = Column(Integer, nullable=True)
     upload_date = Column(DateTime, default=datetime.datetime.utcnow)
     status = Column(String, default="UPLOADED") # UPLOADED, TRANSCRIBED, COMPLETED
     transcript_text = Column(String, nullable=True) # Full raw transcript
     duration = Column(Float) # in seconds
     average_sentiment = Column(Float) # 0.0 to 1.0
+    skipped_seconds = Column(Float, nullable=True) # Audio (all channels) the speech pre-pass kept from Whisper
 
-    segments = relationship("TranscriptSegment", back_populates="recording")
+    segments = relationship("TranscriptSegment", back_populates="recording", order_by="TranscriptSegment.start_time")
+    raw_segments = relationship("RawSegment", back_populates="recording", order_by="RawSegment.start_time")
 
 class TranscriptSegment(Base):
     __tablename__ = "transcript_segments"
+    __table_args__ = (Index("ix_transcript_segments_recording_start", "recording_id", "start_time"),)
 
     id = Column(Integer, primary_key=True, index=True)
     recording_id = Column(Integer, ForeignKey("recordings.id"))
@@ -27,5 +38,124 @@ class TranscriptSegment(Base):
     start_time = Column(Float)
     end_time = Column(Float)
     sentiment_score = Column(Float)
+    channel = Column(Integer, nullable=True) # Source channel in stereo recordings
+    confidence = Column(Float, nullable=True) # exp(avg_logprob) from Whisper
+    no_speech_prob = Column(Float, nullable=True)
+    words = Column(String, nullable=True) # Compact JSON: [[start, end, word, probability], ...]
+    # Acoustic features (acoustics.py); None where they could not be computed
+    rms_db = Column(Float, nullable=True) # Mean energy, dBFS
+    pitch_mean = Column(Float, nullable=True) # Hz, over voiced frames
+    pitch_std = Column(Float, nullable=True)
+    speaking_rate = Column(Float, nullable=True) # Syllables per second
+    silence_ratio = Column(Float, nullable=True) # Share of the segment below the silence threshold
+    overlap_ratio = Column(Float, nullable=True) # Share where another channel speaks too (stereo only)
 
     recording = relationship("Recording", back_populates="segments")
+
+class RawSegment(Base):
+    """Whisper output kept between transcription and analysis."""
+    __tablename__ = "raw_segments"
+    __table_args__ = (Index("ix_raw_segments_recording_start", "recording_id", "start_time"),)
+
+    id = Column(Integer, primary_key=True)
+    recording_id = Column(Integer, ForeignKey("recordings.id"))
+    channel = Column(Integer, nullable=True)
+    speaker = Column(String) # Channel based label ("Customer", "Agent") or "Unknown"
+    text = Column(String)
+    start_time = Column(Float)
+    end_time = Column(Float)
+    confidence = Column(Float, nullable=True)
+    no_speech_prob = Column(Float, nullable=True)
+    words = Column(String, nullable=True) # Compact JSON: [[start, end, word, probability], ...]
+    # Acoustic features (acoustics.py); None where they could not be computed
+    rms_db = Column(Float, nullable=True) # Mean energy, dBFS
+    pitch_mean = Column(Float, nullable=True) # Hz, over voiced frames
+    pitch_std = Column(Float, nullable=True)
+    speaking_rate = Column(Float, nullable=True) # Syllables per second
+    silence_ratio = Column(Float, nullable=True) # Share of the segment below the silence threshold
+    overlap_ratio = Column(Float, nullable=True) # Share where another channel speaks too (stereo only)
+
+    recording = relationship("Recording", back_populates="raw_segments")
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_run_after", "status", "run_after", "id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String) # "transcribe", "analyze", "ingest"
+    recording_id = Column(Integer, ForeignKey("recordings.id"), index=True) # None for "ingest" (batch in payload)
+    payload = Column(String, nullable=True) # JSON encoded job options
+    status = Column(String, default="QUEUED", index=True) # QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED
+    progress = Column(Float, default=0.0) # 0.0 to 1.0
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    error = Column(String, nullable=True)
+    run_after = Column(DateTime, default=datetime.datetime.utcnow) # Retry backoff
+    worker_id = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    recording = relationship("Recording")
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True) # Random hex id, also the partial file name
+    filename = Column(String)
+    total_size = Column(Integer)
+    received_size = Column(Integer, default=0)
+    status = Column(String, default="ACTIVE") # ACTIVE, RECEIVING (a range is being written), COMPLETED
+    recording_id = Column(Integer, ForeignKey("recordings.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class Batch(Base):
+    __tablename__ = "batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String) # Directory or manifest file the recordings come from
+    analyze = Column(Boolean, default=True) # Queue LLM analysis after transcription
+    options = Column(String, nullable=True) # JSON encoded transcription options
+    status = Column(String, default="PENDING") # PENDING, INGESTING, INGESTED
+    total_files = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    ingested_at = Column(DateTime, nullable=True)
+
+    items = relationship("BatchItem", back_populates="batch", order_by="BatchItem.id")
+
+class BatchItem(Base):
+    """One source file of a batch; its status is the ingestion checkpoint."""
+    __tablename__ = "batch_items"
+    __table_args__ = (Index("ix_batch_items_batch_status", "batch_id", "status"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, ForeignKey("batches.id"))
+    path = Column(String)
+    status = Column(String, default="PENDING") # PENDING, INGESTED, DUPLICATE, FAILED
+    recording_id = Column(Integer, ForeignKey("recordings.id"), nullable=True)
+    error = Column(String, nullable=True)
+
+    batch = relationship("Batch", back_populates="items")
+    recording = relationship("Recording")
+
+class RecordingStats(Base):
+    """
+    Dashboard rollup of the recordings uploaded on a day that are in a status (stats.py).
+    Updated incrementally as recordings are created, transcribed and analyzed.
+    """
+    __tablename__ = "recording_stats"
+
+    day = Column(Date, primary_key=True) # Upload day (UTC)
+    status = Column(String, primary_key=True)
+    calls = Column(Integer, default=0)
+    audio_seconds = Column(Float, default=0.0)
+    # Analyzed (COMPLETED) recordings only
+    sentiment_sum = Column(Float, default=0.0) # Sum of average_sentiment
+    negative = Column(Integer, default=0)
+    neutral = Column(Integer, default=0)
+    positive = Column(Integer, default=0)
+    agent_seconds = Column(Float, default=0.0) # Talk time of analyzed segments by speaker
+    customer_seconds = Column(Float, default=0.0)
+    other_seconds = Column(Float, default=0.0)
@@ -0,0 +1,132 @@
+"""
+Speech pre-pass: cuts the audio Whisper would only waste time on before decoding.
+
+Every 20 ms frame of a decoded channel gets three cheap features, computed on strided
+frame views with batched FFTs:
+
+    energy       dBFS; below PREPASS_SILENCE_DB the frame is silence
+    flatness     spectral flatness (geometric / arithmetic mean of the power spectrum,
+                 300 Hz - 4 kHz); noise and line hiss are flat, voiced speech is not
+    modulation   standard deviation of the energy over the surrounding second; speech
+                 rises and falls with every syllable, hold music and tones stay level
+
+Stretches of at least PREPASS_MIN_GAP_SECONDS where no frame looks like speech are cut;
+the kept regions (padded by PREPASS_PAD_SECONDS) are joined with a short silence and
+decoded as one array. The offset map turns times in that array back into times in the
+channel. A channel with no speech at all is not decoded.
+
+IVR prompts are speech and are kept. Whisper's own VAD still runs on what is left.
+"""
+import os
+import bisect
+
+import numpy as np
+
+from acoustics import frame_view
+
+SAMPLE_RATE = 16000
+# Opt-in until the thresholds are tuned on the deployment's own calls (benchmarks/bench_prepass.py)
+PREPASS = os.getenv("SPEECH_PREPASS", "false") == "true"
+PREPASS_SILENCE_DB = float(os.getenv("PREPASS_SILENCE_DB", "-50"))
+PREPASS_MAX_FLATNESS = float(os.getenv("PREPASS_MAX_FLATNESS", "0.5"))
+PREPASS_MIN_MODULATION_DB = float(os.getenv("PREPASS_MIN_MODULATION_DB", "3"))
+PREPASS_MIN_GAP_SECONDS = float(os.getenv("PREPASS_MIN_GAP_SECONDS", "2.0"))
+PREPASS_PAD_SECONDS = float(os.getenv("PREPASS_PAD_SECONDS", "0.3"))
+
+# 32 ms analysis frames every 20 ms
+FRAME_SAMPLES = 512
+HOP_SAMPLES = 320
+# Energy modulation window (frames)
+MODULATION_FRAMES = 50
+# Speech band for the flatness, as rfft bins of FRAME_SAMPLES
+FLATNESS_BINS = slice(int(300 * FRAME_SAMPLES / SAMPLE_RATE), int(4000 * FRAME_SAMPLES / SAMPLE_RATE) + 1)
+# Frames per FFT batch; bounds the temporary arrays for hour-long channels
+BLOCK_FRAMES = 4096
+# Silence between joined regions, so Whisper does not run words of two regions together
+JOIN_SECONDS = 0.2
+
+
+def frame_features(audio):
+    """(energy dB, spectral flatness, energy modulation dB) per HOP_SAMPLES frame."""
+    frames = frame_view(audio, FRAME_SAMPLES, HOP_SAMPLES)
+    energy = 10.0 * np.log10(np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / FRAME_SAMPLES + 1e-10)
+    flatness = np.ones(len(frames))
+    window = np.hanning(FRAME_SAMPLES).astype(np.float32)
+    # Silent frames are non-speech already; only the others need a spectrum
+    loud = np.flatnonzero(energy > PREPASS_SILENCE_DB)
+    for start in range(0, len(loud), BLOCK_FRAMES):
+        rows = loud[start:start + BLOCK_FRAMES]
+        power = np.abs(np.fft.rfft(frames[rows] * window, axis=1))[:, FLATNESS_BINS] ** 2 + 1e-12
+        flatness[rows] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+    # Centered moving standard deviation from prefix sums
+    half = MODULATION_FRAMES // 2
+    padded = np.pad(energy, half, mode="edge")
+    sums = np.concatenate([[0.0], np.cumsum(padded)])
+    squares = np.concatenate([[0.0], np.cumsum(padded ** 2)])
+    width = 2 * half + 1
+    mean = (sums[width:] - sums[:-width]) / width
+    modulation = np.sqrt(np.maximum((squares[width:] - squares[:-width]) / width - mean ** 2, 0.0))
+    return energy, flatness, modulation
+
+
+def speech_regions(audio):
+    """(start, end) sample ranges of a 16 kHz channel to decode; [] when there is no speech."""
+    energy, flatness, modulation = frame_features(audio)
+    speech = ((energy > PREPASS_SILENCE_DB) & (flatness < PREPASS_MAX_FLATNESS)
+              & (modulation >= PREPASS_MIN_MODULATION_DB))
+    if not speech.any():
+        return []
+    # Runs of speech frames as [first, last + 1)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], speech.astype(np.int8), [0]])))
+    pad = int(PREPASS_PAD_SECONDS * SAMPLE_RATE)
+    min_gap = int(PREPASS_MIN_GAP_SECONDS * SAMPLE_RATE)
+    regions = []
+    for first, last in zip(edges[::2], edges[1::2]):
+        start = max(0, first * HOP_SAMPLES - pad)
+        end = min(len(audio), (last - 1) * HOP_SAMPLES + FRAME_SAMPLES + pad)
+        # Short pauses are not worth a cut
+        if regions and start - regions[-1][1] < min_gap:
+            regions[-1][1] = max(regions[-1][1], end)
+        else:
+            regions.append([start, end])
+    if regions[0][0] < min_gap:
+        regions[0][0] = 0
+    if len(audio) - regions[-1][1] < min_gap:
+        regions[-1][1] = len(audio)
+    return [tuple(region) for region in regions]
+
+
+class OffsetMap:
+    """Maps times in the joined speech regions back to times in the channel."""
+
+    def __init__(self, regions):
+        self.starts, self.originals, self.lengths = [], [], []
+        position = 0
+        for start, end in regions:
+            self.starts.append(position / SAMPLE_RATE)
+            self.originals.append(start / SAMPLE_RATE)
+            self.lengths.append((end - start) / SAMPLE_RATE)
+            position += end - start + int(JOIN_SECONDS * SAMPLE_RATE)
+
+    def original_time(self, t: float):
+        i = max(0, bisect.bisect_right(self.starts, t) - 1)
+        # Times in the silence after a region belong to its end
+        return self.originals[i] + min(max(t - self.starts[i], 0.0), self.lengths[i])
+
+    def restore(self, segment, offset: float = 0.0):
+        """Moves a segment dict (and its words) from joined times to channel times plus offset, in place."""
+        segment["start"] = round(self.original_time(segment["start"]) + offset, 2)
+        segment["end"] = round(self.original_time(segment["end"]) + offset, 2)
+        segment["words"] = [[round(self.original_time(w[0]) + offset, 2), round(self.original_time(w[1]) + offset, 2),
+                             *w[2:]] for w in segment.get("words") or []]
+        return segment
+
+
+def join_regions(audio, regions):
+    """The regions of audio joined with JOIN_SECONDS of silence, and their OffsetMap."""
+    gap = np.zeros(int(JOIN_SECONDS * SAMPLE_RATE), dtype=audio.dtype)
+    parts = []
+    for start, end in regions:
+        parts += [audio[start:end], gap]
+    return np.concatenate(parts[:-1]), OffsetMap(regions)
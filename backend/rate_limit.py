@@ -0,0 +1,67 @@
+import os
+import time
+import sqlite3
+
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "cache/rate_limits.db")
+# Capacity that may be used at once after an idle period, in seconds of the configured rate
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "5"))
+
+
+class RateLimiter:
+    """
+    Rate limiter shared by the API and all worker processes (GCRA over a small SQLite file).
+    Each name keeps the time its budget is booked up to; reserve() books `cost` units at
+    `per_minute` and returns how many seconds the caller must wait before spending them.
+    Reservations are first come, first served, so waiting callers never starve each other.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_PATH, burst_seconds: float = RATE_LIMIT_BURST_SECONDS):
+        self.path = path
+        self.burst_seconds = burst_seconds
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, booked_until REAL NOT NULL)")
+            self._initialized = True
+        return conn
+
+    def reserve(self, name: str, cost: float, per_minute: float):
+        """Books capacity and returns the delay in seconds (0.0 when per_minute <= 0, i.e. unlimited)."""
+        if per_minute <= 0:
+            return 0.0
+        interval = 60.0 / per_minute
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front so concurrent processes book one after another
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute("SELECT booked_until FROM buckets WHERE name = ?", (name,)).fetchone()
+            start = max(row[0], now) if row else now
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, booked_until) VALUES (?, ?)",
+                (name, start + cost * interval)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return max(0.0, start - self.burst_seconds - now)
+
+    def reset(self, name: str = None):
+        conn = self._connect()
+        try:
+            if name is None:
+                conn.execute("DELETE FROM buckets")
+            else:
+                conn.execute("DELETE FROM buckets WHERE name = ?", (name,))
+        finally:
+            conn.close()
+
+
+rate_limiter = RateLimiter()
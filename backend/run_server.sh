@@ -8,6 +8,10 @@ if [ -d "venv" ]; then
     source venv/bin/activate
 fi
 
+# Metrics files of a previous run would otherwise be added to this run's totals; the API
+# and its workers share the directory, so it is cleaned here, once, before any of them starts
+python3 -c "import telemetry; telemetry.reset_metrics()"
+
 # Run the app
 echo "Starting backend on http://localhost:8080..."
 python3 main.py
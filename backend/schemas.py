@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
+from typing import Dict, List, Optional
+from datetime import datetime, date
 
 class TranscriptSegmentBase(BaseModel):
     speaker: str
@@ -15,6 +15,15 @@ class TranscriptSegmentCreate(TranscriptSegmentBase):
 class TranscriptSegment(TranscriptSegmentBase):
     id: int
     recording_id: int
+    channel: Optional[int] = None
+    confidence: Optional[float] = None
+    no_speech_prob: Optional[float] = None
+    rms_db: Optional[float] = None
+    pitch_mean: Optional[float] = None
+    pitch_std: Optional[float] = None
+    speaking_rate: Optional[float] = None
+    silence_ratio: Optional[float] = None
+    overlap_ratio: Optional[float] = None
 
     class Config:
         from_attributes = True
@@ -27,15 +36,118 @@ class RecordingBase(BaseModel):
 class RecordingCreate(RecordingBase):
     pass
 
-class Recording(RecordingBase):
+class RecordingSummary(RecordingBase):
+    """List view: everything but the transcript text."""
     id: int
     duration: float
     status: str
-    transcript_text: Optional[str] = None
+    stored_filename: Optional[str] = None
+    file_hash: Optional[str] = None
+    file_size: Optional[int] = None
     upload_date: datetime
+    skipped_seconds: Optional[float] = None
 
     class Config:
         from_attributes = True
 
+class Recording(RecordingSummary):
+    transcript_text: Optional[str] = None
+
 class RecordingDetail(Recording):
     segments: List[TranscriptSegment] = []
+
+class SearchHit(BaseModel):
+    start_time: float
+    end_time: float
+    speaker: str
+    sentiment_score: Optional[float] = None # None until the recording is analyzed
+    snippet: str
+
+class SearchResult(BaseModel):
+    recording_id: int
+    filename: str
+    upload_date: datetime
+    status: str
+    duration: Optional[float] = None
+    score: float
+    matches: int
+    hits: List[SearchHit] = []
+
+class DayStats(BaseModel):
+    day: date
+    calls: int
+    audio_hours: float
+    average_sentiment: Optional[float] = None
+
+class SentimentStats(BaseModel):
+    average: Optional[float] = None
+    negative: int
+    neutral: int
+    positive: int
+
+class TalkStats(BaseModel):
+    agent_seconds: float
+    customer_seconds: float
+    other_seconds: float
+    agent_ratio: Optional[float] = None # Agent share of Agent + Customer talk time
+
+class Stats(BaseModel):
+    total_calls: int
+    analyzed_calls: int
+    audio_hours: float
+    status_counts: Dict[str, int]
+    sentiment: SentimentStats
+    talk: TalkStats
+    per_day: List[DayStats]
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    recording_id: Optional[int] = None
+    status: str
+    progress: float
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    total_size: int
+
+class UploadSession(BaseModel):
+    id: str
+    filename: str
+    total_size: int
+    received_size: int
+    status: str
+    recording_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class BatchCreate(BaseModel):
+    directory: Optional[str] = None
+    manifest: Optional[str] = None
+    analyze: bool = True
+    model_size: Optional[str] = None
+    compute_type: Optional[str] = None
+    batch_size: Optional[int] = None
+    cascade: Optional[bool] = None
+
+class Batch(BaseModel):
+    id: int
+    source: str
+    analyze: bool
+    status: str
+    total_files: int
+    created_at: datetime
+    ingested_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,311 @@
+"""
+Full-text search over transcript segments with an SQLite FTS5 index.
+
+The segment_search table holds one row per segment of every recording: its analyzed
+segments once analysis has run, its raw Whisper segments before that. crud keeps it in
+sync in the same transaction as the segment writes. Row ids are
+(recording_id << ROWID_BITS) + n, so the rows of a recording are one rowid range and are
+replaced or filtered by recording without a scan.
+
+recording_search holds one document per recording (rowid = recording id), the text of its
+indexed segments, rewritten whenever they change. Searches rank these documents, so the
+cost grows with the number of matching recordings rather than matching segments; the
+segments are then only read for the recordings returned.
+
+Usage (from backend/):
+    python search.py --rebuild                                # rebuild the index from the segment tables
+    python search.py "iade talebi" --speaker Customer         # ranked recordings with their hits
+"""
+import re
+import sys
+import json
+import logging
+import datetime
+import argparse
+
+from sqlalchemy import text, bindparam
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = "segment_search"
+RECORDING_TABLE = "recording_search"
+# Room for 2^20 segments per recording in the row id
+ROWID_BITS = 20
+SNIPPET_TOKENS = 16
+HIGHLIGHT = ("<mark>", "</mark>")
+
+# remove_diacritics folds e.g. "gunler" and "günler" together; prefix indexes speed up "word*" queries
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "text, speaker UNINDEXED, start_time UNINDEXED, end_time UNINDEXED, sentiment_score UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+CREATE_RECORDINGS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {RECORDING_TABLE} USING fts5("
+    "text, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+_INSERT_SQL = text(
+    f"INSERT INTO {SEARCH_TABLE} (rowid, text, speaker, start_time, end_time, sentiment_score) "
+    "VALUES (:rowid, :text, :speaker, :start_time, :end_time, :sentiment_score)"
+)
+
+
+def available(db):
+    """FTS5 search is SQLite only; with other databases indexing is skipped."""
+    bind = db.get_bind() if hasattr(db, "get_bind") else db
+    return bind.dialect.name == "sqlite"
+
+
+def _rowid_range(recording_id: int):
+    return recording_id << ROWID_BITS, ((recording_id + 1) << ROWID_BITS) - 1
+
+
+def _has_analyzed_segments(db, recording_id: int):
+    return db.execute(text("SELECT 1 FROM transcript_segments WHERE recording_id = :id LIMIT 1"),
+                      {"id": recording_id}).first() is not None
+
+
+def delete_recording(db, recording_id: int):
+    low, high = _rowid_range(recording_id)
+    db.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid BETWEEN :low AND :high"), {"low": low, "high": high})
+    db.execute(text(f"DELETE FROM {RECORDING_TABLE} WHERE rowid = :id"), {"id": recording_id})
+
+
+def _index_recording(db, recording_id: int):
+    """Rewrites the recording's document from its rows in segment_search."""
+    low, high = _rowid_range(recording_id)
+    db.execute(text(f"DELETE FROM {RECORDING_TABLE} WHERE rowid = :id"), {"id": recording_id})
+    db.execute(text(
+        f"INSERT INTO {RECORDING_TABLE} (rowid, text) SELECT :id, group_concat(text, ' ') "
+        f"FROM {SEARCH_TABLE} WHERE rowid BETWEEN :low AND :high HAVING count(*) > 0"
+    ), {"id": recording_id, "low": low, "high": high})
+
+
+def append_segments(db, recording_id: int, rows):
+    """Indexes segment rows (crud's column dicts) after those already indexed for the recording."""
+    if not rows:
+        return
+    low, high = _rowid_range(recording_id)
+    last = db.execute(text(f"SELECT max(rowid) FROM {SEARCH_TABLE} WHERE rowid BETWEEN :low AND :high"),
+                      {"low": low, "high": high}).scalar()
+    first = low if last is None else last + 1
+    db.execute(_INSERT_SQL, [{
+        "rowid": first + i,
+        "text": r["text"],
+        "speaker": r["speaker"],
+        "start_time": r["start_time"],
+        "end_time": r["end_time"],
+        "sentiment_score": r.get("sentiment_score"),
+    } for i, r in enumerate(rows)])
+    _index_recording(db, recording_id)
+
+
+def index_raw_segments(db, recording_id: int, rows, replace: bool = False):
+    """Raw segments are only searchable until the recording has analyzed segments."""
+    if not available(db) or _has_analyzed_segments(db, recording_id):
+        return
+    if replace:
+        delete_recording(db, recording_id)
+    append_segments(db, recording_id, rows)
+
+
+def index_analyzed_segments(db, recording_id: int, rows):
+    if not available(db):
+        return
+    delete_recording(db, recording_id)
+    append_segments(db, recording_id, rows)
+
+
+def rebuild(db):
+    """Recreates the index from transcript_segments and raw_segments. Returns the indexed segment count."""
+    db.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+    db.execute(text(CREATE_SQL))
+    columns = "text, speaker, start_time, end_time"
+    rowid = f"(recording_id << {ROWID_BITS}) + row_number() OVER (PARTITION BY recording_id ORDER BY start_time, id) - 1"
+    db.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, {columns}, sentiment_score) "
+        f"SELECT {rowid}, {columns}, sentiment_score FROM transcript_segments"
+    ))
+    db.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, {columns}, sentiment_score) "
+        f"SELECT {rowid}, {columns}, NULL FROM raw_segments "
+        "WHERE recording_id NOT IN (SELECT recording_id FROM transcript_segments)"
+    ))
+    # Merges the b-tree segments written by the bulk insert
+    db.execute(text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')"))
+    rebuild_recordings(db)
+    return db.execute(text(f"SELECT count(*) FROM {SEARCH_TABLE}")).scalar()
+
+
+def rebuild_recordings(db):
+    """Recreates the recording documents from segment_search. Returns the indexed recording count."""
+    db.execute(text(f"DROP TABLE IF EXISTS {RECORDING_TABLE}"))
+    db.execute(text(CREATE_RECORDINGS_SQL))
+    db.execute(text(
+        f"INSERT INTO {RECORDING_TABLE} (rowid, text) "
+        f"SELECT rowid >> {ROWID_BITS}, group_concat(text, ' ') FROM {SEARCH_TABLE} GROUP BY rowid >> {ROWID_BITS}"
+    ))
+    db.execute(text(f"INSERT INTO {RECORDING_TABLE} ({RECORDING_TABLE}) VALUES ('optimize')"))
+    return db.execute(text(f"SELECT count(*) FROM {RECORDING_TABLE}")).scalar()
+
+
+def match_expression(query: str):
+    """
+    FTS5 MATCH expression of a user query: every word must occur, "quoted phrases" match
+    as a phrase and a trailing * matches a prefix. Other FTS5 syntax is taken literally.
+    Returns None when the query has no words.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        prefix = word.endswith("*")
+        term = (phrase or word).replace('"', " ").strip(" *")
+        if term:
+            terms.append(f'"{term}"' + ("*" if prefix else ""))
+    return " ".join(terms) or None
+
+
+def _hits(db, recording_ids, params, segment_filters, hits: int):
+    """
+    {recording_id: (matches, hits)}: the number of matching segments of each recording and
+    the first hits of them with snippets, in one statement. Recordings without a matching
+    segment are left out.
+    """
+    if not recording_ids:
+        return {}
+    conditions = [f"{SEARCH_TABLE} MATCH :query"] + [f"{SEARCH_TABLE}.{condition}" for condition in segment_filters]
+    if '"*' in params["query"]:
+        # FTS5 merges the doclists of all the terms of a prefix longer than the prefix index each
+        # time the query starts, so a prefix query reads the index once and keeps the candidates' rows
+        source = SEARCH_TABLE
+        conditions.append(f"{SEARCH_TABLE}.rowid >> {ROWID_BITS} IN :ids")
+    else:
+        # Otherwise the index is read one recording's rowid range at a time
+        source = f"(SELECT id FROM recordings WHERE id IN :ids) c CROSS JOIN {SEARCH_TABLE}"
+        conditions.append(f"{SEARCH_TABLE}.rowid BETWEEN c.id << {ROWID_BITS} AND ((c.id + 1) << {ROWID_BITS}) - 1")
+    rows = db.execute(text(
+        "SELECT recording_id, matches, start_time, end_time, speaker, sentiment_score, snippet FROM ("
+        "SELECT *, row_number() OVER (PARTITION BY recording_id ORDER BY segment) AS n, "
+        "count(*) OVER (PARTITION BY recording_id) AS matches FROM ("
+        f"SELECT {SEARCH_TABLE}.rowid AS segment, {SEARCH_TABLE}.rowid >> {ROWID_BITS} AS recording_id, "
+        "start_time, end_time, speaker, sentiment_score, "
+        f"snippet({SEARCH_TABLE}, 0, :open, :close, '…', {SNIPPET_TOKENS}) AS snippet "
+        f"FROM {source} WHERE {' AND '.join(conditions)})) "
+        "WHERE n <= :hits ORDER BY segment"
+    ).bindparams(bindparam("ids", expanding=True)),
+        {**params, "ids": list(recording_ids), "open": HIGHLIGHT[0], "close": HIGHLIGHT[1], "hits": hits}).fetchall()
+    found = {}
+    for recording_id, matches, start, end, speaker, sentiment, snippet in rows:
+        found.setdefault(recording_id, (matches, []))[1].append({
+            "start_time": start, "end_time": end, "speaker": speaker,
+            "sentiment_score": sentiment, "snippet": snippet,
+        })
+    return found
+
+
+def search(db, query: str, speaker: str = None, min_sentiment: float = None, max_sentiment: float = None,
+           date_from: datetime.date = None, date_to: datetime.date = None, limit: int = 20, hits: int = 5):
+    """
+    Recordings with a segment matching query, best first (BM25 of the recording's whole
+    transcript), each with its first hits matching segments in start order: segment times,
+    speaker, sentiment and a highlighted snippet, and matches, the number of its segments
+    that match. A sentiment range only matches analyzed segments. Raises ValueError for an
+    empty query.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        raise ValueError("Empty search query")
+
+    # Segment filters, on the UNINDEXED columns of the index itself
+    segment_filters = []
+    params = {"query": expression}
+    if speaker:
+        segment_filters.append("speaker = :speaker")
+        params["speaker"] = speaker
+    if min_sentiment is not None:
+        segment_filters.append("sentiment_score >= :min_sentiment")
+        params["min_sentiment"] = min_sentiment
+    if max_sentiment is not None:
+        segment_filters.append("sentiment_score <= :max_sentiment")
+        params["max_sentiment"] = max_sentiment
+    filters = [f"{RECORDING_TABLE} MATCH :query"]
+    if date_from is not None:
+        filters.append("r.upload_date >= :date_from")
+        params["date_from"] = date_from.isoformat()
+    if date_to is not None:
+        filters.append("r.upload_date < :date_to")
+        params["date_to"] = (date_to + datetime.timedelta(days=1)).isoformat()
+
+    # rank (BM25) is lower for better matches
+    ranking_sql = text(
+        f"SELECT r.id, r.filename, r.upload_date, r.status, r.duration, {RECORDING_TABLE}.rank "
+        f"FROM {RECORDING_TABLE} JOIN recordings r ON r.id = {RECORDING_TABLE}.rowid "
+        f"WHERE {' AND '.join(filters)} ORDER BY {RECORDING_TABLE}.rank, r.id LIMIT :page OFFSET :offset"
+    )
+    results = []
+    offset, page = 0, limit
+    while len(results) < limit:
+        ranked = db.execute(ranking_sql, {**params, "page": page, "offset": offset}).fetchall()
+        # A transcript can hold every word without one segment (or one matching the filters) holding them all
+        hits_by_recording = _hits(db, [row[0] for row in ranked], params, segment_filters, hits)
+        for recording_id, filename, upload_date, status, duration, score in ranked:
+            if recording_id not in hits_by_recording:
+                continue
+            if len(results) == limit:
+                break
+            matches, recording_hits = hits_by_recording[recording_id]
+            results.append({
+                "recording_id": recording_id,
+                "filename": filename,
+                "upload_date": upload_date,
+                "status": status,
+                "duration": duration,
+                "score": round(-score, 4),
+                "matches": matches,
+                "hits": recording_hits,
+            })
+        if len(ranked) < page:
+            break
+        offset, page = offset + page, page * 2
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("query", nargs="?", help="Words or \"phrases\" to search for")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the segment tables")
+    parser.add_argument("--speaker")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    import telemetry
+    from database import SessionLocal, engine, Base
+    from migrations import run_migrations
+    telemetry.configure_logging()
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    db = SessionLocal()
+    try:
+        if not available(db):
+            sys.exit("Full-text search needs an SQLite database")
+        if args.rebuild:
+            with telemetry.span("search_rebuild"):
+                count = rebuild(db)
+                db.commit()
+            logger.info("Indexed %d segments", count)
+        elif args.query:
+            try:
+                results = search(db, args.query, speaker=args.speaker, limit=args.limit)
+            except ValueError as e:
+                sys.exit(str(e))
+            print(json.dumps(results, default=str, ensure_ascii=False, indent=2))
+        else:
+            parser.error("a query or --rebuild is required")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Dashboard rollups served by GET /stats.
+
+recording_stats keeps one row per (upload day, status) with the counts and sums of the
+recordings in it. Each recording contributes to exactly one row; when it is created,
+transcribed or (re-)analyzed, its old contribution is subtracted and the new one added in
+the same transaction, so /stats reads a few rows per day instead of scanning recordings
+and segments.
+"""
+import datetime
+
+from sqlalchemy import func, text
+
+import models
+
+# Same bands as the dashboard badges
+NEGATIVE_SENTIMENT = 0.4
+POSITIVE_SENTIMENT = 0.6
+
+FIELDS = ("calls", "audio_seconds", "sentiment_sum", "negative", "neutral", "positive",
+          "agent_seconds", "customer_seconds", "other_seconds")
+
+
+def sentiment_band(score: float):
+    if score >= POSITIVE_SENTIMENT:
+        return "positive"
+    if score <= NEGATIVE_SENTIMENT:
+        return "negative"
+    return "neutral"
+
+
+def contribution(db, recording):
+    """((day, status), {field: value}) the recording adds to the rollups in its current state."""
+    values = dict.fromkeys(FIELDS, 0)
+    values["calls"] = 1
+    values["audio_seconds"] = recording.duration or 0.0
+    if recording.status == "COMPLETED":
+        values["sentiment_sum"] = recording.average_sentiment or 0.0
+        values[sentiment_band(recording.average_sentiment or 0.0)] = 1
+        talk = db.query(
+            models.TranscriptSegment.speaker, func.sum(models.TranscriptSegment.end_time - models.TranscriptSegment.start_time)
+        ).filter(models.TranscriptSegment.recording_id == recording.id).group_by(models.TranscriptSegment.speaker)
+        for speaker, seconds in talk:
+            field = {"Agent": "agent_seconds", "Customer": "customer_seconds"}.get(speaker, "other_seconds")
+            values[field] += seconds or 0.0
+    return (recording.upload_date.date(), recording.status), values
+
+
+def _add(db, key, values, sign: int):
+    day, status = key
+    changes = {field: sign * value for field, value in values.items() if value}
+    if not changes:
+        return
+    updated = db.query(models.RecordingStats).filter(
+        models.RecordingStats.day == day, models.RecordingStats.status == status
+    ).update({getattr(models.RecordingStats, f): getattr(models.RecordingStats, f) + v for f, v in changes.items()},
+             synchronize_session=False)
+    if not updated:
+        db.add(models.RecordingStats(day=day, status=status, **{f: changes.get(f, 0) for f in FIELDS}))
+        db.flush()
+
+
+def record_change(db, recording, before=None):
+    """
+    Moves the recording's contribution from before (contribution() taken ahead of the change,
+    None for a new recording) to its current state. Call after the segments are written;
+    the caller commits.
+    """
+    after = contribution(db, recording)
+    if before is not None:
+        _add(db, *before, sign=-1)
+    _add(db, *after, sign=1)
+
+
+def rebuild(db):
+    """Recomputes all rollups from recordings and transcript_segments."""
+    db.execute(text("DELETE FROM recording_stats"))
+    db.execute(text(f"""
+        INSERT INTO recording_stats (day, status, {", ".join(FIELDS)})
+        SELECT date(r.upload_date), r.status, count(*), coalesce(sum(r.duration), 0),
+               coalesce(sum(CASE WHEN r.status = 'COMPLETED' THEN r.average_sentiment END), 0),
+               count(CASE WHEN r.status = 'COMPLETED' AND r.average_sentiment <= :negative THEN 1 END),
+               count(CASE WHEN r.status = 'COMPLETED' AND r.average_sentiment > :negative
+                          AND r.average_sentiment < :positive THEN 1 END),
+               count(CASE WHEN r.status = 'COMPLETED' AND r.average_sentiment >= :positive THEN 1 END),
+               coalesce(sum(CASE WHEN r.status = 'COMPLETED' THEN t.agent END), 0),
+               coalesce(sum(CASE WHEN r.status = 'COMPLETED' THEN t.customer END), 0),
+               coalesce(sum(CASE WHEN r.status = 'COMPLETED' THEN t.other END), 0)
+        FROM recordings r LEFT JOIN (
+            SELECT recording_id,
+                   sum(CASE WHEN speaker = 'Agent' THEN end_time - start_time ELSE 0 END) AS agent,
+                   sum(CASE WHEN speaker = 'Customer' THEN end_time - start_time ELSE 0 END) AS customer,
+                   sum(CASE WHEN speaker NOT IN ('Agent', 'Customer') THEN end_time - start_time ELSE 0 END) AS other
+            FROM transcript_segments GROUP BY recording_id
+        ) t ON t.recording_id = r.id
+        WHERE r.upload_date IS NOT NULL
+        GROUP BY 1, 2
+    """), {"negative": NEGATIVE_SENTIMENT, "positive": POSITIVE_SENTIMENT})
+
+
+def summary(db, date_from: datetime.date = None, date_to: datetime.date = None):
+    """The /stats payload, summed from the rollup rows of the date range."""
+    query = db.query(models.RecordingStats)
+    if date_from is not None:
+        query = query.filter(models.RecordingStats.day >= date_from)
+    if date_to is not None:
+        query = query.filter(models.RecordingStats.day <= date_to)
+
+    totals = dict.fromkeys(FIELDS, 0)
+    days, status_counts = {}, {}
+    for row in query.order_by(models.RecordingStats.day):
+        day = days.setdefault(row.day, {"day": row.day, "calls": 0, "audio_seconds": 0.0, "analyzed": 0, "sentiment_sum": 0.0})
+        day["calls"] += row.calls
+        day["audio_seconds"] += row.audio_seconds
+        day["analyzed"] += row.negative + row.neutral + row.positive
+        day["sentiment_sum"] += row.sentiment_sum
+        if row.calls:
+            status_counts[row.status] = status_counts.get(row.status, 0) + row.calls
+        for field in FIELDS:
+            totals[field] += getattr(row, field)
+
+    analyzed = totals["negative"] + totals["neutral"] + totals["positive"]
+    talk = totals["agent_seconds"] + totals["customer_seconds"]
+    return {
+        "total_calls": totals["calls"],
+        "analyzed_calls": analyzed,
+        "audio_hours": round(totals["audio_seconds"] / 3600, 3),
+        "status_counts": status_counts,
+        "sentiment": {
+            "average": round(totals["sentiment_sum"] / analyzed, 4) if analyzed else None,
+            "negative": totals["negative"],
+            "neutral": totals["neutral"],
+            "positive": totals["positive"],
+        },
+        "talk": {
+            "agent_seconds": round(totals["agent_seconds"], 1),
+            "customer_seconds": round(totals["customer_seconds"], 1),
+            "other_seconds": round(totals["other_seconds"], 1),
+            # Agent share of the Agent + Customer talk time
+            "agent_ratio": round(totals["agent_seconds"] / talk, 4) if talk else None,
+        },
+        "per_day": [{
+            "day": d["day"],
+            "calls": d["calls"],
+            "audio_hours": round(d["audio_seconds"] / 3600, 3),
+            "average_sentiment": round(d["sentiment_sum"] / d["analyzed"], 4) if d["analyzed"] else None,
+        } for d in days.values()],
+    }
@@ -0,0 +1,123 @@
+"""
+Logging setup, timing spans and Prometheus metrics.
+
+Spans time one pipeline stage (decode, resample, vad, inference, llm_call, json_parse,
+db_commit, ...) and record it in the stage latency histogram; at DEBUG level they are also
+logged with the attributes bound by span_context() (recording id, audio duration, model).
+
+Jobs run in worker processes, so metrics use prometheus_client's multiprocess mode: every
+process writes its samples to PROMETHEUS_MULTIPROC_DIR and /metrics adds them up.
+"""
+import os
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(processName)s] %(name)s: %(message)s"
+
+# Must be set before prometheus_client is imported; spawned worker processes inherit it
+METRICS_DIR = os.path.abspath(os.getenv("PROMETHEUS_MULTIPROC_DIR", "cache/metrics"))
+os.makedirs(METRICS_DIR, exist_ok=True)
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = METRICS_DIR
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    "voice_analyzer_stage_seconds", "Duration of one pipeline stage", ["stage", "model"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+REALTIME_FACTOR = Histogram(
+    "voice_analyzer_realtime_factor", "Transcription seconds per second of audio", ["model"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 4)
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "voice_analyzer_queue_wait_seconds", "Time a job waited in the queue before a worker claimed it", ["kind"],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200)
+)
+LLM_TOKENS = Histogram(
+    "voice_analyzer_llm_tokens", "Tokens per LLM request", ["type"],
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+CASCADE_ESCALATED_FRACTION = Histogram(
+    "voice_analyzer_cascade_escalated_fraction", "Share of a recording's audio re-decoded by the cascade's final model",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1)
+)
+CACHE_LOOKUPS = Counter("voice_analyzer_transcript_cache_lookups", "Transcription cache lookups", ["result"])
+
+_span_context = contextvars.ContextVar("span_context", default={})
+
+
+def configure_logging(level: str = None):
+    """Leveled logging for the API, worker processes and CLIs (LOG_LEVEL, default INFO)."""
+    logging.basicConfig(level=level or LOG_LEVEL, format=LOG_FORMAT)
+
+
+@contextmanager
+def span_context(**attributes):
+    """Attributes (recording_id, audio_duration, model, ...) attached to the spans inside the block."""
+    token = _span_context.set({**_span_context.get(), **attributes})
+    try:
+        yield
+    finally:
+        _span_context.reset(token)
+
+
+def bind(**attributes):
+    """Adds attributes to the current span context, e.g. once the audio duration is known."""
+    _span_context.set({**_span_context.get(), **attributes})
+
+
+def observe(stage: str, seconds: float, **attributes):
+    attributes = {**_span_context.get(), **attributes}
+    STAGE_SECONDS.labels(stage=stage, model=attributes.get("model") or "none").observe(seconds)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("span stage=%s seconds=%.4f %s", stage, seconds,
+                     " ".join(f"{k}={v}" for k, v in sorted(attributes.items())))
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started, **attributes)
+
+
+def reset_metrics():
+    """
+    Drops the samples of earlier runs. The directory is shared by every API and worker process,
+    so this runs once from the launcher (run_server.sh) before any of them starts.
+    """
+    for name in os.listdir(METRICS_DIR):
+        if name.endswith(".db"):
+            os.remove(os.path.join(METRICS_DIR, name))
+
+
+def mark_process_dead(pid: int):
+    """Drops the live gauge samples of an exited process; its counters and histograms stay in the totals."""
+    multiprocess.mark_process_dead(pid, METRICS_DIR)
+
+
+class _QueueDepthCollector:
+    def __init__(self, queue_depth):
+        self.queue_depth = queue_depth
+
+    def collect(self):
+        gauge = GaugeMetricFamily("voice_analyzer_queue_depth", "Jobs waiting or running", labels=["kind", "status"])
+        for (kind, status), count in sorted(self.queue_depth.items()):
+            gauge.add_metric([kind, status], count)
+        yield gauge
+
+
+def render_metrics(queue_depth: dict):
+    """Prometheus text format of all processes' metrics plus the current queue depth {(kind, status): count}."""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_QueueDepthCollector(queue_depth))
+    return generate_latest(registry)
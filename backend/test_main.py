@@ -1,9 +1,23 @@
 from fastapi.testclient import TestClient
 from main import app
+import models
+import datetime
 import os
 
 client = TestClient(app)
 
+def _wav_bytes(tone=440, seconds=0.5, channels=1):
+    import io
+    buffer = io.BytesIO()
+    _write_wav(buffer, channels=channels, seconds=seconds, tone=tone)
+    return buffer.getvalue()
+
+def _remove_upload(recording):
+    # Uploads are stored content-addressed; drop the audio and any transcript sidecar
+    for path in (f"uploads/{recording['stored_filename']}", f"uploads/{recording['stored_filename']}.json"):
+        if os.path.exists(path):
+            os.remove(path)
+
 def test_read_main():
     response = client.get("/")
     assert response.status_code == 200
@@ -12,15 +26,14 @@ def test_read_main():
 def test_upload_file():
     # Create a dummy file
     with open("test_audio.txt", "wb") as f:
-        f.write(b"dummy audio content")
+        f.write(_wav_bytes())
     
     with open("test_audio.txt", "rb") as f:
         response = client.post("/upload", files={"file": ("test_audio.txt", f, "text/plain")})
     
     # Clean up
     os.remove("test_audio.txt")
-    if os.path.exists("uploads/test_audio.txt"):
-        os.remove("uploads/test_audio.txt")
+    _remove_upload(response.json())
 
     assert response.status_code == 200
     data = response.json()
@@ -37,7 +50,7 @@ def test_read_recordings():
 def test_read_recording_detail():
     # First upload a file to get an ID
     with open("test_audio_2.txt", "wb") as f:
-        f.write(b"dummy audio content")
+        f.write(_wav_bytes(tone=550))
     
     with open("test_audio_2.txt", "rb") as f:
         upload_response = client.post("/upload", files={"file": ("test_audio_2.txt", f, "text/plain")})
@@ -49,11 +62,1570 @@ def test_read_recording_detail():
     
     # Clean up
     os.remove("test_audio_2.txt")
-    if os.path.exists("uploads/test_audio_2.txt"):
-        os.remove("uploads/test_audio_2.txt")
+    _remove_upload(upload_response.json())
 
     assert response.status_code == 200
     data = response.json()
     assert data["id"] == recording_id
     assert "segments" in data
     assert isinstance(data["segments"], list)
+
+def _upload(name, content=None):
+    import zlib
+    # A distinct tone per name keeps the content-addressed files of different tests apart
+    if content is None:
+        content = _wav_bytes(tone=200 + zlib.crc32(name.encode()) % 2000)
+    with open(name, "wb") as f:
+        f.write(content)
+    with open(name, "rb") as f:
+        response = client.post("/upload", files={"file": (name, f, "text/plain")})
+    os.remove(name)
+    return response.json()
+
+def test_transcribe_enqueues_job(monkeypatch):
+    import jobs
+    recording = _upload("test_audio_job.txt")
+
+    response = client.post(f"/recordings/{recording['id']}/transcribe")
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "QUEUED"
+    assert job["kind"] == "transcribe"
+
+    # A second click returns the same pending job
+    again = client.post(f"/recordings/{recording['id']}/transcribe")
+    assert again.json()["id"] == job["id"]
+
+    def fake_transcribe(file_path, progress_callback=None, **options):
+        progress_callback(0.5)
+        return {"duration": 3.0, "text": "merhaba", "language": "tr",
+                "segments": [{"start": 0.0, "end": 3.0, "text": "merhaba", "speaker": "Unknown"}]}
+    monkeypatch.setattr(jobs, "transcribe_audio", fake_transcribe)
+    jobs.run_pending_jobs()
+
+    status = client.get(f"/jobs/{job['id']}").json()
+    assert status["status"] == "SUCCEEDED"
+    assert status["progress"] == 1.0
+    detail = client.get(f"/recordings/{recording['id']}").json()
+    assert detail["status"] == "TRANSCRIBED"
+    assert detail["transcript_text"] == "merhaba"
+
+    _remove_upload(recording)
+
+def test_failed_job_is_retried_with_backoff(monkeypatch):
+    import jobs
+    from database import SessionLocal
+    recording = _upload("test_audio_retry.txt")
+    job = client.post(f"/recordings/{recording['id']}/transcribe").json()
+
+    monkeypatch.setattr(jobs, "transcribe_audio", lambda file_path, **options: None)
+    jobs.run_pending_jobs()
+
+    status = client.get(f"/jobs/{job['id']}").json()
+    assert status["status"] == "QUEUED"
+    assert status["attempts"] == 1
+    assert status["error"] == "Transcription failed"
+
+    # Backoff keeps the job out of reach until run_after; force it due and exhaust attempts
+    db = SessionLocal()
+    for _ in range(job["max_attempts"] - 1):
+        db.query(models.Job).filter(models.Job.id == job["id"]).update({models.Job.run_after: datetime.datetime(2000, 1, 1)})
+        db.commit()
+        jobs.run_pending_jobs()
+    db.close()
+
+    status = client.get(f"/jobs/{job['id']}").json()
+    assert status["status"] == "FAILED"
+    assert status["attempts"] == job["max_attempts"]
+    _remove_upload(recording)
+
+def test_stale_running_job_is_recovered():
+    import jobs
+    from database import SessionLocal
+    recording = _upload("test_audio_stale.txt")
+    job = client.post(f"/recordings/{recording['id']}/transcribe").json()
+
+    db = SessionLocal()
+    claimed = jobs.claim_job(db, "crashed-worker")
+    assert claimed.id == job["id"]
+    assert jobs.claim_job(db, "other-worker") is None
+    db.query(models.Job).filter(models.Job.id == job["id"]).update({models.Job.heartbeat_at: datetime.datetime(2000, 1, 1)})
+    db.commit()
+
+    assert jobs.recover_stale_jobs(db) >= 1
+    db.close()
+    assert client.get(f"/jobs/{job['id']}").json()["status"] == "QUEUED"
+
+    # Leave the queue empty for other tests
+    db = SessionLocal()
+    db.query(models.Job).filter(models.Job.id == job["id"]).update({models.Job.status: "FAILED"})
+    db.commit()
+    db.close()
+    _remove_upload(recording)
+
+def test_startup_recovery_leaves_live_workers_jobs():
+    import socket
+    import subprocess
+    import jobs
+    from database import SessionLocal
+    recordings = [_upload("test_audio_live_worker.txt"), _upload("test_audio_dead_worker.txt")]
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    host = socket.gethostname()
+    worker_ids = [f"{host}-{os.getppid()}-0", f"{host}-{exited.pid}-0"]
+
+    db = SessionLocal()
+    try:
+        job_ids = []
+        for recording, worker_id in zip(recordings, worker_ids):
+            job = jobs.enqueue_job(db, "transcribe", recording["id"])
+            assert jobs.claim_job(db, worker_id, job_id=job.id).id == job.id
+            job_ids.append(job.id)
+        # Fresh heartbeats: only the job of the exited process comes back
+        jobs.recover_dead_local_jobs(db)
+        jobs.recover_stale_jobs(db)
+        assert [client.get(f"/jobs/{i}").json()["status"] for i in job_ids] == ["RUNNING", "QUEUED"]
+        db.query(models.Job).filter(models.Job.id.in_(job_ids)).update({models.Job.status: "FAILED"})
+        db.commit()
+    finally:
+        db.close()
+    for recording in recordings:
+        _remove_upload(recording)
+
+def test_supervisor_restarts_dead_worker_and_requeues_its_job(monkeypatch):
+    import socket
+    import multiprocessing
+    import jobs
+    from database import SessionLocal
+    recording = _upload("test_audio_crashed_worker.txt")
+    ctx = multiprocessing.get_context("spawn")
+    crashed = ctx.Process(target=os._exit, args=(3,))
+    crashed.start()
+    crashed.join()
+
+    started = []
+    class FakeProcess:
+        def __init__(self, target, args, daemon):
+            self.args = args
+        def start(self):
+            started.append(self.args[0])
+        def is_alive(self):
+            return True
+    monkeypatch.setattr(ctx, "Process", FakeProcess)
+
+    db = SessionLocal()
+    try:
+        job = jobs.enqueue_job(db, "transcribe", recording["id"])
+        # The id the crashed worker gave itself in worker_main()
+        assert jobs.claim_job(db, f"{socket.gethostname()}-{crashed.pid}-1", job_id=job.id).id == job.id
+        processes = [FakeProcess(None, (0,), True), crashed]
+        assert jobs.restart_dead_workers(ctx, processes, ctx.Event()) == 1
+        assert started == [1] and isinstance(processes[1], FakeProcess)
+        assert client.get(f"/jobs/{job.id}").json()["status"] == "QUEUED"
+        db.query(models.Job).filter(models.Job.id == job.id).update({models.Job.status: "FAILED"})
+        db.commit()
+    finally:
+        db.close()
+    _remove_upload(recording)
+
+def test_read_missing_job():
+    response = client.get("/jobs/999999")
+    assert response.status_code == 404
+
+def test_import_does_not_load_models():
+    from model_registry import registry
+    response = client.get("/models")
+    assert response.status_code == 200
+    assert response.json()["models"] == []
+    assert registry.resident_mb() == 0
+
+def test_transcribe_rejects_unknown_model():
+    recording = _upload("test_audio_model.txt")
+    response = client.post(f"/recordings/{recording['id']}/transcribe", params={"model_size": "huge"})
+    assert response.status_code == 400
+    _remove_upload(recording)
+
+def test_model_registry_lru_eviction(monkeypatch):
+    from model_registry import ModelRegistry, LoadedModel
+    registry = ModelRegistry(memory_budget_mb=1000, idle_timeout=0)
+    monkeypatch.setattr(registry, "_load", lambda key: LoadedModel(key, object(), 0.1, 600))
+
+    small = registry.get("small", "int8")
+    assert registry.get("small", "int8") is small
+    registry.get("medium", "int8")
+    # Loading medium had to evict small to stay under 1000 MB
+    assert [m["model_size"] for m in registry.stats()["models"]] == ["medium"]
+
+def _write_wav(path, channels, sample_rate=8000, seconds=1.0, tone=440):
+    import wave
+    import numpy as np
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    # Channel i gets a distinct amplitude so the split can be checked
+    data = np.stack([np.sin(2 * np.pi * tone * t) * 0.2 * (i + 1) for i in range(channels)], axis=1)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes((data * 32767).astype("<i2").tobytes())
+
+def test_split_channels_in_memory(tmp_path):
+    import numpy as np
+    from analysis import split_channels, SAMPLE_RATE
+    path = str(tmp_path / "stereo.wav")
+    _write_wav(path, channels=2)
+
+    channels = split_channels(path)
+    assert len(channels) == 2
+    for ch in channels:
+        assert ch.dtype == np.float32
+        assert abs(ch.shape[0] - SAMPLE_RATE) < 100
+    assert np.abs(channels[1]).max() > np.abs(channels[0]).max() * 1.5
+    # No temporary WAV files are written next to the source
+    assert sorted(os.listdir(tmp_path)) == ["stereo.wav"]
+
+def test_iter_channel_chunks_matches_full_decode(tmp_path):
+    import numpy as np
+    from analysis import split_channels, iter_channel_chunks
+    path = str(tmp_path / "stereo_long.wav")
+    _write_wav(path, channels=2, seconds=2.5)
+
+    chunks = list(iter_channel_chunks(path, chunk_seconds=1.0))
+    assert [offset for offset, _ in chunks] == [0.0, 1.0, 2.0]
+    joined = [np.concatenate([c[i] for _, c in chunks]) for i in range(2)]
+    full = split_channels(path)
+    for a, b in zip(joined, full):
+        assert np.allclose(a, b)
+
+def test_iter_channel_chunks_cuts_at_pauses_or_overlaps(tmp_path, monkeypatch):
+    import numpy as np
+    import analysis
+    path = str(tmp_path / "stereo_long.wav")
+    _write_wav(path, channels=2, seconds=2.5)
+    full = analysis.split_channels(path)
+
+    # A pause within the last 0.4s of each 1s window: chunks end there and do not overlap
+    chunks = list(analysis.iter_channel_chunks(path, chunk_seconds=1.0, search_seconds=0.4, overlap_seconds=0.2))
+    assert all(0.6 <= len(c[0]) / analysis.SAMPLE_RATE <= 1.0 for _, c in chunks[:-1])
+    joined = [np.concatenate([c[i] for _, c in chunks]) for i in range(2)]
+    for a, b in zip(joined, full):
+        assert np.allclose(a, b)
+
+    # No pause: hard cuts, and the next chunk repeats the last 0.2s
+    monkeypatch.setattr(analysis, "find_silence_cut", lambda *a, **k: None)
+    chunks = list(analysis.iter_channel_chunks(path, chunk_seconds=1.0, search_seconds=0.4, overlap_seconds=0.2))
+    assert [offset for offset, _ in chunks] == [0.0, 0.8, 1.6]
+    assert np.allclose(chunks[0][1][0][-3200:], chunks[1][1][0][:3200])
+
+def test_acoustic_features_from_frame_views():
+    import numpy as np
+    from acoustics import add_acoustic_features, yin_pitch, SAMPLE_RATE
+    t = np.arange(2 * SAMPLE_RATE) / SAMPLE_RATE
+    customer = (0.3 * np.sin(2 * np.pi * 150 * t)).astype(np.float32)
+    customer[SAMPLE_RATE:] = 0.0
+    # The agent starts talking half a second before the customer stops
+    agent = (0.3 * np.sin(2 * np.pi * 240 * t)).astype(np.float32)
+    agent[:SAMPLE_RATE // 2] = 0.0
+
+    pitch = yin_pitch(customer)
+    assert abs(np.nanmedian(pitch) - 150) < 1
+    assert np.isnan(pitch[-10:]).all()
+
+    segments = [
+        {"start": 0.0, "end": 2.0, "text": "merhaba efendim", "channel": 0,
+         "words": [[0.0, 0.5, " merhaba", 0.9], [0.5, 1.0, " efendim", 0.9]]},
+        {"start": 0.5, "end": 2.0, "text": "buyurun", "channel": 1, "words": []},
+    ]
+    add_acoustic_features(segments, [customer, agent])
+    first, second = segments
+    assert abs(first["pitch_mean"] - 150) < 1 and abs(second["pitch_mean"] - 240) < 1
+    assert abs(first["silence_ratio"] - 0.5) < 0.03
+    assert abs(first["overlap_ratio"] - 0.25) < 0.03
+    assert first["speaking_rate"] == 6.0
+    assert -18 < first["rms_db"] < -15
+    # Mono recordings have no talk-over
+    assert add_acoustic_features([dict(segments[0])], [customer])[0]["overlap_ratio"] is None
+
+def test_acoustic_features_are_stored_with_segments(tmp_path, monkeypatch):
+    import analysis
+    import jobs
+    import media
+    from types import SimpleNamespace
+    monkeypatch.setattr(analysis, "transcript_cache", analysis.transcript_cache.__class__(str(tmp_path / "c.db"), max_mb=0))
+    monkeypatch.setattr(media, "MEDIA_DIR", str(tmp_path))
+
+    class FakeModel:
+        def transcribe(self, audio, **kwargs):
+            seg = SimpleNamespace(start=0.0, end=1.0, text="alo", avg_logprob=-0.1, no_speech_prob=0.0,
+                                  words=[SimpleNamespace(start=0.0, end=0.5, word=" alo", probability=0.9)])
+            return iter([seg]), SimpleNamespace(language="tr", duration=len(audio) / analysis.SAMPLE_RATE)
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: FakeModel())
+
+    recording = _upload("features.wav", _wav_bytes(tone=200, seconds=1.0, channels=2))
+    client.post(f"/recordings/{recording['id']}/transcribe")
+    jobs.run_pending_jobs()
+    segments = client.get(f"/recordings/{recording['id']}").json()["segments"]
+    assert [s["channel"] for s in segments] == [0, 1]
+    assert all(abs(s["pitch_mean"] - 200) < 2 for s in segments)
+    assert all(s["overlap_ratio"] > 0.9 and s["silence_ratio"] < 0.1 for s in segments)
+    assert segments[0]["speaking_rate"] == 4.0
+    # Waveform peaks come from the same decode
+    assert os.path.exists(media.peaks_path(recording["stored_filename"]))
+    _remove_upload(recording)
+
+def test_peaks_are_built_while_transcribing(tmp_path, monkeypatch):
+    import numpy as np
+    import media
+    from media import PeakBuilder, unpack_peaks, PEAK_LEVELS
+    monkeypatch.setattr(media, "MEDIA_DIR", str(tmp_path))
+    audio = np.linspace(-0.5, 0.5, 3 * PEAK_LEVELS[-1] + 100, dtype=np.float32)
+    builder = PeakBuilder()
+    # Overlapping chunks, as from chunked transcription, give the same peaks as one pass
+    builder.add([audio[:30000]])
+    builder.add([audio[20000:]], offset_samples=20000)
+    sample_rate, levels = unpack_peaks(builder.finish())
+    assert sample_rate == 16000 and [samples for samples, _ in levels] == list(PEAK_LEVELS)
+    assert [len(peaks) for _, peaks in levels] == [-(-len(audio) // n) for n in PEAK_LEVELS]
+    finest = levels[0][1]
+    assert finest[0, 0, 0] == -64 and finest[-1, 0, 1] == 64
+    assert (finest[1:, 0, 0] >= finest[:-1, 0, 0]).all()
+
+def test_audio_is_served_with_ranges_and_peaks(tmp_path, monkeypatch):
+    import media
+    monkeypatch.setattr(media, "MEDIA_DIR", str(tmp_path))
+    recording = _upload("served.wav", _wav_bytes(tone=330, seconds=1.0, channels=2))
+    url = f"/recordings/{recording['id']}"
+
+    response = client.get(f"{url}/audio", headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.headers["content-range"].startswith("bytes 0-99/")
+    assert response.content == _wav_bytes(tone=330, seconds=1.0, channels=2)[:100]
+    assert client.get(f"{url}/audio").headers["accept-ranges"] == "bytes"
+
+    response = client.get(f"{url}/audio?format=opus")
+    assert response.status_code == 200 and response.headers["content-type"] == "audio/ogg"
+    assert response.content[:4] == b"OggS"
+
+    # Peaks are built on first request and then revalidated with the ETag
+    response = client.get(f"{url}/peaks")
+    assert response.status_code == 200
+    _, levels = media.unpack_peaks(response.content)
+    assert levels[0][1].shape == (63, 2, 2)
+    etag = response.headers["etag"]
+    assert client.get(f"{url}/peaks", headers={"If-None-Match": etag}).status_code == 304
+    response = client.get(f"{url}/peaks?level=3")
+    _, levels = media.unpack_peaks(response.content)
+    assert len(levels) == 1 and levels[0][0] == media.PEAK_LEVELS[3] and response.headers["etag"] != etag
+    assert client.get(f"{url}/peaks?level=9").status_code == 422
+    assert client.get("/recordings/999999/audio").status_code == 404
+    _remove_upload(recording)
+
+def test_stitch_chunk_segments_dedupes_overlap_words():
+    from analysis import stitch_chunk_segments
+    # The words around 10s were transcribed by both chunks; the boundary is 10.0
+    first = [{"start": 8.0, "end": 10.6, "text": "iyi günler size", "speaker": "Agent",
+              "words": [[8.0, 8.5, " iyi", 0.9], [8.6, 9.6, " günler", 0.9], [9.8, 10.6, " size", 0.5]]}]
+    second = [{"start": 9.2, "end": 11.0, "text": "ler size nasıl", "speaker": "Agent",
+               "words": [[9.2, 9.6, " ler", 0.3], [9.8, 10.6, " size", 0.9], [10.6, 11.0, " nasıl", 0.9]]}]
+    stitched = stitch_chunk_segments(first, 0.0, 10.0) + stitch_chunk_segments(second, 10.0, 20.0)
+    assert [(s["start"], s["end"], s["text"]) for s in stitched] == [(8.0, 9.6, "iyi günler"), (9.8, 11.0, "size nasıl")]
+    # Segments without word timestamps go by their midpoint
+    assert stitch_chunk_segments([{"start": 9.0, "end": 10.4, "text": "x"}], 10.0, 20.0) == []
+
+def test_long_audio_resumes_from_checkpoint(tmp_path, monkeypatch):
+    import analysis
+    from types import SimpleNamespace
+    from transcript_cache import ChunkCheckpoints
+    path = str(tmp_path / "long.wav")
+    _write_wav(path, channels=1, seconds=2.5)
+    checkpoints = ChunkCheckpoints(str(tmp_path / "checkpoints.db"))
+    monkeypatch.setattr(analysis, "chunk_checkpoints", checkpoints)
+    monkeypatch.setattr(analysis, "LONG_AUDIO_SECONDS", 1.0)
+    monkeypatch.setattr(analysis, "CHUNK_SECONDS", 1.0)
+    monkeypatch.setattr(analysis, "CHUNK_SEARCH_SECONDS", 0.0)
+    monkeypatch.setattr(analysis, "CHUNK_OVERLAP_SECONDS", 0.0)
+
+    calls = []
+    class FakeModel:
+        def __init__(self, fail_at=None):
+            self.fail_at = fail_at
+        def transcribe(self, audio, **kwargs):
+            calls.append(len(audio))
+            if len(calls) == self.fail_at:
+                raise RuntimeError("worker killed")
+            duration = len(audio) / analysis.SAMPLE_RATE
+            seg = SimpleNamespace(start=0.1, end=0.3, text=" parça", avg_logprob=-0.1, no_speech_prob=0.0,
+                                  words=[SimpleNamespace(start=0.1, end=0.3, word=" parça", probability=0.9)])
+            return iter([seg]), SimpleNamespace(language="tr", duration=duration)
+
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: FakeModel(fail_at=2))
+    assert analysis.transcribe_audio(path, use_cache=False) is None
+    key = analysis.transcription_cache_key(path)
+    assert checkpoints.count(key) == 1
+
+    # The retry only transcribes the chunks after the checkpoint
+    calls.clear()
+    monkeypatch.setattr(analysis, "PARALLEL_CHUNKS", 2)
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: FakeModel())
+    streamed = []
+    result = analysis.transcribe_audio(path, use_cache=False, segment_callback=streamed.append)
+    assert len(calls) == 2
+    assert [s["start"] for s in result["segments"]] == [0.1, 1.1, 2.1]
+    assert streamed == result["segments"]
+    assert result["duration"] == 2.5
+    assert checkpoints.count(key) == 0
+
+def test_transcribe_audio_passes_arrays_to_whisper(tmp_path, monkeypatch):
+    import numpy as np
+    import analysis
+    from types import SimpleNamespace
+    path = str(tmp_path / "call.wav")
+    _write_wav(path, channels=2)
+
+    calls = []
+    class FakeModel:
+        def transcribe(self, audio, **kwargs):
+            calls.append(audio)
+            # Channel 1 is the louder one in _write_wav
+            n = 2 if np.abs(audio).max() > 0.3 else 1
+            seg = SimpleNamespace(start=0.1 * n, end=0.5, text=f" kanal {n} ", avg_logprob=-0.1, no_speech_prob=0.01)
+            return iter([seg]), SimpleNamespace(language="tr", duration=len(audio) / analysis.SAMPLE_RATE)
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: FakeModel())
+
+    result = analysis.transcribe_audio(path, use_cache=False)
+    assert all(isinstance(a, np.ndarray) for a in calls)
+    assert [s["speaker"] for s in result["segments"]] == ["Customer", "Agent"]
+    assert result["text"] == "kanal 1 kanal 2"
+    assert sorted(os.listdir(tmp_path)) == ["call.wav"]
+
+def test_stereo_channels_are_transcribed_concurrently(tmp_path, monkeypatch):
+    import threading
+    import numpy as np
+    import analysis
+    from types import SimpleNamespace
+    path = str(tmp_path / "call.wav")
+    _write_wav(path, channels=2)
+
+    # Each channel waits until the other one has started: a sequential loop would time out
+    barrier = threading.Barrier(2, timeout=5)
+    class FakeModel:
+        def transcribe(self, audio, **kwargs):
+            barrier.wait()
+            segs = [SimpleNamespace(start=1.0, end=2.0, text=f"loud={np.abs(audio).max() > 0.3}", avg_logprob=-0.1, no_speech_prob=0.0)]
+            return iter(segs), SimpleNamespace(language="tr", duration=1.0)
+    requested = {}
+    def fake_get(*args, **kwargs):
+        requested.update(kwargs)
+        return FakeModel()
+    monkeypatch.setattr(analysis.registry, "get", fake_get)
+
+    result = analysis.transcribe_audio(path, parallel_channels=2, cpu_threads=3, use_cache=False)
+    assert requested == {"cpu_threads": 3, "num_workers": 2}
+    # Equal start times are ordered by channel, not by thread completion
+    assert [s["speaker"] for s in result["segments"]] == ["Customer", "Agent"]
+    assert result["text"] == "loud=False loud=True"
+
+def test_cascade_redecodes_only_unsure_spans(tmp_path, monkeypatch):
+    import math
+    import analysis
+    from types import SimpleNamespace
+    path = str(tmp_path / "call.wav")
+    _write_wav(path, channels=1, seconds=4.0)
+    word = lambda start, end, text: SimpleNamespace(start=start, end=end, word=text, probability=0.9)
+
+    class DraftModel:
+        def __init__(self, unsure):
+            self.unsure = unsure
+        def transcribe(self, audio, **kwargs):
+            segs = [SimpleNamespace(start=start, end=start + 0.8, text=text, no_speech_prob=0.0,
+                                    avg_logprob=math.log(0.3 if self.unsure and text == "iki" else 0.9))
+                    for start, text in ((0.0, "bir"), (1.0, "iki"), (2.0, "evet " * (12 if self.unsure else 1)), (3.0, "dört"))]
+            return iter(segs), SimpleNamespace(language="tr", duration=len(audio) / analysis.SAMPLE_RATE)
+    windows = []
+    class FinalModel:
+        def transcribe(self, audio, **kwargs):
+            windows.append(len(audio) / analysis.SAMPLE_RATE)
+            # The padding before the span repeats the end of "bir", which stays with the draft
+            seg = SimpleNamespace(start=0.0, end=2.3, text=" bir iki üç", avg_logprob=-0.1, no_speech_prob=0.0,
+                                  words=[word(0.0, 0.25, " bir"), word(0.5, 1.0, " iki"), word(1.5, 2.3, " üç")])
+            return iter([seg]), SimpleNamespace(language="tr", duration=len(audio) / analysis.SAMPLE_RATE)
+
+    for unsure in (False, True):
+        requested = []
+        def fake_get(model_size=None, compute_type=None, **kwargs):
+            requested.append((model_size, compute_type))
+            return DraftModel(unsure) if model_size == "small" else FinalModel()
+        monkeypatch.setattr(analysis.registry, "get", fake_get)
+        result = analysis.transcribe_audio(path, use_cache=False, cascade=True)
+        if not unsure:
+            # Nothing to escalate: the large model is not even loaded
+            assert requested == [("small", "int8")] and not windows
+            assert result["cascade"]["escalated_fraction"] == 0.0
+
+    assert requested == [("small", "int8"), (None, None)]
+    # "iki" (low confidence) and the repeated "evet" (high compression ratio) form one span,
+    # decoded with 0.5 s of context on both sides
+    assert windows == [2.8]
+    assert [(s["start"], s["end"], s["text"]) for s in result["segments"]] == [
+        (0.0, 0.8, "bir"), (1.0, 2.8, "iki üç"), (3.0, 3.8, "dört")]
+    assert result["cascade"] == {"draft_model": "small", "model": analysis.DEFAULT_MODEL_SIZE,
+                                 "escalated_seconds": 2.8, "escalated_fraction": 0.7}
+    assert analysis.transcription_params(cascade=True)["cascade"]["draft_model"] == "small"
+    assert "cascade" not in analysis.transcription_params(cascade=False)
+
+def test_speech_prepass_cuts_hold_music_and_dead_channels(tmp_path, monkeypatch):
+    import wave
+    import numpy as np
+    import analysis
+    import jobs
+    import prepass
+    from types import SimpleNamespace
+    from transcript_cache import TranscriptCache
+    t = np.arange(16000 * 9) / 16000
+    # Syllable-like bursts for 2 s, steady hold music for 5 s, bursts again; channel 0 stays silent
+    speech = 0.3 * np.sign(np.sin(2 * np.pi * 150 * t)) * np.maximum(0, np.sin(2 * np.pi * 3 * t))
+    music = 0.2 * np.sin(2 * np.pi * 440 * t)
+    agent = np.where((t >= 2) & (t < 7), music, speech)
+    with wave.open("prepass_call.wav", "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes((np.stack([np.zeros_like(t), agent], axis=1) * 32767).astype("<i2").tobytes())
+    with open("prepass_call.wav", "rb") as f:
+        content = f.read()
+    os.remove("prepass_call.wav")
+
+    regions = prepass.speech_regions(agent.astype(np.float32))
+    assert len(regions) == 2 and regions[0][0] == 0 and regions[1][1] == len(agent)
+    assert 2.0 <= regions[0][1] / 16000 < 3.5 and 5.5 < regions[1][0] / 16000 <= 7.0
+
+    decoded = []
+    class FakeModel:
+        def transcribe(self, audio, **kwargs):
+            decoded.append(len(audio) / 16000)
+            # One segment per stretch of sound, in the times of the array Whisper gets
+            frames = np.abs(audio[:len(audio) // 160 * 160].reshape(-1, 160)).max(axis=1) > 0.01
+            edges = np.flatnonzero(np.diff(np.concatenate([[0], frames.astype(np.int8), [0]])))
+            segs = [SimpleNamespace(start=a / 100, end=b / 100, text="konuşma", avg_logprob=-0.1, no_speech_prob=0.0,
+                                    words=[SimpleNamespace(start=a / 100, end=b / 100, word=" konuşma", probability=0.9)])
+                    for a, b in zip(edges[::2], edges[1::2])]
+            return iter(segs), SimpleNamespace(language="tr", duration=len(audio) / 16000)
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: FakeModel())
+    monkeypatch.setattr(prepass, "PREPASS", True)
+    # A transcript cached by an earlier run would skip the model
+    monkeypatch.setattr(analysis, "transcript_cache", TranscriptCache(str(tmp_path / "cache.db"), max_mb=1))
+
+    recording = _upload("prepass_call.wav", content)
+    client.post(f"/recordings/{recording['id']}/transcribe")
+    jobs.run_pending_jobs()
+    # Only the agent channel is decoded, and only its speech with a little padding
+    assert len(decoded) == 1 and decoded[0] < 6.0
+    detail = client.get(f"/recordings/{recording['id']}").json()
+    assert detail["duration"] == 9.0
+    # The silent channel (9 s) and most of the music count as skipped
+    assert 12.0 < detail["skipped_seconds"] < 14.0
+    segments = [s for s in detail["segments"] if s["speaker"] == "Agent"]
+    # Segment times are back in the recording's time line: the second one starts after the music
+    assert segments[0]["start_time"] < 0.5 and segments[-1]["end_time"] > 8.5
+    assert segments[-1]["start_time"] > 6.5
+    _remove_upload(recording)
+
+def test_transcription_cache_hit_skips_whisper(tmp_path, monkeypatch):
+    import analysis
+    from types import SimpleNamespace
+    from transcript_cache import TranscriptCache
+    monkeypatch.setattr(analysis, "transcript_cache", TranscriptCache(str(tmp_path / "cache.db"), max_mb=1))
+    path = str(tmp_path / "call.wav")
+    _write_wav(path, channels=1)
+
+    calls = []
+    class FakeModel:
+        def transcribe(self, audio, **kwargs):
+            calls.append(kwargs)
+            seg = SimpleNamespace(start=0.0, end=1.0, text="merhaba", avg_logprob=-0.1, no_speech_prob=0.0)
+            return iter([seg]), SimpleNamespace(language="tr", duration=1.0)
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: FakeModel())
+
+    first = analysis.transcribe_audio(path)
+    second = analysis.transcribe_audio(path)
+    assert len(calls) == 1
+    assert second == first
+    stats = analysis.transcript_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+    # Different decode parameters must not reuse the entry
+    analysis.transcribe_audio(path, model_size="small")
+    assert len(calls) == 2
+
+def test_transcription_cache_evicts_least_recently_used(tmp_path):
+    from transcript_cache import TranscriptCache
+    cache = TranscriptCache(str(tmp_path / "cache.db"), max_mb=0.005)
+    # Random hex compresses to ~2.2 KB per entry: only two fit in ~5 KB
+    payload = lambda i: {"segments": [os.urandom(2000).hex()], "i": i}
+    cache.put("a", payload(1))
+    cache.put("b", payload(2))
+    assert cache.get("a") is not None
+    cache.put("c", payload(3))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+def test_transcribe_cache_hit_is_queued_and_keyed_by_stored_hash(monkeypatch):
+    import pytest
+    import analysis
+    recording = _upload("test_audio_cached.txt")
+    key = analysis.transcription_cache_key(f"uploads/{recording['stored_filename']}")
+    cached = {"duration": 1.0, "text": "önbellek", "language": "tr",
+              "segments": [{"start": 0.0, "end": 1.0, "text": "önbellek", "speaker": "Unknown"}]}
+    monkeypatch.setattr(analysis.transcript_cache, "get", lambda k: cached if k == key else None)
+    # The stored Recording.file_hash keys the lookup; the file is not read again
+    monkeypatch.setattr(analysis, "file_sha256", lambda path: pytest.fail("audio rehashed"))
+
+    job = client.post(f"/recordings/{recording['id']}/transcribe").json()
+    # Answered by a worker like any other job, not inside the request
+    assert job["status"] == "QUEUED"
+    import jobs
+    jobs.run_pending_jobs()
+    assert client.get(f"/jobs/{job['id']}").json()["status"] == "SUCCEEDED"
+    assert client.get(f"/recordings/{recording['id']}").json()["transcript_text"] == "önbellek"
+    _remove_upload(recording)
+
+def test_upload_is_content_addressed():
+    import hashlib
+    content = _wav_bytes(tone=660)
+    first = client.post("/upload", files={"file": ("call.wav", content, "audio/wav")}).json()
+    other = client.post("/upload", files={"file": ("call.wav", _wav_bytes(tone=770), "audio/wav")}).json()
+
+    assert first["file_hash"] == hashlib.sha256(content).hexdigest()
+    assert first["stored_filename"] == first["file_hash"] + ".wav"
+    assert first["file_size"] == len(content)
+    # Same client filename, different audio: both files are kept
+    assert other["stored_filename"] != first["stored_filename"]
+    with open(f"uploads/{first['stored_filename']}", "rb") as f:
+        assert f.read() == content
+    assert not os.listdir("uploads/.partial")
+    _remove_upload(first)
+    _remove_upload(other)
+
+def test_upload_rejects_non_audio():
+    response = client.post("/upload", files={"file": ("notes.txt", b"dummy audio content", "text/plain")})
+    assert response.status_code == 415
+    assert not os.listdir("uploads/.partial")
+
+def test_upload_rejects_oversize(monkeypatch):
+    import uploads
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_BYTES", 1000)
+    response = client.post("/upload", files={"file": ("call.wav", _wav_bytes(), "audio/wav")})
+    assert response.status_code == 413
+    assert not os.listdir("uploads/.partial")
+
+def test_cancelled_upload_leaves_no_partial_file():
+    import asyncio
+    import pytest
+    import uploads
+    class CancelledRequest:
+        headers = {"content-type": "multipart/form-data; boundary=b"}
+        async def stream(self):
+            yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="call.wav"\r\n\r\n' + _wav_bytes()
+            # The client goes away in the middle of the file
+            raise asyncio.CancelledError()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(uploads.receive_multipart_upload(CancelledRequest()))
+    assert not os.listdir("uploads/.partial")
+
+def test_resumable_upload():
+    import hashlib
+    content = _wav_bytes(tone=880, seconds=2.0)
+    session = client.post("/upload/sessions", json={"filename": "long_call.wav", "total_size": len(content)}).json()
+    assert session["received_size"] == 0
+
+    half = len(content) // 2
+    first = client.put(f"/upload/sessions/{session['id']}", content=content[:half],
+                       headers={"Content-Range": f"bytes 0-{half - 1}/{len(content)}"})
+    assert first.status_code == 200
+    assert first.json()["recording"] is None
+
+    # Replaying a range at the wrong offset tells the client where to resume
+    stale = client.put(f"/upload/sessions/{session['id']}", content=content[:half],
+                       headers={"Content-Range": f"bytes 0-{half - 1}/{len(content)}"})
+    assert stale.status_code == 409
+    offset = client.get(f"/upload/sessions/{session['id']}").json()["received_size"]
+    assert offset == half
+
+    # A range that fails half way is cut off the partial file and can be sent again
+    short = client.put(f"/upload/sessions/{session['id']}", content=content[offset:offset + 100],
+                       headers={"Content-Range": f"bytes {offset}-{len(content) - 1}/{len(content)}"})
+    assert short.status_code == 400
+    assert os.path.getsize(f"uploads/.partial/{session['id']}") == offset
+
+    # While another request holds the range, a second one for the same offset is refused
+    from database import SessionLocal
+    db = SessionLocal()
+    db.query(models.UploadSession).filter(models.UploadSession.id == session["id"]).update(
+        {models.UploadSession.status: "RECEIVING", models.UploadSession.updated_at: datetime.datetime.utcnow()})
+    db.commit()
+    racing = client.put(f"/upload/sessions/{session['id']}", content=content[offset:],
+                        headers={"Content-Range": f"bytes {offset}-{len(content) - 1}/{len(content)}"})
+    assert racing.status_code == 409
+    assert racing.json()["detail"] == {"message": "Range is being received", "received_size": offset}
+    # The holder died: its claim expires
+    db.query(models.UploadSession).filter(models.UploadSession.id == session["id"]).update(
+        {models.UploadSession.updated_at: datetime.datetime(2000, 1, 1)})
+    db.commit()
+    db.close()
+
+    last = client.put(f"/upload/sessions/{session['id']}", content=content[offset:],
+                      headers={"Content-Range": f"bytes {offset}-{len(content) - 1}/{len(content)}"})
+    assert last.status_code == 200
+    recording = last.json()["recording"]
+    assert recording["filename"] == "long_call.wav"
+    assert recording["file_hash"] == hashlib.sha256(content).hexdigest()
+    assert last.json()["upload"]["status"] == "COMPLETED"
+    _remove_upload(recording)
+
+def _fake_openai_client(fail_windows=(), seen=None):
+    """AsyncOpenAI client wired to a local OpenAI-compatible fake served in-process."""
+    import json
+    import httpx
+    from fastapi import FastAPI, Request
+    from openai import AsyncOpenAI
+    fake = FastAPI()
+
+    @fake.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        content = body["messages"][1]["content"]
+        segments = json.loads(content[content.index("["):])
+        ids = [s["id"] for s in segments]
+        if seen is not None:
+            seen.append(ids)
+        if ids[0] in fail_windows:
+            return fake_error()
+        # Segments mentioning "kötü" are negative; even ids are the Agent
+        result = {"segments": [{"id": s["id"], "speaker": "Agent" if s["id"] % 2 == 0 else "Customer",
+                                "sentiment_score": 0.0 if "kötü" in s["text"] else 1.0} for s in segments]}
+        return {"id": "x", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": json.dumps(result)}}]}
+
+    def fake_error():
+        from fastapi.responses import JSONResponse
+        return JSONResponse({"error": {"message": "boom"}}, status_code=400)
+
+    transport = httpx.ASGITransport(app=fake)
+    return AsyncOpenAI(api_key="test", base_url="http://fake-openai/v1",
+                       http_client=httpx.AsyncClient(transport=transport, base_url="http://fake-openai/v1"),
+                       max_retries=0)
+
+def test_chunk_segments_overlapping_windows():
+    from analysis import chunk_segments
+    segments = [{"text": "x" * 30, "start": i, "end": i + 1} for i in range(10)]
+    # Each segment costs 22 tokens: 3 per 70-token window
+    windows = chunk_segments(segments, max_tokens=70, overlap=1)
+    assert windows[0] == [0, 1, 2]
+    assert windows[1] == [2, 3, 4]
+    assert sorted(set(i for w in windows for i in w)) == list(range(10))
+
+def test_analyze_transcript_windows_concurrently(monkeypatch):
+    import analysis
+    monkeypatch.setattr(analysis, "LLM_WINDOW_TOKENS", 60)
+    monkeypatch.setattr(analysis, "LLM_WINDOW_OVERLAP", 1)
+    # A long negative segment and short positive ones: the average is weighted by duration
+    segments = [{"text": "bu çok kötü", "start": 0.0, "end": 9.0, "speaker": "Unknown"}]
+    segments += [{"text": f"teşekkürler {i}", "start": 9.0 + i, "end": 10.0 + i, "speaker": "Unknown"} for i in range(5)]
+    seen = []
+
+    result = analysis.analyze_transcript(segments, client=_fake_openai_client(seen=seen))
+    assert len(seen) > 1
+    assert [s["start_time"] for s in result["segments"]] == [s["start"] for s in segments]
+    assert [s["speaker"] for s in result["segments"]][:2] == ["Agent", "Customer"]
+    assert result["average_sentiment"] == round(5 / 14, 4)
+
+def test_analyze_transcript_survives_failed_window(monkeypatch):
+    import analysis
+    monkeypatch.setattr(analysis, "LLM_WINDOW_TOKENS", 40)
+    monkeypatch.setattr(analysis, "LLM_WINDOW_OVERLAP", 0)
+    monkeypatch.setattr(analysis, "LLM_MAX_RETRIES", 0)
+    segments = [{"text": f"cümle {i}", "start": float(i), "end": i + 1.0, "speaker": "Customer"} for i in range(6)]
+
+    result = analysis.analyze_transcript(segments, client=_fake_openai_client(fail_windows=(0,)))
+    assert len(result["segments"]) == 6
+    # The failed window keeps the Whisper speaker and a neutral score; the rest were analyzed
+    assert result["segments"][0]["speaker"] == "Customer"
+    assert result["segments"][0]["sentiment_score"] == 0.5
+    assert result["segments"][-1]["sentiment_score"] == 1.0
+    assert result["average_sentiment"] == 1.0
+
+def test_local_sentiment_model_scores_in_batches():
+    import numpy as np
+    from types import SimpleNamespace
+    from tokenizers import Tokenizer
+    from tokenizers.models import WordLevel
+    from tokenizers.pre_tokenizers import Whitespace
+    from local_sentiment import LocalSentimentModel
+    vocab = {"[PAD]": 0, "[UNK]": 1, "çok": 2, "kötü": 3, "güzel": 4, "teşekkürler": 5}
+    tokenizer = Tokenizer(WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+
+    batches = []
+    class FakeSession:
+        def get_inputs(self):
+            return [SimpleNamespace(name="input_ids"), SimpleNamespace(name="attention_mask")]
+        def run(self, outputs, feed):
+            ids = feed["input_ids"]
+            batches.append(ids.shape)
+            # negative / positive logits from the word ids
+            return [np.stack([(ids == 3).sum(axis=1) * 8.0, (ids >= 4).sum(axis=1) * 8.0], axis=1)]
+
+    model = LocalSentimentModel(FakeSession(), tokenizer, ["negative", "positive"], batch_size=2)
+    results = model.predict(["çok kötü", "teşekkürler", "çok güzel teşekkürler", ""])
+    assert [shape[0] for shape in batches] == [2, 2]
+    assert results[0][0] < 0.01 and results[0][1] > 0.99
+    assert results[1][0] > 0.98 and results[2][0] > 0.99
+    assert results[3] == (0.5, 0.5)
+
+def test_hybrid_analyzer_sends_only_unsure_segments_to_llm(monkeypatch):
+    import analysis
+    import local_sentiment
+    monkeypatch.setattr(local_sentiment, "SENTIMENT_MODEL", "models/sentiment")
+    # The classifier is unsure about questions
+    monkeypatch.setattr(local_sentiment, "classify", lambda texts: [
+        (0.5, 0.4) if "?" in t else (0.9, 0.95) for t in texts])
+    stereo = [
+        {"text": "iyi günler", "start": 0.0, "end": 1.0, "speaker": "Agent", "channel": 1},
+        {"text": "bu ne kötü?", "start": 1.0, "end": 2.0, "speaker": "Customer", "channel": 0},
+        {"text": "teşekkürler", "start": 2.0, "end": 3.0, "speaker": "Customer", "channel": 0},
+    ]
+    seen = []
+    result = analysis.analyze_transcript(stereo, client=_fake_openai_client(seen=seen), backend="hybrid")
+    assert seen == [[0]]
+    # Speakers stay with the channels; the LLM score replaces the unsure local one
+    assert [s["speaker"] for s in result["segments"]] == ["Agent", "Customer", "Customer"]
+    assert [s["sentiment_score"] for s in result["segments"]] == [0.9, 0.0, 0.9]
+    assert result["segments"][1]["channel"] == 0
+
+    seen.clear()
+    assert analysis.analyze_transcript(stereo, client=_fake_openai_client(seen=seen), backend="local")["segments"][1]["sentiment_score"] == 0.5
+    assert seen == []
+
+    # Mono: no channel speakers, so the whole call goes to the LLM
+    mono = [dict(s, speaker="Unknown", channel=0) for s in stereo]
+    result = analysis.analyze_transcript(mono, client=_fake_openai_client(seen=seen), backend="hybrid")
+    assert seen == [[0, 1, 2]]
+    assert [s["speaker"] for s in result["segments"]] == ["Agent", "Customer", "Agent"]
+
+def test_local_analyzer_without_model_is_rejected(monkeypatch):
+    import jobs
+    import local_sentiment
+    from database import SessionLocal
+    monkeypatch.setattr(local_sentiment, "SENTIMENT_MODEL", "")
+    recording = _upload("test_audio_no_model.txt")
+    monkeypatch.setattr(jobs, "transcribe_audio", lambda file_path, **options: {
+        "duration": 1.0, "text": "merhaba", "language": "tr",
+        "segments": [{"start": 0.0, "end": 1.0, "text": "merhaba", "speaker": "Agent", "channel": 1}]})
+    client.post(f"/recordings/{recording['id']}/transcribe")
+    jobs.run_pending_jobs()
+
+    response = client.post(f"/recordings/{recording['id']}/analyze", params={"analyzer": "hybrid"})
+    assert response.status_code == 400
+    assert "SENTIMENT_MODEL" in response.json()["detail"]
+
+    # A job queued anyway (e.g. ANALYZER_BACKEND=local) fails at once instead of retrying
+    db = SessionLocal()
+    try:
+        job_id = jobs.enqueue_job(db, "analyze", recording["id"], payload={"analyzer": "local"}).id
+    finally:
+        db.close()
+    jobs.run_pending_jobs()
+    job = client.get(f"/jobs/{job_id}").json()
+    assert (job["status"], job["attempts"]) == ("FAILED", 1)
+    assert "SENTIMENT_MODEL" in job["error"]
+    _remove_upload(recording)
+
+def test_segments_are_stored_in_database(monkeypatch):
+    import jobs
+    recording = _upload("test_audio_segments.txt")
+    segments = [
+        {"start": 0.0, "end": 2.0, "text": "merhaba", "speaker": "Customer", "channel": 0,
+         "confidence": 0.9, "no_speech_prob": 0.01, "words": [[0.0, 2.0, " merhaba", 0.95]]},
+        {"start": 2.0, "end": 3.0, "text": "buyurun", "speaker": "Agent", "channel": 1,
+         "confidence": 0.8, "no_speech_prob": 0.02, "words": []},
+    ]
+    monkeypatch.setattr(jobs, "transcribe_audio", lambda file_path, **options: {
+        "duration": 3.0, "text": "merhaba buyurun", "language": "tr", "segments": segments})
+    client.post(f"/recordings/{recording['id']}/transcribe")
+    jobs.run_pending_jobs()
+
+    # No sidecar: the transcript view reads the raw segments from the database
+    assert not os.path.exists(f"uploads/{recording['stored_filename']}.json")
+    detail = client.get(f"/recordings/{recording['id']}").json()
+    assert [(s["text"], s["speaker"], s["confidence"]) for s in detail["segments"]] == [
+        ("merhaba", "Customer", 0.9), ("buyurun", "Agent", 0.8)]
+
+    seen = []
+    def fake_analyze(whisper_segments, **options):
+        seen.extend(whisper_segments)
+        return {"average_sentiment": 0.7, "segments": [
+            {"speaker": s["speaker"], "text": s["text"], "start_time": s["start"], "end_time": s["end"],
+             "sentiment_score": 0.7, "confidence": s["confidence"], "words": s["words"]} for s in whisper_segments]}
+    monkeypatch.setattr(jobs, "analyze_transcript", fake_analyze)
+    assert client.post(f"/recordings/{recording['id']}/analyze").status_code == 202
+    jobs.run_pending_jobs()
+
+    assert seen[0]["words"] == [[0.0, 2.0, " merhaba", 0.95]]
+    detail = client.get(f"/recordings/{recording['id']}").json()
+    assert detail["status"] == "COMPLETED"
+    assert [s["sentiment_score"] for s in detail["segments"]] == [0.7, 0.7]
+    assert detail["segments"][0]["confidence"] == 0.9
+    _remove_upload(recording)
+
+def test_search_index_follows_transcription_and_analysis(monkeypatch):
+    import jobs
+    import search
+    from database import SessionLocal
+    recordings = [_upload("search_a.wav"), _upload("search_b.wav")]
+    transcripts = [
+        [{"start": 0.0, "end": 2.0, "text": "kargom hâlâ gelmedi", "speaker": "Customer", "channel": 0},
+         {"start": 2.0, "end": 4.0, "text": "kargo takip numaranız nedir", "speaker": "Agent", "channel": 1},
+         {"start": 4.0, "end": 6.0, "text": "kargo kargo iade istiyorum", "speaker": "Customer", "channel": 0}],
+        [{"start": 0.0, "end": 3.0, "text": "iade süreciniz başladı", "speaker": "Agent", "channel": 1}],
+    ]
+    for recording, segments in zip(recordings, transcripts):
+        monkeypatch.setattr(jobs, "transcribe_audio", lambda file_path, segments=segments, **options: {
+            "duration": 6.0, "text": "", "language": "tr", "segments": segments})
+        client.post(f"/recordings/{recording['id']}/transcribe")
+        jobs.run_pending_jobs()
+    ids = [r["id"] for r in recordings]
+
+    def found(**params):
+        response = client.get("/search", params=params)
+        assert response.status_code == 200
+        return [r for r in response.json() if r["recording_id"] in ids]
+
+    # Raw segments are searchable right after transcription; diacritics are folded
+    results = found(q="hala")
+    assert [r["recording_id"] for r in results] == ids[:1]
+    assert results[0]["hits"][0]["snippet"] == "kargom <mark>hâlâ</mark> gelmedi"
+    assert results[0]["hits"][0]["sentiment_score"] is None
+    results = found(q="kargo iade")
+    assert [(h["start_time"], h["speaker"]) for h in results[0]["hits"]] == [(4.0, "Customer")]
+    assert sorted(r["recording_id"] for r in found(q="iade")) == ids
+    # Best match first, whatever the age: the shorter transcript of the newer recording wins here
+    assert [r["recording_id"] for r in found(q="iade")] == ids[::-1]
+    assert [r["recording_id"] for r in found(q="kargo")] == ids[:1]
+    # Both words are in the first transcript, but no segment holds both
+    assert found(q="takip iade") == []
+    assert found(q="kargo*", speaker="Agent")[0]["matches"] == 1
+    assert found(q='"takip numaranız"')[0]["hits"][0]["start_time"] == 2.0
+    assert found(q="iade", date_to="2000-01-01") == []
+
+    monkeypatch.setattr(jobs, "analyze_transcript", lambda whisper_segments, **options: {
+        "average_sentiment": 0.5, "segments": [
+            {"speaker": s["speaker"], "text": s["text"], "start_time": s["start"], "end_time": s["end"],
+             "sentiment_score": 0.1 if s["speaker"] == "Customer" else 0.9} for s in whisper_segments]})
+    client.post(f"/recordings/{ids[0]}/analyze")
+    jobs.run_pending_jobs()
+    # Analyzed segments replace the raw ones in the index
+    results = found(q="kargo")
+    assert results[0]["matches"] == 2
+    assert sorted(h["sentiment_score"] for h in results[0]["hits"]) == [0.1, 0.9]
+    assert [r["recording_id"] for r in found(q="iade", max_sentiment=0.3)] == ids[:1]
+
+    db = SessionLocal()
+    try:
+        search.rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+    assert found(q="kargo")[0]["matches"] == 2
+    assert [r["hits"][0]["sentiment_score"] for r in found(q="iade", speaker="Agent")] == [None]
+    assert client.get("/search", params={"q": '" *'}).status_code == 400
+    for recording in recordings:
+        _remove_upload(recording)
+
+def test_stats_rollups_follow_recordings(monkeypatch):
+    import jobs
+    import stats
+    from database import SessionLocal
+    today = datetime.datetime.utcnow().date().isoformat()
+    def today_stats():
+        return client.get("/stats", params={"date_from": today, "date_to": today}).json()
+    before = today_stats()
+
+    recordings = [_upload("stats_a.wav"), _upload("stats_b.wav")]
+    monkeypatch.setattr(jobs, "transcribe_audio", lambda file_path, **options: {
+        "duration": 90.0, "text": "uzun bir transkript", "language": "tr", "segments": [
+            {"start": 0.0, "end": 2.0, "text": "merhaba", "speaker": "Agent", "channel": 1},
+            {"start": 2.0, "end": 6.0, "text": "faturam yanlış geldi", "speaker": "Customer", "channel": 0}]})
+    for recording in recordings:
+        client.post(f"/recordings/{recording['id']}/transcribe")
+    jobs.run_pending_jobs()
+    # The list view leaves the transcript out
+    listed = client.get("/recordings").json()
+    assert "transcript_text" not in listed[0]
+
+    def analyze(score):
+        monkeypatch.setattr(jobs, "analyze_transcript", lambda whisper_segments, **options: {
+            "average_sentiment": score, "segments": [
+                {"speaker": s["speaker"], "text": s["text"], "start_time": s["start"], "end_time": s["end"],
+                 "sentiment_score": score} for s in whisper_segments]})
+        db = SessionLocal()
+        try:
+            jobs.enqueue_job(db, "analyze", recordings[0]["id"])
+        finally:
+            db.close()
+        jobs.run_pending_jobs()
+    analyze(0.8)
+    analyze(0.2) # Re-analysis replaces the first result instead of adding to it
+
+    after = today_stats()
+    assert after["total_calls"] - before["total_calls"] == 2
+    assert round(after["audio_hours"] - before["audio_hours"], 3) == 0.05
+    assert after["status_counts"].get("COMPLETED", 0) - before["status_counts"].get("COMPLETED", 0) == 1
+    assert after["status_counts"]["TRANSCRIBED"] - before["status_counts"].get("TRANSCRIBED", 0) == 1
+    assert after["sentiment"]["negative"] - before["sentiment"]["negative"] == 1
+    assert after["sentiment"]["positive"] == before["sentiment"]["positive"]
+    assert round(after["talk"]["agent_seconds"] - before["talk"]["agent_seconds"], 3) == 2.0
+    assert round(after["talk"]["customer_seconds"] - before["talk"]["customer_seconds"], 3) == 4.0
+    assert after["per_day"][-1]["calls"] == after["total_calls"]
+
+    # Incremental rollups match a full recomputation
+    db = SessionLocal()
+    try:
+        stats.rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+    assert today_stats() == after
+    for recording in recordings:
+        _remove_upload(recording)
+
+def test_export_streams_segments_in_every_format(monkeypatch):
+    import io
+    import json
+    import jobs
+    import export
+    import pyarrow.ipc
+    import pyarrow.parquet
+    recordings = [_upload("export_a.wav"), _upload("export_b.wav")]
+    ids = [r["id"] for r in recordings]
+    monkeypatch.setattr(jobs, "transcribe_audio", lambda file_path, **options: {
+        "duration": 6.0, "text": "", "language": "tr", "segments": [
+            {"start": 2.0, "end": 5.0, "text": "kargom gelmedi", "speaker": "Customer", "channel": 0},
+            {"start": 0.0, "end": 2.0, "text": "hoş geldiniz", "speaker": "Agent", "channel": 1}]})
+    monkeypatch.setattr(jobs, "analyze_transcript", lambda whisper_segments, **options: {
+        "average_sentiment": 0.3, "segments": [
+            {"speaker": s["speaker"], "text": s["text"], "start_time": s["start"], "end_time": s["end"],
+             "sentiment_score": 0.3} for s in whisper_segments]})
+    from database import SessionLocal
+    for recording_id in ids:
+        client.post(f"/recordings/{recording_id}/transcribe")
+    jobs.run_pending_jobs()
+    db = SessionLocal()
+    try:
+        jobs.enqueue_job(db, "analyze", ids[0])
+    finally:
+        db.close()
+    jobs.run_pending_jobs()
+    # Batches smaller than the result: rows must carry over batch boundaries in order
+    monkeypatch.setattr(export, "EXPORT_BATCH_ROWS", 1)
+    today = datetime.datetime.utcnow().date().isoformat()
+
+    def exported(format, **params):
+        response = client.get("/export", params={"format": format, "date_from": today, **params})
+        assert response.status_code == 200
+        return response
+
+    rows = [json.loads(line) for line in exported("ndjson").text.splitlines()]
+    rows = [r for r in rows if r["recording_id"] in ids]
+    assert [(r["recording_id"], r["start_time"], r["speaker"]) for r in rows] == [
+        (ids[0], 0.0, "Agent"), (ids[0], 2.0, "Customer")]
+    assert rows[1]["text"] == "kargom gelmedi" and rows[1]["sentiment_score"] == 0.3
+    assert rows[1]["filename"] == "export_a.wav" and rows[1]["status"] == "COMPLETED"
+    datetime.datetime.fromisoformat(rows[1]["upload_date"])
+
+    # Raw segments of the recording that was not analyzed, filtered by status
+    raw = [json.loads(line) for line in exported("ndjson", level="raw_segments", status="TRANSCRIBED").text.splitlines()]
+    assert [r["text"] for r in raw if r["recording_id"] == ids[1]] == ["hoş geldiniz", "kargom gelmedi"]
+    assert all(r["status"] == "TRANSCRIBED" for r in raw)
+    assert not [r for r in raw if r["recording_id"] == ids[0]]
+
+    response = exported("arrow", level="recordings")
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pyarrow.ipc.open_stream(response.content).read_all()
+    listed = [r for r in table.to_pylist() if r["id"] in ids]
+    assert [r["status"] for r in listed] == ["COMPLETED", "TRANSCRIBED"]
+    assert str(table.schema.field("upload_date").type) == "timestamp[us]"
+
+    table = pyarrow.parquet.read_table(io.BytesIO(exported("parquet").content))
+    assert [r["text"] for r in table.to_pylist() if r["recording_id"] in ids] == ["hoş geldiniz", "kargom gelmedi"]
+    assert table.column_names == [c.name for c in export.columns("segments")]
+
+    assert client.get("/export", params={"format": "csv"}).status_code == 400
+    assert client.get("/export", params={"level": "words"}).status_code == 400
+    for recording in recordings:
+        _remove_upload(recording)
+
+def _live_tones(*parts):
+    """16 kHz float audio of (frequency, seconds) parts; frequency 0 is silence."""
+    import numpy as np
+    return np.concatenate([
+        0.3 * np.sin(2 * np.pi * f * np.arange(int(16000 * seconds)) / 16000) if f else np.zeros(int(16000 * seconds))
+        for f, seconds in parts]).astype(np.float32)
+
+class _ToneModel:
+    """Stands in for Whisper: every run of 0.1 s frames with the same tone is a word "w<hundreds of Hz>"."""
+    def transcribe(self, audio, **kwargs):
+        import numpy as np
+        from types import SimpleNamespace
+        frames = []
+        for i in range(len(audio) // 1600):
+            frame = audio[i * 1600:(i + 1) * 1600]
+            crossings = np.count_nonzero(np.diff(np.signbit(frame)))
+            # Frames only partly covered by a tone (resampler delay) count as silence
+            frames.append(round(crossings / 0.2 / 100) if np.sqrt(np.mean(frame ** 2)) > 0.1 else None)
+        words = []
+        for i, tone in enumerate(frames):
+            if tone is None:
+                continue
+            if words and words[-1].word == f" w{tone}" and words[-1].end == round(i * 0.1, 2):
+                words[-1].end = round((i + 1) * 0.1, 2)
+            else:
+                words.append(SimpleNamespace(start=round(i * 0.1, 2), end=round((i + 1) * 0.1, 2), word=f" w{tone}", probability=0.9))
+        return iter([SimpleNamespace(words=words)] if words else []), SimpleNamespace(language="tr")
+
+def _energy_vad(audio):
+    return [(i * 1600, (i + 1) * 1600) for i in range(len(audio) // 1600) if abs(audio[i * 1600:(i + 1) * 1600]).max() > 0.01]
+
+def test_live_stream_commits_agreed_words(tmp_path, monkeypatch):
+    import live
+    monkeypatch.setattr(live, "speech_timestamps", _energy_vad)
+    monkeypatch.setattr(live, "LIVE_MIN_CHUNK_SECONDS", 0.5)
+    stream = live.ChannelStream(0, 1, "pcm16", 16000, str(tmp_path / "live.pcm"))
+    audio = _live_tones((300, 1.0), (500, 1.0), (0, 1.0), (700, 0.5))
+    pcm = (audio * 32767).astype("<i2").tobytes()
+    messages = []
+    for start in range(0, len(pcm), 16000): # 0.5 s per decode
+        assert stream.feed(pcm[start:start + 16000])
+        messages += stream.process(_ToneModel())
+    messages += stream.process(_ToneModel(), final=True)
+    stream.close_audio()
+
+    interims = [m for m in messages if m["type"] == "interim"]
+    # A word is only stable once a second decode agrees with it
+    assert interims[0] == {"type": "interim", "channel": 0, "speaker": "Unknown", "start": 0.0, "end": 0.5,
+                           "text": "w3", "stable": ""}
+    assert interims[1]["stable"] == "w3"
+    finals = [m["segment"] for m in messages if m["type"] == "final"]
+    # The pause ends the first utterance; stopping ends the second
+    assert [(s["start"], s["end"], s["text"]) for s in finals] == [(0.0, 2.0, "w3 w5"), (3.0, 3.5, "w7")]
+    assert messages.index({"type": "final", "segment": finals[0]}) < len(messages) - 1
+    # Audio before the last utterance is no longer buffered
+    assert stream.buffer_start >= 2.0
+
+def test_live_websocket_stores_recording(monkeypatch):
+    import av
+    import live
+    import jobs
+    monkeypatch.setattr(live, "speech_timestamps", _energy_vad)
+    monkeypatch.setattr(live.registry, "get", lambda *a, **k: _ToneModel())
+    monkeypatch.setattr(jobs, "analyze_transcript", lambda whisper_segments, **options: {
+        "average_sentiment": 0.5, "segments": [
+            {"speaker": s["speaker"], "text": s["text"], "start_time": s["start"], "end_time": s["end"],
+             "sentiment_score": 0.5} for s in whisper_segments]})
+
+    # Stereo PCM at 8 kHz: customer on channel 0, agent on channel 1
+    customer = (_live_tones((400, 1.0), (0, 1.0)) * 32767).astype("<i2")[::2].tobytes()
+    agent = (_live_tones((0, 1.0), (600, 1.0)) * 32767).astype("<i2")[::2].tobytes()
+    with client.websocket_connect("/live?channels=2&sample_rate=8000&filename=live_call.wav") as ws:
+        for start in range(0, len(customer), 1600): # 0.1 s frames
+            ws.send_bytes(b"\x00" + customer[start:start + 1600])
+            ws.send_bytes(b"\x01" + agent[start:start + 1600])
+        ws.send_text('{"type": "stop"}')
+        messages = []
+        while not messages or messages[-1]["type"] != "done":
+            messages.append(ws.receive_json())
+    finals = [m["segment"] for m in messages if m["type"] == "final"]
+    assert sorted((s["speaker"], s["text"]) for s in finals) == [("Agent", "w6"), ("Customer", "w4")]
+    done = messages[-1]
+    assert done["segments"] == 2
+
+    jobs.run_pending_jobs()
+    detail = client.get(f"/recordings/{done['recording_id']}").json()
+    assert detail["filename"] == "live_call.wav"
+    assert detail["status"] == "COMPLETED"
+    assert detail["duration"] == 2.0
+    assert [(s["speaker"], s["text"]) for s in detail["segments"]] == [("Customer", "w4"), ("Agent", "w6")]
+    _remove_upload(detail)
+
+    # Opus packets are decoded on the fly
+    encoder = av.CodecContext.create("libopus", "w")
+    encoder.sample_rate, encoder.layout, encoder.format, encoder.bit_rate = 48000, "mono", "s16", 32000
+    tone = (_live_tones((500, 1.0)) * 32767).astype("<i2").repeat(3)
+    with client.websocket_connect("/live?format=opus&analyze=false") as ws:
+        for start in range(0, len(tone), 960):
+            frame = av.AudioFrame.from_ndarray(tone[start:start + 960].reshape(1, -1), format="s16", layout="mono")
+            frame.sample_rate, frame.pts = 48000, start
+            for packet in encoder.encode(frame):
+                ws.send_bytes(b"\x00" + bytes(packet))
+        ws.send_text('{"type": "stop"}')
+        messages = []
+        while not messages or messages[-1]["type"] != "done":
+            messages.append(ws.receive_json())
+    detail = client.get(f"/recordings/{messages[-1]['recording_id']}").json()
+    assert detail["status"] == "TRANSCRIBED"
+    assert abs(detail["duration"] - 1.0) < 0.1
+    assert "w5" in detail["transcript_text"]
+    _remove_upload(detail)
+
+    import pytest
+    from starlette.websockets import WebSocketDisconnect
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/live?channels=3"):
+            pass
+    assert closed.value.code == 1008
+
+def test_live_decode_failure_is_reported_and_call_goes_on(monkeypatch):
+    import live
+    class _BrokenModel:
+        def transcribe(self, audio, **kwargs):
+            raise RuntimeError("out of memory")
+    monkeypatch.setattr(live, "speech_timestamps", _energy_vad)
+    monkeypatch.setattr(live.registry, "get", lambda *a, **k: _BrokenModel())
+
+    tone = (_live_tones((400, 1.0)) * 32767).astype("<i2").tobytes()
+    with client.websocket_connect("/live?analyze=false&filename=broken_call.wav") as ws:
+        for start in range(0, len(tone), 3200):
+            ws.send_bytes(b"\x00" + tone[start:start + 3200])
+        error = ws.receive_json()
+        assert error == {"type": "error", "channel": 0, "detail": "Decode failed: out of memory"}
+        ws.send_text('{"type": "stop"}')
+        messages = []
+        while not messages or messages[-1]["type"] != "done":
+            messages.append(ws.receive_json())
+    # The audio is kept even though nothing could be decoded
+    detail = client.get(f"/recordings/{messages[-1]['recording_id']}").json()
+    assert detail["status"] == "TRANSCRIBED"
+    assert abs(detail["duration"] - 1.0) < 0.1
+    _remove_upload(detail)
+
+def test_sidecar_migration_imports_segments(tmp_path, monkeypatch):
+    import json
+    import migrations
+    from sqlalchemy import create_engine, text
+    from database import Base
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(migrations, "UPLOAD_DIR", str(tmp_path))
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO recordings (id, filename, status) VALUES (1, 'old_call.wav', 'TRANSCRIBED')"))
+    with open(tmp_path / "old_call.wav.json", "w") as f:
+        json.dump([{"start": 0.0, "end": 1.5, "text": "eski kayıt", "speaker": "Unknown", "confidence": 0.5}], f)
+
+    assert migrations.run_migrations(engine)[:3] == [1, 2, 3]
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT text, end_time, confidence FROM raw_segments WHERE recording_id = 1")).fetchall()
+    assert [tuple(r) for r in rows] == [("eski kayıt", 1.5, 0.5)]
+
+def test_sqlite_pragmas_are_applied():
+    from database import engine
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() >= 1000
+
+def test_recording_queries_use_indexes():
+    from database import engine
+    with engine.connect() as conn:
+        plan = " ".join(str(r) for r in conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT * FROM recordings WHERE (upload_date, id) < ('2030-01-01', 1) "
+            "ORDER BY upload_date DESC, id DESC LIMIT 10").fetchall())
+        assert "ix_recordings_upload_date_id" in plan
+        plan = " ".join(str(r) for r in conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT * FROM transcript_segments WHERE recording_id = 1 ORDER BY start_time").fetchall())
+        assert "ix_transcript_segments_recording_start" in plan
+
+def test_recordings_keyset_pagination():
+    from database import SessionLocal
+    db = SessionLocal()
+    base = datetime.datetime(2001, 1, 1)
+    # Two recordings share an upload_date to check the id tie-breaker
+    created = [models.Recording(filename=f"page_{i}.wav", status="PAGINATION", duration=0.0, average_sentiment=0.0,
+                                upload_date=base + datetime.timedelta(minutes=min(i, 3))) for i in range(5)]
+    db.add_all(created)
+    db.commit()
+    expected = [r.id for r in sorted(created, key=lambda r: (r.upload_date, r.id), reverse=True)]
+    db.close()
+
+    seen, cursor = [], None
+    while True:
+        params = {"status": "PAGINATION", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/recordings", params=params)
+        seen += [r["id"] for r in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == expected
+    # Legacy offset paging returns the same order
+    response = client.get("/recordings", params={"status": "PAGINATION", "limit": 2, "skip": 2})
+    assert [r["id"] for r in response.json()] == expected[2:4]
+    assert client.get("/recordings", params={"cursor": "garbage"}).status_code == 400
+
+    db = SessionLocal()
+    db.query(models.Recording).filter(models.Recording.status == "PAGINATION").delete()
+    db.commit()
+    db.close()
+
+def _sse_events(lines):
+    events, event = [], None
+    for line in lines:
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            import json
+            events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+def test_transcription_stream_sends_and_stores_segments(tmp_path, monkeypatch):
+    import analysis
+    from types import SimpleNamespace
+    from transcript_cache import TranscriptCache
+    from database import SessionLocal
+    monkeypatch.setattr(analysis, "transcript_cache", TranscriptCache(str(tmp_path / "cache.db"), max_mb=0))
+
+    class FakeModel:
+        def transcribe(self, audio, **kwargs):
+            segs = (SimpleNamespace(start=float(i), end=i + 0.5, text=f"parça {i}", avg_logprob=-0.1, no_speech_prob=0.0)
+                    for i in range(3))
+            return segs, SimpleNamespace(language="tr", duration=3.0)
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: FakeModel())
+
+    recording = _upload("stream.wav", _wav_bytes(tone=777, channels=2))
+    with client.stream("GET", f"/recordings/{recording['id']}/transcribe/stream") as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = _sse_events(response.iter_lines())
+
+    assert events[0][0] == "job"
+    segments = [data for name, data in events if name == "segment"]
+    assert len(segments) == 6
+    assert {s["speaker"] for s in segments} == {"Customer", "Agent"}
+    assert all(0.0 < s["progress"] <= 1.0 for s in segments)
+    assert events[-1][0] == "done"
+    assert events[-1][1]["status"] == "SUCCEEDED" and events[-1][1]["segments"] == 6
+
+    db = SessionLocal()
+    stored = db.query(models.Recording).filter(models.Recording.id == recording["id"]).first()
+    assert stored.status == "TRANSCRIBED"
+    assert [s.start_time for s in stored.raw_segments] == [0.0, 0.0, 1.0, 1.0, 2.0, 2.0]
+    db.close()
+
+    # Already transcribed: replayed from the database without running Whisper
+    monkeypatch.setattr(analysis.registry, "get", None)
+    response = client.get(f"/recordings/{recording['id']}/transcribe/stream")
+    replayed = _sse_events(response.text.splitlines())
+    assert [name for name, _ in replayed] == ["segment"] * 6 + ["done"]
+    _remove_upload(recording)
+
+def test_cancelled_stream_stops_decoding(tmp_path, monkeypatch):
+    import analysis
+    import jobs
+    from types import SimpleNamespace
+    from transcript_cache import TranscriptCache
+    from database import SessionLocal
+    monkeypatch.setattr(analysis, "transcript_cache", TranscriptCache(str(tmp_path / "cache.db"), max_mb=0))
+
+    decoded = []
+    class FakeModel:
+        def transcribe(self, audio, **kwargs):
+            def segments():
+                for i in range(1000):
+                    decoded.append(i)
+                    yield SimpleNamespace(start=float(i), end=i + 0.5, text="uzun", avg_logprob=-0.1, no_speech_prob=0.0)
+            return segments(), SimpleNamespace(language="tr", duration=1000.0)
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: FakeModel())
+
+    recording = _upload("stream_cancel.wav")
+    db = SessionLocal()
+    job = jobs.enqueue_job(db, "transcribe", recording["id"])
+    db.close()
+
+    stream = jobs.TranscriptionStream()
+    # Cancel as soon as the first segment reaches the consumer
+    original = stream.on_segment
+    def on_segment(segment):
+        original(segment)
+        stream.cancel()
+    stream.on_segment = on_segment
+    assert jobs.start_streaming_job(job.id, stream)
+
+    events = []
+    while not events or events[-1][0] != "end":
+        events.append(stream.events.get(timeout=10))
+    assert events[-1] == ("end", "CANCELLED")
+    assert len(decoded) < 5
+
+    db = SessionLocal()
+    stored = db.query(models.Job).filter(models.Job.id == job.id).first()
+    assert stored.status == "CANCELLED"
+    # The segment decoded before the cancel was persisted
+    assert len(stored.recording.raw_segments) == 1
+    assert stored.recording.status == "UPLOADED"
+    db.close()
+    _remove_upload(recording)
+
+def test_batch_ingestion_dedupes_and_reports(tmp_path, monkeypatch):
+    import shutil
+    import jobs
+    import ingest
+    import search
+    import stats
+    from database import SessionLocal
+    monkeypatch.setattr(ingest, "BATCH_IMPORT_ROOT", str(tmp_path))
+    source = tmp_path / "night"
+    (source / "sub").mkdir(parents=True)
+    _write_wav(str(source / "a.wav"), channels=2, tone=901)
+    _write_wav(str(source / "sub" / "b.wav"), channels=1, tone=902)
+    shutil.copyfile(source / "a.wav", source / "sub" / "a_copy.wav")
+    (source / "broken.wav").write_bytes(b"not audio")
+    (source / "notes.txt").write_text("ignored")
+
+    assert client.post("/recordings/batch", json={"directory": "../"}).status_code == 400
+    assert client.post("/recordings/batch", json={"directory": "night", "manifest": "x"}).status_code == 400
+    response = client.post("/recordings/batch", json={"directory": "night"})
+    assert response.status_code == 202
+    batch_id = response.json()["id"]
+
+    def fake_transcribe(file_path, progress_callback=None, **options):
+        return {"duration": 1800.0, "text": "merhaba", "language": "tr",
+                "segments": [{"start": 0.0, "end": 3.0, "text": "merhaba", "speaker": "Agent"}]}
+    def fake_analyze(whisper_segments, **options):
+        return {"average_sentiment": 0.7, "segments": [
+            {"speaker": "Agent", "text": "merhaba", "start_time": 0.0, "end_time": 3.0, "sentiment_score": 0.7}
+        ]}
+    monkeypatch.setattr(jobs, "transcribe_audio", fake_transcribe)
+    monkeypatch.setattr(jobs, "analyze_transcript", fake_analyze)
+    # ingest -> 2 transcriptions -> 2 analyses
+    assert jobs.run_pending_jobs() == 5
+
+    report = client.get(f"/recordings/batch/{batch_id}").json()
+    assert report["done"]
+    assert report["files"] == {"total": 4, "PENDING": 0, "INGESTED": 2, "DUPLICATE": 1, "FAILED": 1}
+    assert report["recordings"] == {"COMPLETED": 2}
+    assert report["audio_hours"] == 1.0
+    assert report["audio_hours_per_wall_hour"] > 0
+
+    # Running the batch again (resume) neither re-ingests nor requeues finished work
+    db = SessionLocal()
+    ingest.run_batch(db, batch_id)
+    items = db.query(models.BatchItem).filter(models.BatchItem.batch_id == batch_id).all()
+    recordings = {item.recording for item in items if item.recording}
+    assert len(recordings) == 2
+    assert jobs.run_pending_jobs() == 0
+    # Drop what the batch created so a rerun ingests the same files again instead of deduping them
+    for recording in recordings:
+        _remove_upload({"stored_filename": recording.stored_filename})
+        search.delete_recording(db, recording.id)
+        for model in (models.TranscriptSegment, models.RawSegment, models.Job):
+            db.query(model).filter(model.recording_id == recording.id).delete(synchronize_session=False)
+        db.delete(recording)
+    db.query(models.BatchItem).filter(models.BatchItem.batch_id == batch_id).delete(synchronize_session=False)
+    db.query(models.Batch).filter(models.Batch.id == batch_id).delete(synchronize_session=False)
+    db.flush()
+    stats.rebuild(db)
+    db.commit()
+    db.close()
+
+def test_rate_limiter_is_shared_between_instances(tmp_path):
+    from rate_limit import RateLimiter
+    path = str(tmp_path / "limits.db")
+    # Two instances stand in for two worker processes
+    first, second = RateLimiter(path, burst_seconds=0), RateLimiter(path, burst_seconds=0)
+    delays = [first.reserve("llm", 1, 60), second.reserve("llm", 1, 60), first.reserve("llm", 1, 60)]
+    assert delays[0] == 0.0
+    assert 0.9 < delays[1] <= 1.0 and 1.9 < delays[2] <= 2.0
+    assert second.reserve("other", 1, 60) == 0.0
+    assert first.reserve("llm", 1, 0) == 0.0
+
+def test_batched_pipeline_is_used_with_batch_size(tmp_path, monkeypatch):
+    import faster_whisper
+    import analysis
+    from types import SimpleNamespace
+    path = str(tmp_path / "call.wav")
+    _write_wav(path, channels=1)
+
+    used = []
+    class FakePipeline:
+        def __init__(self, model):
+            self.model = model
+        def transcribe(self, audio, batch_size, **kwargs):
+            used.append(batch_size)
+            seg = SimpleNamespace(start=0.0, end=1.0, text="toplu", avg_logprob=-0.1, no_speech_prob=0.0)
+            return iter([seg]), SimpleNamespace(language="tr", duration=1.0)
+    monkeypatch.setattr(faster_whisper, "BatchedInferencePipeline", FakePipeline)
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: object())
+
+    result = analysis.transcribe_audio(path, batch_size=16, use_cache=False)
+    assert used == [16]
+    assert result["text"] == "toplu"
+    assert "batch_size" not in analysis.transcription_params(batch_size=0)
+    assert analysis.transcription_params(batch_size=16)["batch_size"] == 16
+
+def test_pipeline_benchmark_reports_and_detects_regressions(tmp_path, monkeypatch):
+    import importlib.util
+    import analysis
+    spec = importlib.util.spec_from_file_location("bench_pipeline", os.path.join(os.path.dirname(__file__), "benchmarks", "bench_pipeline.py"))
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: bench.SyntheticWhisper())
+
+    path = str(tmp_path / "stereo.wav")
+    bench.make_synthetic_audio(path, 8, channels=2)
+    results = bench.run_suite({"stereo_8s": path}, repeat=1, llm_latency=0.0, api_requests=5, api_concurrency=2,
+                              db_path=str(tmp_path / "bench.db"))
+    metrics = results["metrics"]
+    assert results["fixtures"]["stereo_8s"]["audio_seconds"] == 8.0
+    assert {"stereo_8s.rtf", "stereo_8s.transcribe.p50_ms", "stereo_8s.analyze.p99_ms", "api.detail.rps", "peak_rss_mb"} <= set(metrics)
+    assert results["api"]["detail"]["errors"] == 0
+
+    assert bench.compare(metrics, metrics, 0.1) == []
+    slower = dict(metrics, **{"stereo_8s.rtf": metrics["stereo_8s.rtf"] * 2, "api.detail.rps": metrics["api.detail.rps"] / 2})
+    assert [r[0] for r in bench.compare(slower, metrics, 0.1)] == ["api.detail.rps", "stereo_8s.rtf"]
+
+def test_metrics_and_span_logs(tmp_path, monkeypatch, caplog):
+    import logging
+    import analysis
+    import jobs
+    from types import SimpleNamespace
+    from transcript_cache import TranscriptCache
+    monkeypatch.setattr(analysis, "transcript_cache", TranscriptCache(str(tmp_path / "cache.db"), max_mb=0))
+
+    class FakeModel:
+        def transcribe(self, audio, **kwargs):
+            seg = SimpleNamespace(start=0.0, end=0.5, text="alo", avg_logprob=-0.1, no_speech_prob=0.0)
+            return iter([seg]), SimpleNamespace(language="tr", duration=len(audio) / analysis.SAMPLE_RATE)
+    monkeypatch.setattr(analysis.registry, "get", lambda *a, **k: FakeModel())
+
+    recording = _upload("metrics.wav", _wav_bytes(tone=555))
+    job = client.post(f"/recordings/{recording['id']}/transcribe").json()
+    depth = client.get("/metrics").text
+    assert 'voice_analyzer_queue_depth{kind="transcribe",status="QUEUED"}' in depth
+
+    with caplog.at_level(logging.DEBUG, logger="telemetry"):
+        jobs.run_pending_jobs()
+    assert client.get(f"/jobs/{job['id']}").json()["status"] == "SUCCEEDED"
+
+    spans = [r.getMessage() for r in caplog.records if r.name == "telemetry"]
+    stages = {m.split()[1].split("=")[1] for m in spans}
+    assert {"decode", "resample", "vad", "inference", "transcribe", "db_commit"} <= stages
+    assert all(f"recording_id={recording['id']}" in m for m in spans)
+    assert any("audio_duration=0.5" in m for m in spans)
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    for line in ('voice_analyzer_stage_seconds_count{model="large-v3",stage="inference"}',
+                 'voice_analyzer_transcript_cache_lookups_total{result="miss"}',
+                 'voice_analyzer_realtime_factor_count{model="large-v3"}',
+                 'voice_analyzer_queue_wait_seconds_count{kind="transcribe"}'):
+        assert line in response.text
+    assert 'kind="transcribe",status="QUEUED"' not in response.text
+    _remove_upload(recording)
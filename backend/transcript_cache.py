@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", "cache/transcripts.db")
+# Upper bound for the compressed entries; least recently used entries are evicted beyond it (0 disables the cache)
+CACHE_MAX_MB = float(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "512"))
+CHECKPOINT_PATH = os.getenv("TRANSCRIPT_CHECKPOINT_PATH", "cache/checkpoints.db")
+# Checkpoints of transcriptions that never finished are dropped after this many hours
+CHECKPOINT_MAX_AGE_HOURS = float(os.getenv("TRANSCRIPT_CHECKPOINT_MAX_AGE_HOURS", "72"))
+
+_hash_memo = {}
+_hash_lock = threading.Lock()
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024):
+    """
+    SHA-256 of the file contents, read in chunks.
+    Memoized per (path, size, mtime) so repeated requests for the same upload do not rehash it.
+    """
+    st = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+
+    with _hash_lock:
+        _hash_memo[memo_key] = value
+    return value
+
+
+def cache_key(audio_hash: str, params: dict):
+    """Cache key for an audio hash plus every decode parameter that can change the transcript."""
+    encoded = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{audio_hash}:{encoded}".encode()).hexdigest()
+
+
+class TranscriptCache:
+    """
+    Content-addressed store for transcribe_audio results.
+    Entries are zlib-compressed JSON rows in a small SQLite file, which keeps the store
+    compact and safe to share between the API and worker processes.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_mb: float = CACHE_MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._initialized = False
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _connect(self):
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0)")
+            self._initialized = True
+        return conn
+
+    def _count(self, conn, name):
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (name,))
+
+    def get(self, key: str):
+        """Returns the cached result or None, counting the lookup as a hit or miss."""
+        if not self.enabled:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(conn, "misses")
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._count(conn, "hits")
+            return json.loads(zlib.decompress(row[0]))
+        finally:
+            conn.close()
+
+    def put(self, key: str, value: dict):
+        if not self.enabled:
+            return
+        data = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, data, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._evict(conn)
+        finally:
+            conn.close()
+
+    def _evict(self, conn):
+        # Keep the most recently used entries whose running total fits the budget
+        conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            " SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS running FROM entries)"
+            " WHERE running > ?)",
+            (self.max_bytes,)
+        )
+
+    def stats(self):
+        if not self.enabled:
+            return {"enabled": False}
+        conn = self._connect()
+        try:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        finally:
+            conn.close()
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "enabled": True,
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "hit_rate": round(counters["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self):
+        if not self.enabled:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM entries")
+            conn.execute("UPDATE counters SET value = 0")
+        finally:
+            conn.close()
+
+
+class ChunkCheckpoints:
+    """
+    Finished chunks of long transcriptions, keyed by the transcription cache key and chunk index.
+    A transcription that fails or is interrupted resumes after its last finished chunk; the
+    checkpoints of a recording are cleared once its whole transcript is done.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_PATH, max_age_hours: float = CHECKPOINT_MAX_AGE_HOURS):
+        self.path = path
+        self.max_age_seconds = max_age_hours * 3600
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "key TEXT NOT NULL, chunk INTEGER NOT NULL, data BLOB NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (key, chunk))"
+            )
+            self._initialized = True
+        return conn
+
+    def get(self, key: str, index: int):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT data FROM chunks WHERE key = ? AND chunk = ?", (key, index)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def put(self, key: str, index: int, value: dict):
+        data = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO chunks (key, chunk, data, created_at) VALUES (?, ?, ?, ?)",
+                (key, index, data, now)
+            )
+            conn.execute("DELETE FROM chunks WHERE created_at < ?", (now - self.max_age_seconds,))
+        finally:
+            conn.close()
+
+    def count(self, key: str):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM chunks WHERE key = ?", (key,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def clear(self, key: str):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM chunks WHERE key = ?", (key,))
+        finally:
+            conn.close()
+
+
+transcript_cache = TranscriptCache()
+chunk_checkpoints = ChunkCheckpoints()
@@ -0,0 +1,281 @@
+import os
+import re
+import uuid
+import shutil
+import hashlib
+
+import av
+from starlette.concurrency import run_in_threadpool
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_DIR = "uploads"
+PARTIAL_DIR = os.path.join(UPLOAD_DIR, ".partial")
+# Incoming data is written to disk in blocks of this size
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "1024")) * 1024 * 1024)
+# The container header is probed once this much of the upload has arrived
+PROBE_BYTES = 256 * 1024
+# A resumable range claimed longer ago than this is treated as abandoned (the process writing it died)
+UPLOAD_RANGE_TIMEOUT_SECONDS = float(os.getenv("UPLOAD_RANGE_TIMEOUT_SECONDS", "600"))
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def audio_path(recording):
+    """Path of the recording's audio file (content-addressed, or the client filename for older uploads)."""
+    return os.path.join(UPLOAD_DIR, recording.stored_filename or recording.filename)
+
+
+def safe_filename(filename: str):
+    """Display name for an upload: the client filename without any directory part."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return name or "recording"
+
+
+def _extension(filename: str):
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,8}", ext) else ""
+
+
+def probe_audio(path: str):
+    """
+    Checks the container header with PyAV.
+    Returns True if an audio stream was found, False if the container has none,
+    and None if it could not be parsed (not audio, or the header is not complete yet).
+    """
+    try:
+        with av.open(path) as container:
+            return len(container.streams.audio) > 0
+    except Exception:
+        return None
+
+
+class StreamingUpload:
+    """
+    Writes an incoming upload straight to its final directory in CHUNK_SIZE blocks,
+    hashing it on the fly, enforcing the size limit and probing the header early.
+    finish() renames the file to its SHA-256 so identical uploads share one file
+    and different uploads with the same client filename never overwrite each other.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = None, partial_path: str = None, hasher=None, size: int = 0):
+        os.makedirs(PARTIAL_DIR, exist_ok=True)
+        self.filename = safe_filename(filename)
+        self.max_bytes = max_bytes or MAX_UPLOAD_BYTES
+        self.partial_path = partial_path or os.path.join(PARTIAL_DIR, uuid.uuid4().hex)
+        self.size = size
+        self.hasher = hasher or hashlib.sha256()
+        self.is_audio = None if size < PROBE_BYTES else self._probe()
+        self._file = open(self.partial_path, "ab", buffering=CHUNK_SIZE)
+
+    def _probe(self):
+        result = probe_audio(self.partial_path)
+        if result is False:
+            raise UploadError(415, "File does not contain an audio stream")
+        # None: the header may sit at the end of the file (e.g. MP4), decided again in finish()
+        return result
+
+    def write(self, data: bytes):
+        if self.size + len(data) > self.max_bytes:
+            self.abort()
+            raise UploadError(413, f"File exceeds the {self.max_bytes // (1024 * 1024)} MB upload limit")
+        self._file.write(data)
+        self.hasher.update(data)
+        previous = self.size
+        self.size += len(data)
+
+        if previous < PROBE_BYTES <= self.size:
+            self._file.flush()
+            try:
+                self.is_audio = self._probe()
+            except UploadError:
+                self.abort()
+                raise
+
+    def finish(self):
+        """Completes the upload. Returns (stored_filename, sha256, size)."""
+        self._file.close()
+        if self.size == 0:
+            self.abort()
+            raise UploadError(400, "Empty upload")
+        if not self.is_audio and not probe_audio(self.partial_path):
+            self.abort()
+            raise UploadError(415, "File is not a supported audio format")
+
+        self.file_hash = self.hasher.hexdigest()
+        self.stored_filename = f"{self.file_hash}{_extension(self.filename)}"
+        os.replace(self.partial_path, os.path.join(UPLOAD_DIR, self.stored_filename))
+        return self.stored_filename, self.file_hash, self.size
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+def import_file(path: str, file_hash: str):
+    """
+    Places an existing audio file into UPLOAD_DIR under its content address, as a hard link
+    when source and uploads share a filesystem and as a copy otherwise.
+    Returns the stored filename.
+    """
+    stored_filename = f"{file_hash}{_extension(path)}"
+    target = os.path.join(UPLOAD_DIR, stored_filename)
+    if os.path.exists(target):
+        return stored_filename
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    partial = os.path.join(PARTIAL_DIR, uuid.uuid4().hex)
+    try:
+        os.link(path, partial)
+    except OSError:
+        shutil.copyfile(path, partial)
+    os.replace(partial, target)
+    return stored_filename
+
+
+async def receive_multipart_upload(request, field_name: str = "file"):
+    """
+    Streams the file part of a multipart/form-data request into a StreamingUpload
+    without spooling it to a temporary file first.
+    Returns the finished StreamingUpload (filename, stored_filename, file_hash, size).
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError(400, "Expected a multipart/form-data upload")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + CHUNK_SIZE:
+        raise UploadError(413, f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit")
+
+    state = {"headers": {}, "field": b"", "value": b"", "in_file": False, "filename": None, "done": False}
+    data = bytearray()
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(buf, start, end):
+        state["field"] += buf[start:end]
+
+    def on_header_value(buf, start, end):
+        state["value"] += buf[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].lower()] = state["value"]
+        state["field"], state["value"] = b"", b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        is_file = options.get(b"name") == field_name.encode() and b"filename" in options
+        state["in_file"] = is_file and state["filename"] is None
+        if state["in_file"]:
+            state["filename"] = options[b"filename"].decode("utf-8", "replace")
+
+    def on_part_data(buf, start, end):
+        if state["in_file"]:
+            data.extend(buf[start:end])
+
+    def on_part_end():
+        if state["in_file"]:
+            state["in_file"] = False
+            state["done"] = True
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    upload = None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if state["filename"] is not None and upload is None:
+                upload = StreamingUpload(state["filename"])
+            if upload is not None and (len(data) >= CHUNK_SIZE or (state["done"] and data)):
+                await run_in_threadpool(upload.write, bytes(data))
+                data.clear()
+        parser.finalize()
+        if upload is not None and data:
+            await run_in_threadpool(upload.write, bytes(data))
+            data.clear()
+    except BaseException as e:
+        # Cancellation (client gone, shutdown) included: no partial file is left behind
+        if upload is not None:
+            upload.abort()
+        if isinstance(e, UploadError) or not isinstance(e, Exception):
+            raise
+        raise UploadError(400, f"Malformed upload: {e}")
+
+    if upload is None or not state["done"]:
+        if upload is not None:
+            upload.abort()
+        raise UploadError(400, f"Missing '{field_name}' file field")
+    await run_in_threadpool(upload.finish)
+    return upload
+
+
+# In-process hash state of resumable uploads, so appended ranges do not rehash the whole file.
+# After a restart the hash is rebuilt from the partial file on the next range.
+_resumable_hashers = {}
+
+
+def partial_path_for(upload_id: str):
+    return os.path.join(PARTIAL_DIR, upload_id)
+
+
+def open_resumable(session):
+    """Reopens a resumable upload session (models.UploadSession) for appending at its current offset."""
+    path = partial_path_for(session.id)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size != session.received_size:
+        # Keep the file consistent with the committed offset (e.g. after a crash mid-write)
+        with open(path, "ab") as f:
+            f.truncate(session.received_size)
+        size = session.received_size
+
+    cached = _resumable_hashers.pop(session.id, None)
+    if cached is not None and cached[0] == size:
+        hasher = cached[1]
+    else:
+        hasher = hashlib.sha256()
+        if size > 0:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    hasher.update(block)
+    return StreamingUpload(session.filename, max_bytes=session.total_size, partial_path=path, hasher=hasher, size=size)
+
+
+def suspend_resumable(session_id: str, upload: StreamingUpload):
+    """Closes the partial file between ranges and keeps the running hash for the next one."""
+    upload._file.close()
+    _resumable_hashers[session_id] = (upload.size, upload.hasher)
+
+
+def reset_resumable(session_id: str, upload: StreamingUpload, offset: int):
+    """
+    Drops a failed range: the partial file is cut back to offset, the committed size,
+    so the retry appends to exactly what was acknowledged. The hash is rebuilt then
+    (see open_resumable).
+    """
+    if not upload._file.closed:
+        upload._file.close()
+    _resumable_hashers.pop(session_id, None)
+    if os.path.exists(upload.partial_path):
+        with open(upload.partial_path, "ab") as f:
+            f.truncate(offset)
+
+
+def discard_resumable(session_id: str):
+    _resumable_hashers.pop(session_id, None)
+    path = partial_path_for(session_id)
+    if os.path.exists(path):
+        os.remove(path)
@@ -4,9 +4,11 @@ import { Calendar, Clock, Activity, ChevronRight, Search, Filter } from 'lucide-
 import axios from 'axios';
 import clsx from 'clsx';
 import TruncatedText from './ui/TruncatedText';
+import { waitForJob } from '../jobs';
 
 const Dashboard = () => {
     const [recordings, setRecordings] = useState([]);
+    const [stats, setStats] = useState(null);
     const [loading, setLoading] = useState(true);
     const [searchTerm, setSearchTerm] = useState('');
     const [filterSentiment, setFilterSentiment] = useState('all');
@@ -17,8 +19,13 @@ const Dashboard = () => {
 
     const fetchRecordings = async () => {
         try {
-            const response = await axios.get('http://localhost:8080/recordings');
+            // Totals come precomputed from /stats; the list itself omits transcripts
+            const [response, statsResponse] = await Promise.all([
+                axios.get('http://localhost:8080/recordings'),
+                axios.get('http://localhost:8080/stats')
+            ]);
             setRecordings(response.data);
+            setStats(statsResponse.data);
         } catch (error) {
             console.error('Error fetching recordings:', error);
         } finally {
@@ -29,7 +36,8 @@ const Dashboard = () => {
     const handleTranscribe = async (id) => {
         try {
             setLoading(true);
-            await axios.post(`http://localhost:8080/recordings/${id}/transcribe`);
+            const response = await axios.post(`http://localhost:8080/recordings/${id}/transcribe`);
+            await waitForJob(response.data);
             fetchRecordings();
         } catch (error) {
             console.error('Error transcribing:', error);
@@ -42,7 +50,8 @@ const Dashboard = () => {
     const handleAnalyze = async (id) => {
         try {
             setLoading(true);
-            await axios.post(`http://localhost:8080/recordings/${id}/analyze`);
+            const response = await axios.post(`http://localhost:8080/recordings/${id}/analyze`);
+            await waitForJob(response.data);
             fetchRecordings();
         } catch (error) {
             console.error('Error analyzing:', error);
@@ -128,6 +137,22 @@ const Dashboard = () => {
                 </div>
             </div>
 
+            {stats && (
+                <div style={{ display: 'grid', gridTemplateColumns: 'repeat(4, 1fr)', gap: '1rem', marginBottom: '1.5rem' }}>
+                    {[
+                        ['Total Calls', stats.total_calls],
+                        ['Audio Hours', stats.audio_hours.toFixed(1)],
+                        ['Avg. Sentiment', stats.sentiment.average !== null ? `${Math.round(stats.sentiment.average * 100)}%` : '-'],
+                        ['Agent Talk Ratio', stats.talk.agent_ratio !== null ? `${Math.round(stats.talk.agent_ratio * 100)}%` : '-']
+                    ].map(([label, value]) => (
+                        <div key={label} className="card">
+                            <div style={{ color: 'var(--text-muted)', fontSize: '0.85rem' }}>{label}</div>
+                            <div style={{ fontSize: '1.5rem', fontWeight: 600 }}>{value}</div>
+                        </div>
+                    ))}
+                </div>
+            )}
+
             {loading ? (
                 <div style={{ textAlign: 'center', padding: '3rem', color: 'var(--text-muted)' }}>
                     Loading recordings...
@@ -4,6 +4,7 @@ import { ArrowLeft, Clock, Activity, Play, Pause, FileText, BrainCircuit, Loader
 import axios from 'axios';
 import clsx from 'clsx';
 import TruncatedText from './ui/TruncatedText';
+import { waitForJob } from '../jobs';
 
 const Report = () => {
     const { id } = useParams();
@@ -11,6 +12,10 @@ const Report = () => {
     const [loading, setLoading] = useState(true);
     const [processing, setProcessing] = useState(false);
     const [error, setError] = useState(null);
+    // Segments streamed while Whisper is still decoding
+    const [liveSegments, setLiveSegments] = useState([]);
+    const [liveProgress, setLiveProgress] = useState(0);
+    const eventSourceRef = useRef(null);
 
     // Audio Player State
     const [isPlaying, setIsPlaying] = useState(false);
@@ -23,6 +28,9 @@ const Report = () => {
         fetchRecording();
     }, [id]);
 
+    // Leaving the page closes the stream, which stops the decode on the server
+    useEffect(() => () => eventSourceRef.current?.close(), []);
+
     const fetchRecording = async () => {
         try {
             const response = await axios.get(`http://localhost:8080/recordings/${id}`);
@@ -35,23 +43,41 @@ const Report = () => {
         }
     };
 
-    const handleTranscribe = async () => {
+    const handleTranscribe = () => {
         setProcessing(true);
-        try {
-            await axios.post(`http://localhost:8080/recordings/${id}/transcribe`);
+        setLiveSegments([]);
+        setLiveProgress(0);
+        const source = new EventSource(`http://localhost:8080/recordings/${id}/transcribe/stream`);
+        eventSourceRef.current = source;
+
+        const finish = () => {
+            source.close();
+            eventSourceRef.current = null;
+            setProcessing(false);
+        };
+        source.addEventListener('segment', (e) => {
+            const segment = JSON.parse(e.data);
+            setLiveProgress(segment.progress);
+            setLiveSegments((current) => [...current, segment]);
+        });
+        source.addEventListener('done', () => {
+            finish();
+            setLiveSegments([]);
             fetchRecording();
-        } catch (error) {
-            console.error('Transcription failed:', error);
+        });
+        source.addEventListener('error', (e) => {
+            // Server-sent 'error' events carry data; connection errors do not
+            console.error('Transcription failed:', e.data || e);
+            finish();
             setError('Transcription failed.');
-        } finally {
-            setProcessing(false);
-        }
+        });
     };
 
     const handleAnalyze = async () => {
         setProcessing(true);
         try {
-            await axios.post(`http://localhost:8080/recordings/${id}/analyze`);
+            const response = await axios.post(`http://localhost:8080/recordings/${id}/analyze`);
+            await waitForJob(response.data);
             fetchRecording();
         } catch (error) {
             console.error('Analysis failed:', error);
@@ -167,6 +193,11 @@ const Report = () => {
                                 {formatTime(recording.duration)}
                             </div>
                         )}
+                        {recording.skipped_seconds > 0 && (
+                            <div style={{ color: 'var(--text-muted)' }} title="Silence, noise and hold music not sent to Whisper">
+                                {formatTime(recording.skipped_seconds)} skipped
+                            </div>
+                        )}
                         {recording.status === 'COMPLETED' && (
                             <div style={{ display: 'flex', alignItems: 'center', gap: '0.5rem' }}>
                                 <Activity size={18} color="var(--text-muted)" />
@@ -212,7 +243,7 @@ const Report = () => {
 
                         <audio
                             ref={audioRef}
-                            src={`http://localhost:8080/uploads/${recording.filename}`}
+                            src={`http://localhost:8080/recordings/${recording.id}/audio`}
                             onTimeUpdate={handleTimeUpdate}
                             onLoadedMetadata={handleLoadedMetadata}
                             onEnded={() => setIsPlaying(false)}
@@ -225,7 +256,7 @@ const Report = () => {
                                 <p style={{ color: 'var(--text-muted)' }}>Ready to transcribe</p>
                                 <button className="btn btn-primary" onClick={handleTranscribe} disabled={processing}>
                                     {processing ? <Loader2 className="animate-spin" /> : <FileText size={18} />}
-                                    Transcribe Audio
+                                    {processing ? `Transcribing ${Math.round(liveProgress * 100)}%` : 'Transcribe Audio'}
                                 </button>
                             </>
                         )}
@@ -242,6 +273,25 @@ const Report = () => {
                 )}
             </div>
 
+            {/* Live transcript while the stream is open */}
+            {processing && liveSegments.length > 0 && (
+                <div className="transcript-list" style={{ marginTop: '2rem' }}>
+                    {liveSegments.map((segment, index) => (
+                        <div key={index} className="transcript-item">
+                            <div className="transcript-header">
+                                <div className={clsx("speaker-badge", segment.speaker === "Agent" ? "speaker-agent" : "speaker-customer")}>
+                                    <span>{segment.speaker}</span>
+                                    <span style={{ fontSize: '0.85rem', color: 'var(--text-muted)', fontWeight: 400, marginLeft: '0.5rem' }}>
+                                        {formatTime(segment.start)} - {formatTime(segment.end)}
+                                    </span>
+                                </div>
+                            </div>
+                            <p className="transcript-text">{segment.text}</p>
+                        </div>
+                    ))}
+                </div>
+            )}
+
             {/* Transcript Section */}
             {(recording.status === 'TRANSCRIBED' || recording.status === 'COMPLETED') && (
                 <>
@@ -4,6 +4,10 @@ import { Upload as UploadIcon, FileAudio, AlertCircle, Loader2 } from 'lucide-re
 import axios from 'axios';
 import clsx from 'clsx';
 
+const RESUMABLE_THRESHOLD = 32 * 1024 * 1024;
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const MAX_RETRIES = 5;
+
 const Upload = () => {
     const [isDragging, setIsDragging] = useState(false);
     const [file, setFile] = useState(null);
@@ -43,25 +47,62 @@ const Upload = () => {
         setError(null);
     };
 
+    // Large recordings are sent in ranges through a resumable upload session,
+    // so a dropped connection only repeats the current chunk.
+    const uploadResumable = async (file) => {
+        const session = await axios.post('http://localhost:8080/upload/sessions', {
+            filename: file.name,
+            total_size: file.size,
+        });
+        let offset = session.data.received_size;
+        let retries = 0;
+        while (true) {
+            const end = Math.min(offset + CHUNK_SIZE, file.size);
+            try {
+                const response = await axios.put(
+                    `http://localhost:8080/upload/sessions/${session.data.id}`,
+                    file.slice(offset, end),
+                    { headers: { 'Content-Type': 'application/octet-stream', 'Content-Range': `bytes ${offset}-${end - 1}/${file.size}` } }
+                );
+                if (response.data.recording) return response.data.recording;
+                offset = end;
+                retries = 0;
+            } catch (err) {
+                const status = err.response?.status;
+                if (status === 413 || status === 415 || retries >= MAX_RETRIES) throw err;
+                retries += 1;
+                // Ask the server where to continue from
+                const current = await axios.get(`http://localhost:8080/upload/sessions/${session.data.id}`);
+                offset = current.data.received_size;
+            }
+        }
+    };
+
     const handleUpload = async () => {
         if (!file) return;
 
         setUploading(true);
         setError(null);
 
-        const formData = new FormData();
-        formData.append('file', file);
-
         try {
-            const response = await axios.post('http://localhost:8080/upload', formData, {
-                headers: {
-                    'Content-Type': 'multipart/form-data',
-                },
-            });
-            navigate(`/report/${response.data.id}`);
+            let recording;
+            if (file.size > RESUMABLE_THRESHOLD) {
+                recording = await uploadResumable(file);
+            } else {
+                const formData = new FormData();
+                formData.append('file', file);
+                const response = await axios.post('http://localhost:8080/upload', formData, {
+                    headers: {
+                        'Content-Type': 'multipart/form-data',
+                    },
+                });
+                recording = response.data;
+            }
+            navigate(`/report/${recording.id}`);
         } catch (err) {
             console.error(err);
-            setError('Upload failed. Please check the backend connection.');
+            const detail = err.response?.data?.detail;
+            setError(typeof detail === 'string' ? detail : 'Upload failed. Please check the backend connection.');
             setUploading(false);
         }
     };
@@ -0,0 +1,19 @@
+import axios from 'axios';
+
+const API_URL = 'http://localhost:8080';
+
+// Transcription and analysis run in background workers: the POST returns a job
+// right away and we poll it until it reaches a final state.
+export const waitForJob = async (job, { interval = 1500, onProgress } = {}) => {
+    let current = job;
+    while (current.status === 'QUEUED' || current.status === 'RUNNING') {
+        await new Promise((resolve) => setTimeout(resolve, interval));
+        const response = await axios.get(`${API_URL}/jobs/${current.id}`);
+        current = response.data;
+        if (onProgress) onProgress(current.progress);
+    }
+    if (current.status !== 'SUCCEEDED') {
+        throw new Error(current.error || 'Job failed');
+    }
+    return current;
+};